@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
+
+    def ready(self):
+        from . import cache, stats  # noqa: F401 (connects the signal receivers)
+        from . import tasks  # noqa: F401 (registers the background tasks)
+        from .search import install_search_index
+
+        post_migrate.connect(install_search_index, sender=self)
@@ -0,0 +1,184 @@
+# async_views.py
+"""
+Native async versions of the catalog and cart read endpoints.
+
+They return the same JSON as ProductListAPIView, ProductDetailAPIView,
+CategoryListAPIView and CartAPIView, share their catalog cache entries and
+validators, and read through Django's async ORM, so under an ASGI server a
+worker keeps serving other requests while one waits on the database.
+``inventory/urls.py`` routes to them when ``settings.ASYNC_READ_VIEWS`` is
+set, which ``inventory_system/asgi.py`` does by default.
+
+Unlike the DRF views they only speak JSON (no browsable API). The cart
+authenticates the request through ``DEFAULT_AUTHENTICATION_CLASSES`` like
+the DRF views do, so session and HTTP Basic clients both keep working.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import cache
+from .conditional import last_modified, make_etag, set_validators
+from .models import Cart, Category, Product
+from .pagination import KeysetPagination
+from .search import search_products
+from .serializers import (
+    CartSerializer, CategorySerializer, ProductListSerializer, ProductSerializer
+)
+from .views import CartAPIView, ProductListAPIView
+
+MEDIA_TYPE = 'application/json'
+
+
+def json_response(data, status=200):
+    # Rendered like DRF's JSONRenderer: compact and UTF-8
+    return JsonResponse(
+        data,
+        status=status,
+        safe=False,
+        encoder=JSONEncoder,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+def authenticate(request):
+    """
+    The user DRF would authenticate ``request`` as, or the error response
+    the DRF views would answer with; runs the authenticators synchronously
+    """
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    drf_request = Request(request, authenticators=authenticators)
+    try:
+        user = drf_request.user
+    except AuthenticationFailed as exc:
+        detail = exc.detail
+    else:
+        if user.is_authenticated:
+            return user, None
+        detail = 'Authentication credentials were not provided.'
+
+    # As in APIView.permission_denied: 401 when the first authenticator
+    # can challenge the client, 403 otherwise
+    header = authenticators[0].authenticate_header(drf_request) if authenticators else None
+    response = json_response({'detail': detail}, status=401 if header else 403)
+    if header:
+        response['WWW-Authenticate'] = header
+    return None, response
+
+
+def not_found():
+    return json_response({'detail': 'No Product matches the given query.'}, status=404)
+
+
+async def conditional(request, state, render):
+    """
+    Answer 304 when the client holds ``state`` already, otherwise await
+    ``render()``; either way with the validators of ``state``
+    """
+    etag, modified = make_etag(state, request, MEDIA_TYPE), last_modified(state)
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None:
+        response = await render()
+    return set_validators(response, etag, modified)
+
+
+async def catalog(request, render):
+    """Serve a catalog read from the cache, validated by the catalog version"""
+    version = await sync_to_async(cache.current_version)()
+
+    async def cached():
+        key, data = await sync_to_async(cache.lookup)(request)
+        if data is not None:
+            return json_response(data)
+        response, data = await render()
+        if response.status_code == 200:
+            await sync_to_async(cache.store)(key, data)
+        return response
+
+    return await conditional(request, {'catalog': version}, cached)
+
+
+class ProductListView:
+    """Stands in for the DRF view the paginator reads its ordering from"""
+    keyset_ordering = ProductListAPIView.keyset_ordering
+    get_keyset_ordering = ProductListAPIView.get_keyset_ordering
+
+    def __init__(self, request):
+        self.request = request
+
+
+@require_safe
+async def product_list(request):
+    async def render():
+        params = request.GET
+        queryset = ProductListSerializer.setup_eager_loading(
+            Product.objects.filter(is_active=True)
+        )
+        if params.get('search'):
+            # Picking the search backend may query the database once
+            queryset = await sync_to_async(search_products)(queryset, params['search'])
+        if params.get('category'):
+            queryset = queryset.filter(category_id=params['category'])
+
+        paginator = KeysetPagination()
+        drf_request = Request(request)
+        try:
+            rows = await paginator.apaginate_queryset(
+                queryset, drf_request, ProductListView(drf_request)
+            )
+        except NotFound as exc:
+            return json_response({'detail': exc.detail}, status=404), None
+        data = paginator.get_paginated_data(ProductListSerializer(rows, many=True).data)
+        return json_response(data), data
+
+    return await catalog(request, render)
+
+
+@require_safe
+async def product_detail(request, pk):
+    async def render():
+        queryset = ProductSerializer.setup_eager_loading(Product.objects.filter(is_active=True))
+        try:
+            product = await queryset.aget(pk=pk)
+        except Product.DoesNotExist:
+            return not_found(), None
+        data = ProductSerializer(product).data
+        return json_response(data), data
+
+    return await catalog(request, render)
+
+
+@require_safe
+async def category_list(request):
+    async def render():
+        categories = [category async for category in Category.objects.all()]
+        data = CategorySerializer(categories, many=True).data
+        return json_response(data), data
+
+    return await catalog(request, render)
+
+
+@require_safe
+async def cart_detail(request):
+    user, denied = await sync_to_async(authenticate)(request)
+    if denied is not None:
+        return denied
+
+    async def render():
+        # Totals are aggregated in SQL and the items arrive with their
+        # products, categories and inventories in a single prefetch
+        queryset = CartSerializer.setup_eager_loading(Cart.objects.with_totals())
+        cart, created = await queryset.aget_or_create(user=user)
+        if created:
+            # A cart just created carries neither the totals nor the prefetched
+            # items, and the serializer may not query for them from here
+            cart = await queryset.aget(pk=cart.pk)
+        return json_response(CartSerializer(cart).data)
+
+    state = await Cart.objects.filter(user=user).aaggregate(**CartAPIView.conditional_aggregates)
+    return await conditional(request, state, render)
@@ -0,0 +1,128 @@
+# cache.py
+"""
+Read-through cache for the public catalog endpoints.
+
+Responses are stored under keys that embed a catalog-wide version number
+plus the request path and sorted query string. Any write to a product,
+category, supplier, supplier price or stock level bumps the version once
+the transaction commits, so stale entries are simply never read again and
+expire on their own.
+
+The cache alias comes from ``settings.CATALOG_CACHE_ALIAS``: the default
+local-memory cache serves a single process, while pointing the alias at a
+shared backend (Redis, Memcached) shares entries, the version number and
+the hit/miss counters between all workers.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from rest_framework.response import Response
+
+from .models import Category, Inventory, Product, ProductSupplier, Supplier
+from .signals import stock_changed
+
+VERSION_KEY = 'catalog:version'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def current_version():
+    """Return the catalog version, starting a fresh one if it was evicted"""
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a lost version never revives old entries
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        current_version()
+
+
+def invalidate_catalog(**kwargs):
+    """Signal receiver invalidating every cached catalog response on commit"""
+    transaction.on_commit(bump_version)
+
+
+for model in (Category, Supplier, Product, ProductSupplier, Inventory):
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog-save-{model.__name__}')
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog-delete-{model.__name__}')
+stock_changed.connect(invalidate_catalog, dispatch_uid='catalog-stock-changed')
+
+
+def _count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats():
+    """Hit/miss counters of the catalog cache"""
+    cache = get_cache()
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'version': cache.get(VERSION_KEY),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def cache_key(request, version):
+    query = sorted(
+        (key, value) for key, values in request.GET.lists() for value in values
+    )
+    # The absolute URL keeps pagination links right for every host name
+    url = request.build_absolute_uri(request.path)
+    digest = hashlib.sha1(repr((url, query)).encode()).hexdigest()
+    return f'catalog:{version}:{digest}'
+
+
+def lookup(request):
+    """Return the cache key of a catalog request and its cached data, if any"""
+    key = cache_key(request, current_version())
+    data = get_cache().get(key)
+    _count(MISSES_KEY if data is None else HITS_KEY)
+    return key, data
+
+
+def store(key, data):
+    get_cache().set(key, data, get_timeout())
+
+
+class CatalogCacheMixin:
+    """Serve successful GET responses of a catalog view from the cache"""
+
+    def get(self, request, *args, **kwargs):
+        key, data = lookup(request)
+        if data is not None:
+            return Response(data)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            store(key, response.data)
+        return response
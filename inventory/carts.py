@@ -0,0 +1,122 @@
+# carts.py
+"""
+Cart changes applied as one batch.
+
+A batch is a list of operations run in order against the cart:
+
+* ``add``: put ``quantity`` more of a product in the cart;
+* ``set``: make the cart hold exactly ``quantity`` (0 removes the line);
+* ``remove``: take the product out of the cart.
+
+The operations are first folded into the final quantity of each product,
+starting from what the cart holds, so repeated products cost nothing
+extra. One query then reads every product with its stock and cart line,
+and the whole batch is rejected if any product is inactive or short of
+stock. Otherwise the lines are written with one upsert and one DELETE.
+
+Call ``apply_batch`` inside ``transaction.atomic``.
+"""
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import metrics, upserts
+from .models import CartItem, Product
+
+OP_ADD = 'add'
+OP_SET = 'set'
+OP_REMOVE = 'remove'
+OPERATIONS = (OP_ADD, OP_SET, OP_REMOVE)
+
+# Operations accepted in one batch
+MAX_OPERATIONS = 500
+
+
+class CartBatchError(Exception):
+    """Raised with the per-operation errors of a batch that was not applied"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f'{len(errors)} cart operations failed')
+
+
+def _products(cart, product_ids):
+    """``{product_id: (is_active, available, in_cart)}`` in one query"""
+    line = CartItem.objects.filter(cart=cart, product_id=OuterRef('pk')).values('quantity')[:1]
+    rows = Product.objects.filter(pk__in=product_ids).values_list(
+        'pk',
+        'is_active',
+        # Products without an inventory row have nothing available
+        Coalesce(
+            F('inventory__quantity') - F('inventory__reserved_quantity'), 0,
+            output_field=IntegerField(),
+        ),
+        Coalesce(Subquery(line), 0, output_field=IntegerField()),
+    )
+    return {product_id: rest for product_id, *rest in rows}
+
+
+def apply_batch(cart, operations):
+    """
+    Apply ``operations``, dicts of ``op``, ``product_id`` and ``quantity``,
+    to ``cart``. Raises CartBatchError and writes nothing if any fails.
+    """
+    products = _products(cart, {operation['product_id'] for operation in operations})
+
+    quantities = {}
+    last_index = {}
+    for index, operation in enumerate(operations):
+        product_id = operation['product_id']
+        quantity = quantities.get(product_id, products.get(product_id, (None, 0, 0))[2])
+        if operation['op'] == OP_ADD:
+            quantity += operation['quantity']
+        elif operation['op'] == OP_SET:
+            quantity = operation['quantity']
+        else:
+            quantity = 0
+        quantities[product_id] = quantity
+        last_index[product_id] = index
+
+    errors = []
+    for product_id, quantity in quantities.items():
+        if not quantity:
+            continue
+        error = None
+        if product_id not in products or not products[product_id][0]:
+            error = 'Product does not exist or is inactive.'
+        elif products[product_id][1] < quantity:
+            error = f'Only {max(products[product_id][1], 0)} items available in stock.'
+        if error:
+            errors.append({'index': last_index[product_id], 'product_id': product_id, 'error': error})
+    if errors:
+        raise CartBatchError(sorted(errors, key=lambda error: error['index']))
+
+    in_cart = {product_id: values[2] for product_id, values in products.items()}
+    changed = [
+        CartItem(cart=cart, product_id=product_id, quantity=quantity)
+        for product_id, quantity in quantities.items()
+        if quantity and quantity != in_cart.get(product_id)
+    ]
+    removed = [
+        product_id for product_id, quantity in quantities.items()
+        if not quantity and in_cart.get(product_id)
+    ]
+    if changed:
+        CartItem.objects.bulk_create(
+            changed, **upserts.options(['cart', 'product'], ['quantity', 'updated_at'])
+        )
+        added = [
+            'merged' if in_cart.get(item.product_id) else 'created'
+            for item in changed
+            if item.quantity > in_cart.get(item.product_id, 0)
+        ]
+
+        def count_added():
+            for outcome in added:
+                metrics.CART_ITEMS_ADDED.inc(channel='api', outcome=outcome)
+
+        # Counted once the batch is committed, not when it may still roll back
+        transaction.on_commit(count_added)
+    if removed:
+        CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+    return {'updated': len(changed), 'removed': len(removed)}
@@ -0,0 +1,62 @@
+# conditional.py
+"""
+Conditional GET support (ETag / Last-Modified) for the API views.
+
+Validators are computed from a cheap aggregate over the rows behind a
+response (counts and ``updated_at`` maxima) or from a version counter,
+never from the serialized body, so an unchanged resource is answered with
+``304 Not Modified`` after a single small query.
+"""
+import hashlib
+from datetime import datetime
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(state, request, media_type):
+    """Strong validator for ``state`` as rendered for ``request``"""
+    query = sorted(
+        (key, value) for key, values in request.GET.lists() for value in values
+    )
+    raw = repr((sorted(state.items()), request.path, query, media_type))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def last_modified(state):
+    """The latest timestamp in ``state``, for Last-Modified"""
+    timestamps = [value for value in state.values() if isinstance(value, datetime)]
+    return max(timestamps).timestamp() if timestamps else None
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    # Aggregates over get_conditional_queryset() describing the resource state
+    conditional_aggregates = None
+
+    def get_conditional_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def get_conditional_state(self):
+        return self.get_conditional_queryset().aggregate(**self.conditional_aggregates)
+
+    def get_validators(self):
+        state = self.get_conditional_state()
+        return self.make_etag(state), last_modified(state)
+
+    def make_etag(self, state):
+        return make_etag(state, self.request, self.request.accepted_media_type)
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
@@ -0,0 +1,179 @@
+# exports.py
+"""
+Streaming CSV and JSONL exports of orders, the catalog and stock levels.
+
+Every export is one flat ``values_list`` query read with ``iterator()``,
+so rows arrive from the database in chunks of ``CHUNK_SIZE`` as plain
+tuples, without model instances or nested serializers, and are written
+out chunk by chunk. Memory use stays the same whatever the number of rows.
+
+* orders: one row per line item, repeating the order columns (orders
+  without items get one row with empty item columns);
+* products: one row per supplier price, with the stock columns; the
+  columns are those ``importer`` reads, so an export can be imported again;
+* stock: one row per inventory.
+
+``stream`` yields the encoded chunks; under ASGI use ``astream``, as
+Django reads a synchronous iterator into memory before sending it there.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Inventory, Order, Product
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Rows fetched per database round trip, and written per streamed chunk
+CHUNK_SIZE = 2000
+
+ORDER_COLUMNS = (
+    ('order_number', 'order_number'),
+    ('order_date', 'order_date'),
+    ('status', 'status'),
+    ('customer', 'user__username'),
+    ('email', 'user__email'),
+    ('subtotal', 'subtotal'),
+    ('shipping_cost', 'shipping_cost'),
+    ('tax_amount', 'tax_amount'),
+    ('total_amount', 'total_amount'),
+    ('sku', 'items__product__sku'),
+    ('product', 'items__product__name'),
+    ('quantity', 'items__quantity'),
+    ('unit_price', 'items__unit_price'),
+)
+
+PRODUCT_COLUMNS = (
+    ('sku', 'sku'),
+    ('name', 'name'),
+    ('category', 'category__name'),
+    ('price', 'price'),
+    ('description', 'description'),
+    ('is_active', 'is_active'),
+    ('quantity', 'inventory__quantity'),
+    ('reserved_quantity', 'inventory__reserved_quantity'),
+    ('reorder_level', 'inventory__reorder_level'),
+    ('supplier', 'productsupplier__supplier__email'),
+    ('supplier_price', 'productsupplier__supplier_price'),
+    ('is_primary', 'productsupplier__is_primary'),
+)
+
+STOCK_COLUMNS = (
+    ('sku', 'product__sku'),
+    ('product', 'product__name'),
+    ('quantity', 'quantity'),
+    ('reserved_quantity', 'reserved_quantity'),
+    ('available_quantity', 'available'),
+    ('incoming_quantity', 'incoming_quantity'),
+    ('reorder_level', 'reorder_level'),
+    ('updated_at', 'updated_at'),
+)
+
+
+def _day_range(queryset, field, start, end):
+    """Filter ``field`` on whole days from ``start`` to ``end``, inclusive"""
+    if start:
+        queryset = queryset.filter(**{
+            f'{field}__gte': timezone.make_aware(datetime.combine(start, time.min))
+        })
+    if end:
+        queryset = queryset.filter(**{
+            f'{field}__lt': timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        })
+    return queryset
+
+
+def _rows(queryset, columns):
+    return queryset.values_list(*(lookup for header, lookup in columns))
+
+
+def orders(start=None, end=None, status=None):
+    """Order line rows of the orders placed from ``start`` to ``end``"""
+    queryset = _day_range(Order.objects.all(), 'order_date', start, end)
+    if status:
+        queryset = queryset.filter(status=status)
+    return _rows(queryset.order_by('-order_date', '-id', 'items__id'), ORDER_COLUMNS)
+
+
+def products(start=None, end=None, is_active=None):
+    """Product rows, one per supplier price, of the products updated from ``start`` to ``end``"""
+    queryset = _day_range(Product.objects.all(), 'updated_at', start, end)
+    if is_active is not None:
+        queryset = queryset.filter(is_active=is_active)
+    return _rows(queryset.order_by('id', 'productsupplier__id'), PRODUCT_COLUMNS)
+
+
+def stock(start=None, end=None):
+    """Stock rows of the inventories updated from ``start`` to ``end``"""
+    queryset = _day_range(Inventory.objects.all(), 'updated_at', start, end)
+    queryset = queryset.annotate(available=F('quantity') - F('reserved_quantity'))
+    return _rows(queryset.order_by('product_id'), STOCK_COLUMNS)
+
+
+EXPORTS = {
+    'orders': (orders, ORDER_COLUMNS),
+    'products': (products, PRODUCT_COLUMNS),
+    'stock': (stock, STOCK_COLUMNS),
+}
+
+
+def _format_csv(headers, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    yield buffer.getvalue()
+    for chunk in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+
+
+def _format_jsonl(headers, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for chunk in rows:
+        yield ''.join(encoder.encode(dict(zip(headers, row))) + '\n' for row in chunk)
+
+
+FORMATTERS = {'csv': _format_csv, 'jsonl': _format_jsonl}
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream(name, fmt, chunk_size=CHUNK_SIZE, **filters):
+    """Yield export ``name`` as encoded ``fmt`` chunks"""
+    query, columns = EXPORTS[name]
+    headers = [header for header, lookup in columns]
+    rows = _chunks(query(**filters), chunk_size)
+    for text in FORMATTERS[fmt](headers, rows):
+        yield text.encode('utf-8')
+
+
+async def astream(name, fmt, chunk_size=CHUNK_SIZE, **filters):
+    """``stream`` for async servers, reading each chunk in a worker thread"""
+    chunks = stream(name, fmt, chunk_size, **filters)
+    read = sync_to_async(next)
+    while True:
+        chunk = await read(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
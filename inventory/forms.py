@@ -8,7 +8,6 @@ from django.db import transaction
 from django.urls import reverse_lazy
 from django.views.generic import DeleteView, DetailView
 from django.core.paginator import Paginator
-from django.db.models import Q
 
 from .forms import (
     ProductForm, SupplierForm, CategoryForm, UserUpdateForm, UserProfileForm,
@@ -17,6 +16,8 @@ from .forms import (
 from .models import (
     OrderItem, Product, Supplier, Category, Order, UserProfile, Cart, CartItem, Inventory
 )
+from . import metrics, stock, tasks
+from .search import search_products
 
 def homepage(request):
     """Homepage with featured products and categories"""
@@ -38,11 +39,7 @@ def product_list(request):
     products = Product.objects.filter(is_active=True).select_related('category', 'inventory')
     
     if query:
-        products = products.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(sku__icontains=query)
-        )
+        products = search_products(products, query)
     
     if category_id:
         products = products.filter(category_id=category_id)
@@ -301,10 +298,12 @@ def add_to_cart(request, product_id):
         if cart_item.quantity < product.inventory.available_quantity:
             cart_item.quantity += 1
             cart_item.save()
+            metrics.CART_ITEMS_ADDED.inc(channel='web', outcome='merged')
             messages.success(request, f'Added another "{product.name}" to cart.')
         else:
             messages.warning(request, f'Cannot add more "{product.name}". Only {product.inventory.available_quantity} available.')
     else:
+        metrics.CART_ITEMS_ADDED.inc(channel='web', outcome='created')
         messages.success(request, f'Added "{product.name}" to cart.')
     
     return redirect('cart')
@@ -378,26 +377,52 @@ def checkout(request):
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
+            cart_items = list(cart.items.select_related('product'))
+            
+            # Reserve inventory before writing anything
+            try:
+                stock.reserve((item.product_id, item.quantity) for item in cart_items)
+            except stock.InsufficientStock as exc:
+                metrics.record_checkout('web', metrics.CHECKOUT_INSUFFICIENT_STOCK)
+                for result in exc.results:
+                    if not result.ok:
+                        messages.error(
+                            request,
+                            f'Only {max(result.available, 0)} of "{result.sku or result.product_id}" available.'
+                        )
+                return redirect('cart')
+            except stock.StockConflict as exc:
+                transaction.set_rollback(True)
+                metrics.record_checkout('web', metrics.CHECKOUT_CONFLICT)
+                messages.error(request, str(exc))
+                return redirect('cart')
+            
             # Create order
+            subtotal = sum(item.quantity * item.product.price for item in cart_items)
             order = form.save(commit=False)
             order.user = request.user
-            order.subtotal = cart.total_price
-            order.total_amount = cart.total_price  # Add shipping/tax calculation as needed
+            order.subtotal = subtotal
+            order.total_amount = subtotal  # Add shipping/tax calculation as needed
             order.save()
             
             # Create order items
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
+            OrderItem.objects.bulk_create([
+                OrderItem(
                     order=order,
                     product=cart_item.product,
                     quantity=cart_item.quantity,
                     unit_price=cart_item.product.price
                 )
-                
-                # Reserve inventory
-                inventory = cart_item.product.inventory
-                inventory.reserved_quantity += cart_item.quantity
-                inventory.save()
+                for cart_item in cart_items
+            ])
+            
+            # Rollups, confirmation email and stock alerts run after the response
+            tasks.after_checkout(order, [item.product_id for item in cart_items])
+            # Counted once the order is committed, not when the commit may still fail
+            placed = len(cart_items)
+            transaction.on_commit(
+                lambda: metrics.record_checkout('web', metrics.CHECKOUT_PLACED, placed)
+            )
             
             # Clear cart
             cart.items.all().delete()
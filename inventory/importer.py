@@ -0,0 +1,392 @@
+# importer.py
+"""
+Bulk catalog import from CSV or JSONL supplier feeds.
+
+Each row is keyed on ``sku`` and may carry any of these columns:
+
+* product: ``name``, ``category`` (by name, created when missing),
+  ``price``, ``description``, ``is_active``;
+* supplier price: ``supplier`` (by email, or the import's default
+  supplier), ``supplier_price``, ``is_primary``;
+* stock: ``quantity``, ``reorder_level``.
+
+Rows are read one at a time and upserted in batches: one
+``bulk_create(update_conflicts=True)`` per table and batch, with the
+current values of the batch's products read first so that missing columns
+keep what is stored. New products need a name, category and price.
+Category and supplier ids come from in-memory maps, so memory use depends
+on the batch size only, never on the file size.
+
+A row that fails validation is reported with its line number and skipped;
+the rest of its batch still goes in. Should the database reject a batch,
+its rows are retried one by one to find the culprits.
+
+Stock levels set by an import are recorded in the ledger as adjustments.
+The bulk writes bypass the model signals behind the dashboard counters, so
+each batch adjusts them by the products it activates and the stock it
+moves across reorder levels.
+Run it with ``manage.py import_catalog`` or through the admin API.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import DatabaseError, transaction
+
+from . import ledger, stats, upserts
+from .models import Category, Inventory, Product, ProductSupplier, StockMovement, Supplier
+from .signals import stock_changed
+
+FORMATS = ('csv', 'jsonl')
+
+# Rows upserted per batch
+BATCH_SIZE = 1000
+
+# Row errors listed in the summary; later ones are only counted
+ERROR_LIMIT = 1000
+
+PRODUCT_FIELDS = ('name', 'category_id', 'price', 'description', 'is_active')
+REQUIRED_FIELDS = {'name': 'name', 'category_id': 'category', 'price': 'price'}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+
+DEFAULT_REORDER_LEVEL = Inventory._meta.get_field('reorder_level').default
+
+
+class CatalogImportError(Exception):
+    """Raised when an import cannot start at all"""
+
+
+class RowError(ValueError):
+    """Raised for a row that cannot be imported"""
+
+
+def detect_format(filename):
+    """The import format matching ``filename``'s extension, or None"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'ndjson':
+        return 'jsonl'
+    return extension if extension in FORMATS else None
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line, row, error)`` for each record of a text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Empty cells are missing values
+            yield reader.line_num, {
+                key.strip(): value.strip()
+                for key, value in row.items()
+                if key and value is not None and value.strip()
+            }, None
+    elif fmt == 'jsonl':
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as exc:
+                yield line, None, f'Invalid JSON: {exc}'
+                continue
+            if not isinstance(row, dict):
+                yield line, None, 'Expected a JSON object'
+                continue
+            yield line, {key: value for key, value in row.items() if value not in (None, '')}, None
+    else:
+        raise CatalogImportError(f'Unknown format: {fmt}')
+
+
+def _decimal(value, name):
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        raise RowError(f"'{name}' is not a number: {value!r}")
+    if not number.is_finite() or number < Decimal('0.01'):
+        raise RowError(f"'{name}' must be at least 0.01")
+    if number != number.quantize(Decimal('0.01')):
+        raise RowError(f"'{name}' has more than 2 decimal places")
+    return number
+
+
+def _integer(value, name):
+    try:
+        number = int(str(value))
+    except ValueError:
+        raise RowError(f"'{name}' is not a whole number: {value!r}")
+    if number < 0:
+        raise RowError(f"'{name}' must not be negative")
+    return number
+
+
+def _boolean(value, name):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise RowError(f"'{name}' is not a boolean: {value!r}")
+
+
+def _text(value, name, max_length=None):
+    text = str(value).strip()
+    if max_length and len(text) > max_length:
+        raise RowError(f"'{name}' is longer than {max_length} characters")
+    return text
+
+
+class CatalogImport:
+    """One import run; feed it rows with ``run`` and read ``summary()``"""
+
+    def __init__(self, default_supplier=None, batch_size=BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.suppliers = {
+            email.lower(): supplier_id
+            for email, supplier_id in Supplier.objects.values_list('email', 'id')
+        }
+        self.default_supplier = None
+        if default_supplier:
+            self.default_supplier = self.suppliers.get(default_supplier.lower())
+            if self.default_supplier is None:
+                raise CatalogImportError(f'Unknown supplier: {default_supplier}')
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, sku, message):
+        self.error_count += 1
+        if len(self.errors) < ERROR_LIMIT:
+            self.errors.append({'line': line, 'sku': sku, 'error': message})
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'errors': self.error_count,
+            'error_details': self.errors,
+        }
+
+    def category_id(self, name):
+        name = _text(name, 'category', 100)
+        if name not in self.categories:
+            self.categories[name] = Category.objects.get_or_create(name=name)[0].pk
+        return self.categories[name]
+
+    def clean(self, row):
+        """Validate a raw row into field values, raising RowError"""
+        sku = _text(row.get('sku', ''), 'sku', 50)
+        if not sku:
+            raise RowError("'sku' is required")
+        data = {'sku': sku}
+        if 'name' in row:
+            data['name'] = _text(row['name'], 'name', 200)
+        if 'category' in row:
+            data['category_id'] = self.category_id(row['category'])
+        if 'price' in row:
+            data['price'] = _decimal(row['price'], 'price')
+        if 'description' in row:
+            data['description'] = _text(row['description'], 'description')
+        if 'is_active' in row:
+            data['is_active'] = _boolean(row['is_active'], 'is_active')
+
+        supplier = row.get('supplier')
+        if supplier:
+            data['supplier_id'] = self.suppliers.get(str(supplier).strip().lower())
+            if data['supplier_id'] is None:
+                raise RowError(f'Unknown supplier: {supplier}')
+        elif self.default_supplier and ('supplier_price' in row or 'is_primary' in row):
+            data['supplier_id'] = self.default_supplier
+        if 'supplier_price' in row:
+            data['supplier_price'] = _decimal(row['supplier_price'], 'supplier_price')
+        if 'is_primary' in row:
+            data['is_primary'] = _boolean(row['is_primary'], 'is_primary')
+        if ('supplier_price' in data or 'is_primary' in data) and 'supplier_id' not in data:
+            raise RowError("'supplier' is required with 'supplier_price' or 'is_primary'")
+
+        if 'quantity' in row:
+            data['quantity'] = _integer(row['quantity'], 'quantity')
+        if 'reorder_level' in row:
+            data['reorder_level'] = _integer(row['reorder_level'], 'reorder_level')
+        return data
+
+    def run(self, rows):
+        """Import ``(line, row, error)`` records as read by ``read_rows``"""
+        batch = []
+        for line, row, error in rows:
+            self.rows += 1
+            if error:
+                self.error(line, None, error)
+                continue
+            try:
+                batch.append((line, self.clean(row)))
+            except RowError as exc:
+                self.error(line, row.get('sku'), str(exc))
+                continue
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+                if self.progress:
+                    self.progress(self.rows)
+        if batch:
+            self.write(batch)
+        return self.summary()
+
+    def write(self, batch):
+        try:
+            with transaction.atomic():
+                results = [self.upsert(batch)]
+        except DatabaseError:
+            results = []
+            for line, data in batch:
+                try:
+                    with transaction.atomic():
+                        results.append(self.upsert([(line, data)]))
+                except DatabaseError as exc:
+                    self.error(line, data['sku'], f'Database error: {exc}')
+        for created, updated, errors in results:
+            self.created += created
+            self.updated += updated
+            for error in errors:
+                self.error(*error)
+
+    def upsert(self, batch):
+        """Write a batch; returns the products created and updated and the row errors"""
+        # Rows of the same sku are merged, later values winning
+        rows = {}
+        for line, data in batch:
+            earlier = rows.get(data['sku'], (line, {}))[1]
+            rows[data['sku']] = (line, {**earlier, **data})
+        skus = list(rows)
+
+        products = {
+            values['sku']: values
+            for values in Product.objects.filter(sku__in=skus).values('id', 'sku', *PRODUCT_FIELDS)
+        }
+        existing_ids = [values['id'] for values in products.values()]
+        # Locked, so checkouts cannot move the stock between reading and
+        # setting it
+        inventories = {
+            product_id: (quantity, reserved, reorder_level)
+            for product_id, quantity, reserved, reorder_level in (
+                Inventory.objects.filter(product_id__in=existing_ids)
+                .order_by('product_id')
+                .select_for_update()
+                .values_list('product_id', 'quantity', 'reserved_quantity', 'reorder_level')
+            )
+        }
+        links = {
+            (product_id, supplier_id): (supplier_price, is_primary)
+            for product_id, supplier_id, supplier_price, is_primary in (
+                ProductSupplier.objects.filter(product_id__in=existing_ids)
+                .values_list('product_id', 'supplier_id', 'supplier_price', 'is_primary')
+            )
+        }
+
+        valid = []
+        errors = []
+        for sku, (line, data) in rows.items():
+            try:
+                self.check(data, products.get(sku), inventories, links)
+            except RowError as exc:
+                errors.append((line, sku, str(exc)))
+                continue
+            valid.append(data)
+
+        catalog = []
+        active_delta = 0
+        for data in valid:
+            current = products.get(data['sku'])
+            if current is None or any(field in data for field in PRODUCT_FIELDS):
+                values = {field: (current or {}).get(field) for field in PRODUCT_FIELDS}
+                values.update((field, data[field]) for field in PRODUCT_FIELDS if field in data)
+                if values['is_active'] is None:
+                    values['is_active'] = True
+                catalog.append(Product(sku=data['sku'], **values))
+                active_delta += int(values['is_active']) - int(bool((current or {}).get('is_active')))
+        if catalog:
+            Product.objects.bulk_create(
+                catalog, **upserts.options(['sku'], list(PRODUCT_FIELDS) + ['updated_at'])
+            )
+        product_ids = dict(
+            Product.objects.filter(sku__in=[data['sku'] for data in valid]).values_list('sku', 'id')
+        )
+
+        stock = []
+        adjustments = {}
+        low_stock_delta = 0
+        for data in valid:
+            product_id = product_ids[data['sku']]
+            current = inventories.get(product_id)
+            if current is None or 'quantity' in data or 'reorder_level' in data:
+                quantity, reserved, reorder_level = current or (0, 0, DEFAULT_REORDER_LEVEL)
+                new_quantity = data.get('quantity', quantity)
+                new_reorder_level = data.get('reorder_level', reorder_level)
+                stock.append(Inventory(
+                    product_id=product_id,
+                    quantity=new_quantity,
+                    reserved_quantity=reserved,
+                    reorder_level=new_reorder_level,
+                ))
+                adjustments[product_id] = new_quantity - quantity
+                low_stock_delta += int(new_quantity <= new_reorder_level)
+                if current is not None:
+                    low_stock_delta -= int(quantity <= reorder_level)
+        if stock:
+            Inventory.objects.bulk_create(
+                stock, **upserts.options(['product'], ['quantity', 'reorder_level', 'updated_at'])
+            )
+            ledger.record(StockMovement.KIND_ADJUST, adjustments, quantity_sign=1)
+            # Lets the catalog cache go; too many products to list
+            stock_changed.send(sender=Inventory, product_ids=None)
+
+        prices = []
+        for data in valid:
+            if 'supplier_id' not in data:
+                continue
+            product_id = product_ids[data['sku']]
+            supplier_price, is_primary = links.get((product_id, data['supplier_id']), (None, False))
+            prices.append(ProductSupplier(
+                product_id=product_id,
+                supplier_id=data['supplier_id'],
+                supplier_price=data.get('supplier_price', supplier_price),
+                is_primary=data.get('is_primary', is_primary),
+            ))
+        if prices:
+            ProductSupplier.objects.bulk_create(
+                prices, **upserts.options(['product', 'supplier'], ['supplier_price', 'is_primary'])
+            )
+
+        stats.adjust(**{
+            stats.TOTAL_PRODUCTS: active_delta, stats.LOW_STOCK_PRODUCTS: low_stock_delta
+        })
+
+        created = sum(1 for data in valid if data['sku'] not in products)
+        return created, len(valid) - created, errors
+
+    def check(self, data, product, inventories, links):
+        """Checks of a row against the stored values"""
+        if product is None:
+            missing = [column for field, column in REQUIRED_FIELDS.items() if field not in data]
+            if missing:
+                raise RowError('New products need ' + ', '.join(f"'{column}'" for column in missing))
+        if 'quantity' in data and product is not None:
+            reserved = inventories.get(product['id'], (0, 0, 0))[1]
+            if data['quantity'] < reserved:
+                raise RowError(f"'quantity' is below the {reserved} units reserved")
+        if 'supplier_id' in data and 'supplier_price' not in data:
+            if product is None or (product['id'], data['supplier_id']) not in links:
+                raise RowError("'supplier_price' is required for a new supplier")
+
+
+def import_catalog(stream, fmt, default_supplier=None, batch_size=BATCH_SIZE, progress=None):
+    """Import a CSV or JSONL text stream and return the summary"""
+    importer = CatalogImport(default_supplier, batch_size, progress)
+    return importer.run(read_rows(stream, fmt))
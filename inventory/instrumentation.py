@@ -0,0 +1,241 @@
+# instrumentation.py
+"""
+Per-request cost accounting for the API.
+
+``InstrumentationMiddleware`` hands every query run for a request to a
+``QueryRecorder``, counting the queries, the
+time spent in SQL and how often each query shape (its SQL with literals and
+``IN`` lists folded, see ``fingerprint``) ran. A shape repeated
+``INSTRUMENTATION_DUPLICATE_QUERIES`` times or more is reported as a likely
+N+1 pattern.
+
+Each request is then
+
+* logged as one JSON line on the ``inventory.requests`` logger,
+* described in a ``Server-Timing`` response header (``total``, ``db``),
+* added to per-view aggregates served by ``top_views``, and to the
+  request latency histogram in ``metrics``.
+
+Queries slower than ``INSTRUMENTATION_SLOW_QUERY_MS`` are logged on the
+``inventory.slow_queries`` logger as they happen. The aggregates live in
+process memory: every worker reports on the requests it served itself.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+logger = logging.getLogger('inventory.requests')
+slow_query_logger = logging.getLogger('inventory.slow_queries')
+
+# Columns top_views can be sorted on
+SORT_KEYS = ('total_ms', 'avg_ms', 'max_ms', 'avg_queries', 'avg_sql_ms', 'duplicate_requests')
+
+_IN_LIST = re.compile(r'\bIN \((?:[^()]*)\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+_lock = threading.Lock()
+_views = {}
+
+# The recorder of the request being served. Database connections belong to
+# a thread, but context variables follow a request into the threads the
+# async ORM runs its queries in.
+_recorder = ContextVar('inventory_query_recorder', default=None)
+
+
+def get_slow_query_ms():
+    return getattr(settings, 'INSTRUMENTATION_SLOW_QUERY_MS', 100)
+
+
+def get_duplicate_threshold():
+    return getattr(settings, 'INSTRUMENTATION_DUPLICATE_QUERIES', 3)
+
+
+def fingerprint(sql):
+    """The shape of ``sql``, identical for queries differing only in values"""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _STRING.sub('?', sql)
+    return _NUMBER.sub('?', sql)
+
+
+class QueryRecorder:
+    """Database execute wrapper counting and timing the queries of a request"""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.slow_ms = get_slow_query_ms()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self.shapes[fingerprint(sql)] += 1
+            if elapsed * 1000 >= self.slow_ms:
+                slow_query_logger.warning(json.dumps({
+                    'view': self.view_name,
+                    'duration_ms': round(elapsed * 1000, 2),
+                    'many': many,
+                    'sql': sql,
+                }))
+
+    @property
+    def view_name(self):
+        return view_name(self.request) if self.request is not None else None
+
+    def duplicates(self):
+        threshold = get_duplicate_threshold()
+        return [
+            {'sql': shape, 'count': count}
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+def _execute(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """Route the queries of ``connection`` through the current request's recorder"""
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+connection_created.connect(install, dispatch_uid='instrumentation-install')
+
+
+def _record(name, duration_ms, recorder, duplicates):
+    with _lock:
+        totals = _views.setdefault(name, {
+            'requests': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'queries': 0,
+            'sql_ms': 0.0,
+            'duplicate_requests': 0,
+        })
+        totals['requests'] += 1
+        totals['total_ms'] += duration_ms
+        totals['max_ms'] = max(totals['max_ms'], duration_ms)
+        totals['queries'] += recorder.count
+        totals['sql_ms'] += recorder.duration * 1000
+        totals['duplicate_requests'] += bool(duplicates)
+
+
+def top_views(limit=10, sort='total_ms'):
+    """The ``limit`` views with the highest ``sort`` figure, one of SORT_KEYS"""
+    with _lock:
+        snapshot = {name: dict(totals) for name, totals in _views.items()}
+    rows = []
+    for name, totals in snapshot.items():
+        requests = totals['requests']
+        rows.append({
+            'view': name,
+            'requests': requests,
+            'total_ms': round(totals['total_ms'], 2),
+            'avg_ms': round(totals['total_ms'] / requests, 2),
+            'max_ms': round(totals['max_ms'], 2),
+            'avg_queries': round(totals['queries'] / requests, 2),
+            'avg_sql_ms': round(totals['sql_ms'] / requests, 2),
+            'duplicate_requests': totals['duplicate_requests'],
+        })
+    rows.sort(key=lambda row: row[sort], reverse=True)
+    return rows[:limit]
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+class InstrumentationMiddleware:
+    """Measure every request; list it first in MIDDLEWARE to time the whole stack"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder(request)
+        token = self.start(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder(request)
+        token = self.start(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    @staticmethod
+    def start(recorder):
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        return _recorder.set(recorder)
+
+    def finish(self, request, response, recorder, started):
+        duration_ms = (time.perf_counter() - started) * 1000
+        name = view_name(request)
+        duplicates = recorder.duplicates()
+        _record(name, duration_ms, recorder, duplicates)
+        metrics.REQUEST_DURATION.observe(
+            duration_ms / 1000, view=name, method=request.method, status=response.status_code
+        )
+
+        sql_ms = recorder.duration * 1000
+        response['Server-Timing'] = (
+            f'total;dur={duration_ms:.2f}, '
+            f'db;dur={sql_ms:.2f};desc="{recorder.count} queries"'
+        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': name,
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 2),
+                'queries': recorder.count,
+                'sql_ms': round(sql_ms, 2),
+                'duplicates': duplicates,
+            }))
+        return response
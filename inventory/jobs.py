@@ -0,0 +1,195 @@
+# jobs.py
+"""
+Database-backed background jobs.
+
+Work that does not have to finish before a response is sent (emails,
+supplier notifications, reporting tables) is registered as a task::
+
+    @jobs.task('orders.send_confirmation')
+    def send_confirmation(order_id):
+        ...
+
+and queued with ``jobs.enqueue('orders.send_confirmation', order_id=1)``.
+The Job row is written in the caller's transaction, so workers see it
+exactly when that transaction commits and it vanishes with a rollback;
+nothing runs inside the request. A ``key`` makes enqueueing idempotent: a
+second job with the same key is dropped.
+
+``manage.py run_jobs`` claims due jobs in batches and runs them on a
+thread or process pool. Each job runs in its own transaction together with
+being marked done, so a task's database writes happen exactly once.
+Failures are retried with exponential backoff until ``max_attempts``, then
+the job is left ``failed`` with its traceback. Jobs held by a worker that
+died are claimed again once their lock is older than ``lock_timeout``; a
+worker that was only slow then finds its claim gone when it finishes, and
+its outcome is dropped (with the task's writes, for atomic tasks) rather
+than overwriting the new run's.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('inventory.jobs')
+
+# Seconds before the first retry, doubled for every further attempt
+RETRY_BASE = 10
+RETRY_MAX = 3600
+LOCK_TIMEOUT = 300
+
+# Returned by execute() when another worker claimed the job in the meantime
+LOST = 'lost'
+
+_tasks = {}
+
+
+class Task:
+    def __init__(self, name, func, max_attempts, atomic):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.atomic = atomic
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+
+def task(name, max_attempts=5, atomic=True):
+    """
+    Register the decorated function as the task ``name``. Its keyword
+    arguments are stored as JSON, so pass ids rather than model instances.
+    Pass ``atomic=False`` for tasks whose work cannot be rolled back anyway.
+    """
+    def register(func):
+        _tasks[name] = Task(name, func, max_attempts, atomic)
+        return _tasks[name]
+    return register
+
+
+def get_task(name):
+    return _tasks.get(name)
+
+
+def enqueue(name, key=None, delay=0, **payload):
+    """Queue task ``name`` with ``payload``, at most once per ``key``"""
+    registered = get_task(name)
+    if registered is None:
+        raise LookupError(f'Unknown task: {name}')
+    job = Job(
+        name=name,
+        payload=payload,
+        key=key,
+        max_attempts=registered.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if key is None:
+        job.save()
+    else:
+        Job.objects.bulk_create([job], ignore_conflicts=True)
+    return job
+
+
+def due(now=None, lock_timeout=LOCK_TIMEOUT):
+    """Jobs ready to run, including those held by a worker that went away"""
+    now = now or timezone.now()
+    return Job.objects.filter(
+        Q(status=Job.STATUS_PENDING, run_at__lte=now)
+        | Q(status=Job.STATUS_RUNNING, locked_at__lt=now - timedelta(seconds=lock_timeout))
+    )
+
+
+@transaction.atomic
+def claim(worker, limit, lock_timeout=LOCK_TIMEOUT):
+    """Mark up to ``limit`` due jobs as running for ``worker`` and return their ids"""
+    now = timezone.now()
+    ids = list(
+        due(now, lock_timeout)
+        .select_for_update(skip_locked=True)
+        .order_by('run_at', 'id')
+        .values_list('pk', flat=True)[:limit]
+    )
+    if ids:
+        Job.objects.filter(pk__in=ids).update(
+            status=Job.STATUS_RUNNING, locked_at=now, locked_by=worker, updated_at=now
+        )
+    return ids
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, so failing jobs do not retry in step"""
+    delay = min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+    return delay * random.uniform(0.9, 1.1)
+
+
+class LockLost(Exception):
+    """The job was claimed by another worker while this one ran it"""
+
+
+def _finish(job, **changes):
+    """Record the outcome of ``job`` if this claim on it still holds, else raise LockLost"""
+    now = timezone.now()
+    updated = Job.objects.filter(
+        pk=job.pk, status=Job.STATUS_RUNNING, locked_by=job.locked_by, locked_at=job.locked_at
+    ).update(attempts=F('attempts') + 1, locked_at=None, updated_at=now, **changes)
+    if not updated:
+        raise LockLost(f'Job {job} was claimed again while it ran')
+
+
+def execute(job_id, worker):
+    """Run one job claimed by ``worker`` and record the outcome; returns its new status"""
+    job = Job.objects.get(pk=job_id)
+    if job.status != Job.STATUS_RUNNING or job.locked_by != worker:
+        logger.warning('Job %s is no longer held by %s, skipped', job, worker)
+        return LOST
+    registered = get_task(job.name)
+    try:
+        if registered is None:
+            raise LookupError(f'Unknown task: {job.name}')
+        if registered.atomic:
+            # Losing the claim rolls the task's writes back with it
+            with transaction.atomic():
+                registered(**job.payload)
+                _finish(job, status=Job.STATUS_DONE, finished_at=timezone.now())
+        else:
+            registered(**job.payload)
+            _finish(job, status=Job.STATUS_DONE, finished_at=timezone.now())
+        return Job.STATUS_DONE
+    except LockLost as exc:
+        logger.warning('%s; its outcome is dropped', exc)
+        return LOST
+    except Exception:
+        error = traceback.format_exc()
+        attempts = job.attempts + 1
+        if registered is None or attempts >= job.max_attempts:
+            logger.error('Job %s failed for good:\n%s', job, error)
+            changes = {'status': Job.STATUS_FAILED, 'finished_at': timezone.now()}
+        else:
+            logger.warning(
+                'Job %s failed, attempt %s of %s:\n%s', job, attempts, job.max_attempts, error
+            )
+            changes = {
+                'status': Job.STATUS_PENDING,
+                'run_at': timezone.now() + timedelta(seconds=retry_delay(attempts)),
+            }
+        try:
+            _finish(job, last_error=error, **changes)
+        except LockLost as exc:
+            logger.warning('%s; its outcome is dropped', exc)
+            return LOST
+        return changes['status']
+
+
+def run_pending(worker='inline', limit=100):
+    """Claim and run due jobs in this thread until none is left; for tests and scripts"""
+    statuses = []
+    while True:
+        ids = claim(worker, limit)
+        if not ids:
+            return statuses
+        statuses.extend(execute(job_id, worker) for job_id in ids)
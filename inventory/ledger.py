@@ -0,0 +1,249 @@
+# ledger.py
+"""
+Append-only history of stock movements.
+
+Every change that ``stock`` makes to ``Inventory.quantity`` or
+``reserved_quantity`` is also appended as StockMovement rows (reserve,
+release, sell, receive or adjust), with one bulk INSERT in the same
+transaction as the UPDATE. The ledger therefore always adds up to the
+Inventory table as long as stock only changes through ``stock``, and
+tells how each product got there.
+
+StockSnapshot rows hold the stock of a product as of a movement id, so its
+level is rebuilt from the latest snapshot plus the few movements after it
+(``level``): one query of index lookups, whatever the length of the
+history.
+``take_snapshots`` snapshots the products that moved since their last
+snapshot; the ``stock.take_snapshots`` job runs it every
+``SNAPSHOT_INTERVAL`` seconds. It only goes up to movements older than
+``SETTLE_TIME``, so none written by a still-running transaction is skipped.
+
+``reconcile`` compares the ledger with Inventory in chunks of products, on
+a thread pool; ``adjust`` records the differences as adjustments. Writes
+that bypass ``stock`` (raw imports, manual edits) show up there. Run it with
+``manage.py stock_ledger --reconcile``.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections, models, transaction
+from django.db.models import F, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Inventory, StockMovement, StockSnapshot
+
+# Movements written per INSERT
+BATCH_SIZE = 1000
+
+# Products checked or snapshotted per query, by product id range
+CHUNK_SIZE = 5000
+
+# Seconds between two snapshot passes
+SNAPSHOT_INTERVAL = 3600
+
+# Longest a transaction writing movements is expected to stay open
+SETTLE_TIME = timedelta(minutes=5)
+
+
+def record(kind, quantities, quantity_sign=0, reserved_sign=0):
+    """Append a ``kind`` movement for each ``{product_id: n}`` with a nonzero n"""
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(
+                product_id=product_id,
+                kind=kind,
+                quantity_delta=quantity_sign * n,
+                reserved_delta=reserved_sign * n,
+            )
+            for product_id, n in sorted(quantities.items())
+            if n
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def with_ledger(inventories, upto=None):
+    """
+    Annotate ``inventories`` with ``ledger_quantity`` and ``ledger_reserved``,
+    their stock according to the ledger, counting movements up to ``upto``.
+    """
+    snapshots = StockSnapshot.objects.filter(product_id=OuterRef('product_id'))
+    movements = StockMovement.objects.filter(
+        product_id=OuterRef('product_id'), id__gt=OuterRef('snapshot_movement')
+    )
+    if upto is not None:
+        snapshots = snapshots.filter(movement_id__lte=upto)
+        movements = movements.filter(id__lte=upto)
+    snapshots = snapshots.order_by('-movement_id')
+
+    def snapshot_value(field):
+        return Coalesce(
+            Subquery(snapshots.values(field)[:1]), Value(0), output_field=models.IntegerField()
+        )
+
+    def moved(field):
+        total = movements.order_by().values('product_id').annotate(total=Sum(field)).values('total')
+        return Coalesce(Subquery(total), Value(0), output_field=models.IntegerField())
+
+    return inventories.annotate(
+        snapshot_movement=Coalesce(
+            Subquery(snapshots.values('movement_id')[:1]),
+            Value(0),
+            output_field=models.BigIntegerField(),
+        ),
+    ).annotate(
+        ledger_quantity=snapshot_value('quantity') + moved('quantity_delta'),
+        ledger_reserved=snapshot_value('reserved_quantity') + moved('reserved_delta'),
+    )
+
+
+def level(product_id):
+    """``(quantity, reserved_quantity)`` of a product rebuilt from the ledger"""
+    row = (
+        with_ledger(Inventory.objects.filter(product_id=product_id))
+        .values_list('ledger_quantity', 'ledger_reserved')
+        .first()
+    )
+    return row or (0, 0)
+
+
+def settled_movement():
+    """Id of the newest movement no uncommitted movement can come before"""
+    return (
+        StockMovement.objects
+        .filter(created_at__lt=timezone.now() - SETTLE_TIME)
+        .order_by('-id')
+        .values_list('id', flat=True)
+        .first()
+    )
+
+
+def product_ranges(chunk_size=CHUNK_SIZE):
+    """``[start, end)`` product id ranges covering every inventory"""
+    bounds = Inventory.objects.aggregate(first=Min('product_id'), last=Max('product_id'))
+    if bounds['first'] is None:
+        return []
+    return [
+        (start, start + chunk_size)
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size)
+    ]
+
+
+def _in_range(start, end):
+    return Inventory.objects.filter(product_id__gte=start, product_id__lt=end)
+
+
+def take_snapshots(chunk_size=CHUNK_SIZE, progress=None):
+    """Snapshot every product that moved since its last snapshot; returns how many"""
+    upto = settled_movement()
+    if upto is None:
+        return 0
+    last_movement = (
+        StockMovement.objects
+        .filter(product_id=OuterRef('product_id'), id__lte=upto)
+        .order_by('-id')
+        .values('id')[:1]
+    )
+    taken = 0
+    for start, end in product_ranges(chunk_size):
+        rows = (
+            with_ledger(_in_range(start, end), upto)
+            .annotate(last_movement=Subquery(last_movement))
+            .filter(last_movement__gt=F('snapshot_movement'))
+            .values_list('product_id', 'ledger_quantity', 'ledger_reserved')
+        )
+        # Another pass may have snapshotted the same movement already
+        taken += len(StockSnapshot.objects.bulk_create(
+            [
+                StockSnapshot(
+                    product_id=product_id,
+                    movement_id=upto,
+                    quantity=quantity,
+                    reserved_quantity=reserved,
+                )
+                for product_id, quantity, reserved in rows
+            ],
+            ignore_conflicts=True,
+        ))
+        if progress:
+            progress(end)
+    return taken
+
+
+def _drifted(inventories):
+    return (
+        with_ledger(inventories)
+        .exclude(quantity=F('ledger_quantity'), reserved_quantity=F('ledger_reserved'))
+        .order_by('product_id')
+        .values_list(
+            'product_id', 'quantity', 'reserved_quantity', 'ledger_quantity', 'ledger_reserved'
+        )
+    )
+
+
+def drift(start, end):
+    """
+    ``(product_id, quantity, reserved, ledger_quantity, ledger_reserved)``
+    of the inventories in a product id range that disagree with the ledger.
+    Both sides are read by one statement, so they are consistent.
+    """
+    return list(_drifted(_in_range(start, end)))
+
+
+def _drift_in_thread(product_range):
+    close_old_connections()
+    try:
+        return drift(*product_range)
+    finally:
+        close_old_connections()
+
+
+def reconcile(chunk_size=CHUNK_SIZE, workers=4, progress=None):
+    """
+    Compare the ledger with Inventory, ``workers`` chunks at a time, and
+    return the drifted rows as ``drift`` does.
+    """
+    ranges = product_ranges(chunk_size)
+    found = []
+
+    def collect(results):
+        for done, rows in enumerate(results, 1):
+            found.extend(rows)
+            if progress:
+                progress(done, len(ranges))
+
+    if workers <= 1:
+        # On this thread's connection, and so inside the caller's transaction
+        collect(drift(start, end) for start, end in ranges)
+    else:
+        with ThreadPoolExecutor(workers, thread_name_prefix='reconcile') as pool:
+            collect(pool.map(_drift_in_thread, ranges))
+    return found
+
+
+@transaction.atomic
+def adjust(product_ids):
+    """
+    Record adjustments bringing the ledger of ``product_ids`` in line with
+    Inventory; returns the rows adjusted, as ``drift`` does.
+    """
+    product_ids = sorted(product_ids)
+    adjusted = []
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        inventories = Inventory.objects.filter(product_id__in=product_ids[start:start + BATCH_SIZE])
+        # Locked, so no movement comes in between reading the drift and
+        # adjusting it
+        list(inventories.order_by('product_id').select_for_update().values_list('pk'))
+        rows = list(_drifted(inventories))
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                product_id=product_id,
+                kind=StockMovement.KIND_ADJUST,
+                quantity_delta=quantity - ledger_quantity,
+                reserved_delta=reserved - ledger_reserved,
+            )
+            for product_id, quantity, reserved, ledger_quantity, ledger_reserved in rows
+        ])
+        adjusted.extend(rows)
+    return adjusted
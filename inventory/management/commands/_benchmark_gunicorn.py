@@ -0,0 +1,22 @@
+# Gunicorn configuration of the servers started by "manage.py concurrency_benchmark"
+import os
+import time
+
+
+def post_worker_init(worker):
+    """Delay every query by BENCHMARK_DB_LATENCY_MS, like a database across a network"""
+    latency = float(os.environ.get("BENCHMARK_DB_LATENCY_MS") or 0) / 1000
+    if not latency:
+        return
+
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def install(connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
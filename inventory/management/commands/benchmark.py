@@ -0,0 +1,292 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from inventory import cache
+from inventory.models import CartItem, Product
+
+BASELINES = Path(__file__).resolve().parents[2] / "benchmark_baselines.json"
+
+# Row counts passed to the seed command for each scale
+SCALES = {
+    "small": {"users": 50, "products": 1000, "orders": 2000},
+    "medium": {"users": 500, "products": 20000, "orders": 50000},
+    "large": {"users": 5000, "products": 200000, "orders": 500000},
+    # For the exports, whose peak memory must not grow with the row count
+    "huge": {"users": 5000, "products": 200000, "orders": 1000000},
+}
+METRICS = ("p50_ms", "p99_ms", "peak_kb")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API hot paths on seeded test databases and compare "
+        "latency, query counts and memory against stored baselines"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scales",
+            nargs="+",
+            choices=list(SCALES),
+            default=["small"],
+            help="Data set sizes to run at",
+        )
+        parser.add_argument(
+            "--scenarios", nargs="+", metavar="NAME", help="Only run these scenarios"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=30, help="Timed requests per scenario"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Seed for data and requests")
+        parser.add_argument(
+            "--baselines", type=Path, default=BASELINES, help="Baseline JSON file"
+        )
+        parser.add_argument(
+            "--update-baselines",
+            action="store_true",
+            help="Store this run's results as the new baselines",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=1.0,
+            help="Allowed relative slowdown or memory growth over the baseline "
+            "(1.0 = twice the baseline); query counts may never grow",
+        )
+        parser.add_argument(
+            "--slack-ms",
+            type=float,
+            default=20.0,
+            help="Latency allowed over the baseline regardless of --tolerance, "
+            "so millisecond jitter on fast scenarios does not fail the run",
+        )
+
+    def handle(self, *args, **options):
+        results = {}
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for scale in options["scales"]:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"Scale: {scale} {SCALES[scale]}"))
+                self.seed(scale, options["seed"])
+                results[scale] = self.run_scenarios(options["scenarios"], options["repeat"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        baselines = {}
+        if options["baselines"].exists():
+            baselines = json.loads(options["baselines"].read_text())
+
+        if options["update_baselines"]:
+            for scale, scenarios in results.items():
+                baselines.setdefault(scale, {}).update(scenarios)
+            options["baselines"].write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Baselines written to {options['baselines']}"))
+            return
+
+        failures = self.compare(
+            results, baselines, options["tolerance"], options["slack_ms"]
+        )
+        if failures:
+            raise CommandError("Budgets exceeded:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("All scenarios within budget."))
+
+    def seed(self, scale, seed):
+        call_command("flush", interactive=False, verbosity=0)
+        started = time.perf_counter()
+        call_command("seed", seed=seed, no_password=True, stdout=StringIO(), **SCALES[scale])
+        self.stdout.write(f"  seeded in {time.perf_counter() - started:.1f}s")
+
+        self.rng = random.Random(seed)
+        self.user = User.objects.filter(is_staff=False).order_by("pk").first()
+        self.admin = User.objects.create_superuser("benchmark-admin", "admin@example.com", None)
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+        # Products that can be ordered many times over
+        self.product_ids = list(
+            Product.objects.filter(
+                is_active=True,
+                inventory__quantity__gte=F("inventory__reserved_quantity") + 100,
+            ).values_list("pk", flat=True)[:500]
+        )
+        self.words = list(Product.objects.values_list("name", flat=True)[:200])
+
+    def scenarios(self):
+        """Name -> (untimed preparation or None, timed request)"""
+        client, admin = self.client, self.admin_client
+        cart = self.user.cart
+
+        def product():
+            return self.rng.choice(self.product_ids)
+
+        def empty_cart():
+            CartItem.objects.filter(cart=cart).delete()
+
+        filled = []
+
+        def fill_cart():
+            empty_cart()
+            filled[:] = self.rng.sample(self.product_ids, 3)
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=product_id, quantity=1) for product_id in filled]
+            )
+
+        def post(client, url, data):
+            return client.post(url, data, content_type="application/json")
+
+        def download(url):
+            # Read and drop the chunks like a client saving to disk would
+            response = admin.get(url)
+            for chunk in response.streaming_content:
+                pass
+            return response
+
+        return {
+            # The catalog cache is invalidated first so the views do their work
+            "product_list": (
+                cache.bump_version,
+                lambda: client.get(reverse("api-product-list")),
+            ),
+            "product_search": (
+                cache.bump_version,
+                lambda: client.get(
+                    reverse("api-product-list"),
+                    {"search": self.rng.choice(self.words).split()[0]},
+                ),
+            ),
+            "product_detail": (
+                cache.bump_version,
+                lambda: client.get(reverse("api-product-detail", args=[product()])),
+            ),
+            "cart_add": (
+                empty_cart,
+                lambda: post(
+                    client, reverse("api-cart-items"), {"product_id": product(), "quantity": 1}
+                ),
+            ),
+            # Adding a product already in the cart merges into its line
+            "cart_merge": (
+                fill_cart,
+                lambda: post(
+                    client, reverse("api-cart-items"), {"product_id": filled[0], "quantity": 1}
+                ),
+            ),
+            "cart_read": (fill_cart, lambda: client.get(reverse("api-cart"))),
+            "checkout": (
+                fill_cart,
+                lambda: post(
+                    client,
+                    reverse("api-order-list"),
+                    {"shipping_address": "1 Benchmark Road", "shipping_phone": "0123456789"},
+                ),
+            ),
+            "order_list": (None, lambda: client.get(reverse("api-order-list"))),
+            "order_stats": (None, lambda: client.get(reverse("api-user-order-stats"))),
+            "admin_orders": (None, lambda: admin.get(reverse("api-admin-order-list"))),
+            "admin_dashboard": (None, lambda: admin.get(reverse("api-admin-dashboard"))),
+            "sales_report": (None, lambda: admin.get(reverse("api-admin-product-sales"))),
+            "export_orders": (None, lambda: download(reverse("api-admin-export-orders"))),
+            "export_products": (None, lambda: download(reverse("api-admin-export-products"))),
+            "export_stock": (None, lambda: download(reverse("api-admin-export-stock"))),
+        }
+
+    def run_scenarios(self, only, repeat):
+        scenarios = self.scenarios()
+        unknown = set(only or ()) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        self.stdout.write(
+            f"  {'scenario':<16} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak kB':>9}"
+        )
+        results = {}
+        for name, (prepare, run) in scenarios.items():
+            if only and name not in only:
+                continue
+            result = results[name] = self.measure(name, prepare, run, repeat)
+            self.stdout.write(
+                f"  {name:<16} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['queries']:>8} {result['peak_kb']:>9.1f}"
+            )
+        return results
+
+    def measure(self, name, prepare, run, repeat):
+        def call():
+            response = run()
+            if response.status_code >= 400:
+                raise CommandError(
+                    f"{name}: HTTP {response.status_code} {response.content[:200]!r}"
+                )
+            return response
+
+        # Warm up URL resolution, serializers and connection state
+        if prepare:
+            prepare()
+        call()
+
+        timings = []
+        queries = 0
+        for _ in range(max(repeat, 2)):
+            if prepare:
+                prepare()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                call()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(context))
+
+        # Memory is traced in a run of its own, tracing slows everything down
+        if prepare:
+            prepare()
+        tracemalloc.start()
+        try:
+            call()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "p50_ms": round(statistics.median(timings), 3),
+            "p99_ms": round(statistics.quantiles(timings, n=100, method="inclusive")[98], 3),
+            "queries": queries,
+            "peak_kb": round(peak / 1024, 1),
+        }
+
+    def compare(self, results, baselines, tolerance, slack_ms):
+        failures = []
+        for scale, scenarios in results.items():
+            for name, result in scenarios.items():
+                baseline = baselines.get(scale, {}).get(name)
+                if baseline is None:
+                    self.stdout.write(self.style.WARNING(f"No baseline for {scale}/{name}"))
+                    continue
+                if result["queries"] > baseline["queries"]:
+                    failures.append(
+                        f"{scale}/{name}: {result['queries']} queries, budget {baseline['queries']}"
+                    )
+                for metric in METRICS:
+                    budget = baseline[metric] * (1 + tolerance)
+                    if metric.endswith("_ms"):
+                        budget = max(budget, baseline[metric] + slack_ms)
+                    if result[metric] > budget:
+                        failures.append(
+                            f"{scale}/{name}: {metric} {result[metric]}, budget {budget:.1f}"
+                        )
+        return failures
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import Product
+
+# gunicorn arguments serving the same code base through each interface
+SERVERS = {
+    "sync": ["inventory_system.wsgi:application"],
+    "async": [
+        "inventory_system.asgi:application",
+        "--worker-class",
+        "uvicorn_worker.UvicornWorker",
+    ],
+}
+HOST = "127.0.0.1"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+class HTTPClient:
+    """A minimal HTTP/1.1 client reusing its connection while the server allows"""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        request = f"GET {path} HTTP/1.1\r\nHost: {HOST}\r\nAccept: application/json\r\n\r\n"
+        for attempt in range(2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(HOST, self.port)
+            self.writer.write(request.encode())
+            try:
+                head = await self.reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.close()
+                if reused:
+                    # The server dropped an idle keep-alive connection
+                    continue
+                raise
+            lines = head.decode("latin-1").split("\r\n")
+            status = int(lines[0].split(" ", 2)[1])
+            headers = {}
+            for line in lines[1:]:
+                if line:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+            if "content-length" not in headers:
+                raise CommandError(f"{path}: response without Content-Length")
+            await self.reader.readexactly(int(headers["content-length"]))
+            if headers.get("connection") == "close":
+                self.close()
+            return status
+        raise ConnectionError("Connection closed by the server")
+
+
+async def run_load(port, paths, clients, total, timeout):
+    """Send ``total`` GETs over ``clients`` concurrent connections"""
+    latencies = []
+    errors = Counter()
+    issued = 0
+
+    async def client_loop():
+        nonlocal issued
+        client = HTTPClient(port)
+        while issued < total:
+            path = paths[issued % len(paths)]
+            issued += 1
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(client.get(path), timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+                errors[type(exc).__name__] += 1
+                client.close()
+                continue
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors[f"HTTP {status}"] += 1
+        client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(clients)))
+    return time.perf_counter() - started, latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the sync (WSGI) and async (ASGI) servers "
+        "under many concurrent clients, against the configured database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS)
+        )
+        parser.add_argument("--clients", type=int, default=1000, help="Concurrent connections")
+        parser.add_argument("--requests", type=int, default=10000, help="Requests per server")
+        parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Path to request, may be repeated (default: product list, "
+            "categories and product details)",
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="Let the catalog cache answer repeated URLs; by default every "
+            "request gets a unique query string so the views read the database",
+        )
+        parser.add_argument(
+            "--db-latency-ms",
+            type=float,
+            default=0,
+            help="Delay every query by this much in the servers, to see how "
+            "each interface copes with a database across the network",
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=60.0, help="Seconds allowed per request"
+        )
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or self.default_paths()
+        self.stdout.write(
+            f"{options['requests']} requests from {options['clients']} clients, "
+            f"{options['workers']} workers per server, "
+            f"{options['db_latency_ms']:g} ms added per query"
+        )
+        self.stdout.write(
+            f"{'server':<8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}  errors"
+        )
+        for server in options["servers"]:
+            port = free_port()
+            process = self.start_server(
+                server, port, options["workers"], options["db_latency_ms"]
+            )
+            try:
+                self.wait_until_ready(process, port, paths[0])
+                # Let every worker import the views and open its connections
+                asyncio.run(run_load(port, paths, min(options["clients"], 20), 200, 30))
+                requests = self.unique(paths, options["requests"], options["cache"])
+                elapsed, latencies, errors = asyncio.run(
+                    run_load(port, requests, options["clients"], len(requests), options["timeout"])
+                )
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            self.report(server, elapsed, latencies, errors)
+
+    def default_paths(self):
+        product_ids = list(
+            Product.objects.filter(is_active=True).values_list("pk", flat=True)[:50]
+        )
+        if not product_ids:
+            raise CommandError("No active products: run 'manage.py seed' first")
+        return [
+            "/api/v1.1.1/products/",
+            "/api/v1.1.1/categories/",
+            *(f"/api/v1.1.1/products/{pk}/" for pk in product_ids),
+        ]
+
+    @staticmethod
+    def unique(paths, total, cache):
+        requests = [paths[index % len(paths)] for index in range(total)]
+        if cache:
+            return requests
+        # Catalog responses are cached per URL; a unique query string makes
+        # every request a miss without changing what the view returns
+        return [
+            f"{path}{'&' if '?' in path else '?'}bench={index}"
+            for index, path in enumerate(requests)
+        ]
+
+    def start_server(self, server, port, workers, db_latency_ms):
+        env = dict(os.environ)
+        env.pop("ASYNC_READ_VIEWS", None)
+        env["BENCHMARK_DB_LATENCY_MS"] = str(db_latency_ms)
+        # Queries wait on each other under this load; keep the log readable
+        env.setdefault("SLOW_QUERY_MS", "10000")
+        return subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn", *SERVERS[server],
+                "--workers", str(workers),
+                "--bind", f"{HOST}:{port}",
+                "--backlog", "4096",
+                # A starved event loop misses heartbeats long before it hangs
+                "--timeout", "300",
+                "--log-level", "warning",
+                "--config", "python:inventory.management.commands._benchmark_gunicorn",
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+        )
+
+    def wait_until_ready(self, process, port, path, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited with status {process.returncode}")
+            try:
+                if asyncio.run(self.probe(port, path)) == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f"Server did not answer on port {port} within {timeout}s")
+
+    @staticmethod
+    async def probe(port, path):
+        client = HTTPClient(port)
+        try:
+            return await client.get(path)
+        finally:
+            client.close()
+
+    def report(self, server, elapsed, latencies, errors):
+        if latencies:
+            timings = sorted(latency * 1000 for latency in latencies)
+            p50 = statistics.median(timings)
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            worst = timings[-1]
+        else:
+            p50 = p99 = worst = float("nan")
+        error_text = ", ".join(f"{name}: {count}" for name, count in errors.items()) or "-"
+        self.stdout.write(
+            f"{server:<8} {len(latencies) / elapsed:>9.1f} {p50:>9.1f} {p99:>9.1f} "
+            f"{worst:>9.1f}  {error_text}"
+        )
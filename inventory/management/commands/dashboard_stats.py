@@ -0,0 +1,120 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+
+from inventory import stats
+from inventory.models import Order, Product
+
+STATUSES = [code for code, label in Order.STATUS_CHOICES]
+
+
+def separate_queries():
+    """The dashboard as it used to be computed: one query per figure"""
+    return {
+        "total_orders": Order.objects.count(),
+        "pending_orders": Order.objects.filter(status=Order.STATUS_PENDING).count(),
+        "total_revenue": Order.objects.aggregate(Sum("total_amount"))["total_amount__sum"] or 0,
+        "total_users": User.objects.count(),
+        "total_products": Product.objects.filter(is_active=True).count(),
+        "low_stock_products": Product.objects.filter(
+            inventory__quantity__lte=F("inventory__reorder_level")
+        ).count(),
+    }
+
+
+class Command(BaseCommand):
+    help = "Rebuild, check or benchmark the admin dashboard counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild", action="store_true", help="Recount every counter from scratch"
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Compare the stored counters with a live recount",
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Compare per-figure queries, the single-pass aggregate and the counters",
+        )
+        parser.add_argument(
+            "--orders",
+            type=int,
+            default=0,
+            help="Generate this many throw-away orders for the benchmark "
+            "(rolled back afterwards)",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=10, help="Runs per strategy"
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            values = stats.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Dashboard counters rebuilt: {values}"))
+
+        if options["check"]:
+            stored = stats.dashboard()
+            live = stats.compute()
+            drift = {
+                name: (stored[name], live[name])
+                for name in stats.COUNTERS
+                if stored[name] != live[name]
+            }
+            if drift:
+                for name, (stored_value, live_value) in drift.items():
+                    self.stdout.write(
+                        self.style.WARNING(f"{name}: stored {stored_value}, actual {live_value}")
+                    )
+            else:
+                self.stdout.write(self.style.SUCCESS("Dashboard counters are up to date."))
+
+        if options["benchmark"]:
+            with transaction.atomic():
+                if options["orders"]:
+                    self.generate_orders(options["orders"])
+                    stats.rebuild()
+                self.benchmark(options["repeat"])
+                transaction.set_rollback(True)
+
+    def generate_orders(self, total, batch_size=5000):
+        user, _ = User.objects.get_or_create(username="dashboard-benchmark")
+        rng = random.Random(0)
+        for start in range(0, total, batch_size):
+            Order.objects.bulk_create(
+                [
+                    Order(
+                        user=user,
+                        order_number=f"BENCH-{index:08d}",
+                        status=rng.choice(STATUSES),
+                        total_amount=Decimal(rng.randint(100, 100000)) / 100,
+                    )
+                    for index in range(start, min(start + batch_size, total))
+                ]
+            )
+        self.stdout.write(f"Generated {total} orders.")
+
+    def benchmark(self, repeat):
+        runs = {
+            "per-figure": separate_queries,
+            "single-pass": stats.compute,
+            "counters": stats.dashboard,
+        }
+        self.stdout.write(f"{'strategy':<12} {'p50 ms':>9} {'max ms':>9}")
+        for label, run in runs.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{label:<12} {statistics.median(timings):>9.2f} {max(timings):>9.2f}"
+            )
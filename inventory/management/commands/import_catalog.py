@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert products, supplier prices and stock levels from a CSV or JSONL "
+        "feed, keyed on SKU"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import")
+        parser.add_argument(
+            "--format",
+            choices=importer.FORMATS,
+            help="Format of the file, by default taken from its extension",
+        )
+        parser.add_argument(
+            "--supplier",
+            metavar="EMAIL",
+            help="Supplier of the rows that have prices but no 'supplier' column",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=importer.BATCH_SIZE,
+            help="Rows upserted per batch",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or importer.detect_format(options["path"])
+        if fmt is None:
+            raise CommandError("Cannot tell the format from the file name; pass --format.")
+
+        started = time.perf_counter()
+        try:
+            # utf-8-sig drops the byte order mark spreadsheets like to add
+            with open(options["path"], newline="", encoding="utf-8-sig") as stream:
+                summary = importer.import_catalog(
+                    stream,
+                    fmt,
+                    default_supplier=options["supplier"],
+                    batch_size=options["batch_size"],
+                    progress=lambda done: self.stdout.write(f"  {done} rows", ending="\r"),
+                )
+        except (OSError, importer.CatalogImportError) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write("")
+        for error in summary["error_details"]:
+            self.stdout.write(self.style.WARNING(
+                f"Line {error['line']} ({error['sku'] or 'no sku'}): {error['error']}"
+            ))
+        if summary["errors"] > len(summary["error_details"]):
+            self.stdout.write(
+                f"... and {summary['errors'] - len(summary['error_details'])} more errors."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['rows']} rows in {time.perf_counter() - started:.1f}s: "
+            f"{summary['created']} products created, {summary['updated']} updated, "
+            f"{summary['errors']} rows rejected."
+        ))
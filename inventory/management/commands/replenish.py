@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from inventory import replenishment
+
+
+class Command(BaseCommand):
+    help = (
+        "Order the products at or below their reorder level from their primary "
+        "or cheapest supplier, as one purchase order per supplier"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target-factor",
+            type=int,
+            default=replenishment.TARGET_FACTOR,
+            help="Order stock up to this multiple of the reorder level",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=replenishment.BATCH_SIZE,
+            help="Products read and purchase order lines written per step",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be ordered without creating purchase orders",
+        )
+
+    def handle(self, *args, **options):
+        def progress(done):
+            self.stdout.write(f"  {done} lines", ending="\r")
+
+        summary = replenishment.replenish(
+            target_factor=options["target_factor"],
+            dry_run=options["dry_run"],
+            batch_size=options["batch_size"],
+            progress=progress,
+        )
+        self.stdout.write("")
+        verb = "Would create" if options["dry_run"] else "Created"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {summary['purchase_orders']} purchase orders with "
+            f"{summary['lines']} lines, {summary['units']} units, "
+            f"costing {summary['total_cost']}."
+        ))
+        if summary["without_supplier"]:
+            self.stdout.write(self.style.WARNING(
+                f"{summary['without_supplier']} products need stock but have no supplier."
+            ))
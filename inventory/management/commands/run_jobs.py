@@ -0,0 +1,133 @@
+import os
+import signal
+import socket
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+# inventory.jobs is imported inside the functions below: a process pool
+# worker imports this module before Django is set up
+
+
+def setup_process():
+    # The parent handles Ctrl+C and lets running jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+
+
+def run_job(job_id, worker):
+    from inventory import jobs
+
+    close_old_connections()
+    try:
+        return jobs.execute(job_id, worker)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (order emails, stock alerts, rollups) until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=getattr(settings, "JOBS_CONCURRENCY", 4),
+            help="Jobs run at the same time",
+        )
+        parser.add_argument(
+            "--pool",
+            choices=["thread", "process"],
+            default="thread",
+            help="Run jobs in threads (the default) or in separate processes, "
+            "for tasks that keep the CPU busy",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=getattr(settings, "JOBS_POLL_INTERVAL", 1.0),
+            help="Seconds to wait before looking for new jobs when the queue is empty",
+        )
+        parser.add_argument(
+            "--lock-timeout",
+            type=int,
+            default=None,
+            help="Seconds after which a running job is considered abandoned and run again",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit as soon as no job is due"
+        )
+
+    def handle(self, *args, **options):
+        from inventory import jobs, tasks
+
+        concurrency = max(1, options["concurrency"])
+        lock_timeout = options["lock_timeout"] or jobs.LOCK_TIMEOUT
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            if stopping.is_set():
+                raise KeyboardInterrupt
+            self.stdout.write("Stopping after the running jobs; interrupt again to quit now.")
+            stopping.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        if options["pool"] == "process":
+            # Spawned rather than forked, so no process shares the parent's
+            # database connections
+            pool = ProcessPoolExecutor(
+                concurrency, mp_context=get_context("spawn"), initializer=setup_process
+            )
+        else:
+            pool = ThreadPoolExecutor(concurrency, thread_name_prefix="job")
+
+        # Queued once per interval, so this only restarts a broken chain
+        tasks.schedule_snapshots()
+        self.stdout.write(
+            f"Worker {worker} running up to {concurrency} jobs in a {options['pool']} pool"
+        )
+        outcomes = Counter()
+        running = set()
+        try:
+            while not stopping.is_set():
+                claimed = jobs.claim(worker, concurrency - len(running), lock_timeout)
+                running.update(pool.submit(run_job, job_id, worker) for job_id in claimed)
+                if not running:
+                    if options["once"]:
+                        break
+                    stopping.wait(options["poll_interval"])
+                    continue
+                # Claim again as soon as a slot frees up, or when new jobs may be due
+                done, running = wait(
+                    running,
+                    timeout=None if len(running) == concurrency else options["poll_interval"],
+                    return_when=FIRST_COMPLETED,
+                )
+                self.collect(done, outcomes)
+            done, running = wait(running)
+            self.collect(done, outcomes)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+        summary = ", ".join(f"{status}: {count}" for status, count in sorted(outcomes.items()))
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker} stopped ({summary or 'no jobs'})."))
+
+    def collect(self, futures, outcomes):
+        for future in futures:
+            try:
+                outcomes[future.result()] += 1
+            except Exception as exc:
+                # Failures of the task itself are recorded on its job; this
+                # is the worker losing track of one, which its lock timeout
+                # will recover
+                outcomes["lost"] += 1
+                self.stderr.write(f"Job execution failed: {exc!r}")
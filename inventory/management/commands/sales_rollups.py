@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from inventory import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily, product and category sales rollups from order history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild", action="store_true", help="Recompute every rollup from scratch"
+        )
+        parser.add_argument(
+            "--pending",
+            action="store_true",
+            help="Add the orders not rolled up yet, such as those whose job failed",
+        )
+        parser.add_argument(
+            "--chunk-days",
+            type=int,
+            default=7,
+            help="Days of orders aggregated per step",
+        )
+
+    def handle(self, *args, **options):
+        if not (options["rebuild"] or options["pending"]):
+            self.stdout.write(
+                "Nothing to do; pass --rebuild to recompute the rollups or --pending "
+                "to add the orders missing from them."
+            )
+            return
+
+        if options["rebuild"]:
+            def progress(done):
+                self.stdout.write(f"  {done} orders aggregated", ending="\r")
+
+            total = rollups.rebuild(chunk_days=options["chunk_days"], progress=progress)
+            self.stdout.write("")
+            self.stdout.write(self.style.SUCCESS(f"Sales rollups rebuilt from {total} orders."))
+            return
+
+        added = rollups.record_pending(
+            progress=lambda done: self.stdout.write(f"  {done} orders added", ending="\r")
+        )
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(f"Added {added} orders to the sales rollups."))
@@ -0,0 +1,102 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from faker.providers.lorem.en_US import Provider as LoremProvider
+
+from inventory.models import Category, Product
+from inventory.search import BaseSearchBackend, get_backend, parse_terms, search_products
+
+WORDS = LoremProvider.word_list
+
+
+class Command(BaseCommand):
+    help = "Install, rebuild or benchmark the product search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild", action="store_true", help="Re-index every product"
+        )
+        parser.add_argument(
+            "--benchmark",
+            nargs="*",
+            metavar="QUERY",
+            help="Compare search latency against icontains for the given queries",
+        )
+        parser.add_argument(
+            "--products",
+            type=int,
+            default=0,
+            help="Generate this many throw-away products for the benchmark "
+            "(rolled back afterwards)",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Runs per query and backend"
+        )
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.install()
+        self.stdout.write(f"Search backend: {backend.__class__.__name__}")
+
+        if options["rebuild"]:
+            backend.rebuild()
+            self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
+
+        if options["benchmark"] is not None:
+            with transaction.atomic():
+                if options["products"]:
+                    self.generate_products(options["products"])
+                self.benchmark(
+                    options["benchmark"] or ["market", "deve", "wonder rat", "zebra"],
+                    options["repeat"],
+                )
+                transaction.set_rollback(True)
+
+    def generate_products(self, total, batch_size=5000):
+        category, _ = Category.objects.get_or_create(name="Search benchmark")
+        rng = random.Random(0)
+        for start in range(0, total, batch_size):
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        name=" ".join(rng.sample(WORDS, 3)).title(),
+                        description=" ".join(rng.choices(WORDS, k=20)),
+                        sku=f"BENCH-{index:08d}",
+                        price=Decimal("9.99"),
+                        category=category,
+                    )
+                    for index in range(start, min(start + batch_size, total))
+                ]
+            )
+        self.stdout.write(f"Generated {total} products.")
+
+    def benchmark(self, queries, repeat):
+        base = Product.objects.filter(is_active=True)
+        fallback = BaseSearchBackend()
+        self.stdout.write(
+            f"{'query':<25} {'backend':<10} {'matches':>8} {'p50 ms':>9} {'max ms':>9}"
+        )
+        for query in queries:
+            terms = parse_terms(query)
+            runs = {
+                "index": lambda: search_products(base, query)[:20],
+                "icontains": lambda: fallback.search(base, terms).order_by("name", "id")[:20],
+            }
+            for label, run in runs.items():
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    list(run())
+                    timings.append((time.perf_counter() - started) * 1000)
+                if label == "index":
+                    matches = search_products(base, query).count()
+                else:
+                    matches = fallback.search(base, terms).count()
+                self.stdout.write(
+                    f"{query[:25]:<25} {label:<10} {matches:>8} "
+                    f"{statistics.median(timings):>9.2f} {max(timings):>9.2f}"
+                )
@@ -1,155 +1,424 @@
-from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from faker import Faker
 import random
+import time
+from datetime import timedelta
 from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from inventory import cache, rollups, stats
 from inventory.models import (
     Category,
     Supplier,
     Product,
     ProductSupplier,
     Inventory,
+    UserProfile,
     Cart,
     CartItem,
     Order,
     OrderItem,
+    StockMovement,
 )
 
-fake = Faker()
+STATUSES = [code for code, label in Order.STATUS_CHOICES]
+SHIPPED = {Order.STATUS_SHIPPED, Order.STATUS_DELIVERED, Order.STATUS_RETURNED}
+DELIVERED = {Order.STATUS_DELIVERED, Order.STATUS_RETURNED}
+CENT = Decimal("0.01")
+# Size of the pools of fake names, addresses and texts rows are drawn from
+POOL_SIZE = 1000
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
 class Command(BaseCommand):
-    help = "Seed database with sample data"
+    help = "Seed database with sample data, in bulk and at any scale"
+
+    def add_arguments(self, parser):
+        counts = parser.add_argument_group("row counts")
+        counts.add_argument("--users", type=int, default=10)
+        counts.add_argument("--categories", type=int, default=10)
+        counts.add_argument("--suppliers", type=int, default=10)
+        counts.add_argument("--products", type=int, default=20)
+        counts.add_argument(
+            "--suppliers-per-product", type=int, default=3, help="At most, per product"
+        )
+        counts.add_argument(
+            "--cart-items", type=int, default=5, help="At most, per user's cart"
+        )
+        counts.add_argument("--orders", type=int, default=15)
+        counts.add_argument(
+            "--items-per-order", type=int, default=5, help="At most, per order"
+        )
+
+        parser.add_argument(
+            "--days", type=int, default=365, help="Spread order dates over this many days"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=5000, help="Rows per INSERT batch"
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Random seed, for reproducible data sets"
+        )
+        parser.add_argument(
+            "--password",
+            default="password123",
+            help="Password of every seeded user, hashed once and shared",
+        )
+        parser.add_argument(
+            "--no-password",
+            action="store_true",
+            help="Give seeded users an unusable password instead",
+        )
+        parser.add_argument(
+            "--skip-rollups",
+            action="store_true",
+            help="Leave the sales rollups to a later 'sales_rollups --rebuild'",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.fake = Faker()
+        if options["seed"] is not None:
+            self.fake.seed_instance(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.make_pools()
 
-    def handle(self, *args, **kwargs):
         self.stdout.write("Seeding database...")
+        started = time.perf_counter()
+        if connection.vendor == "sqlite":
+            # Keep index pages in memory while millions of rows go in
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA cache_size = -262144")
 
-        self.create_users(10)
-        self.create_categories(10)
-        self.create_suppliers(10)
-        self.create_products(20)
-        self.create_product_suppliers()
-        self.create_inventories()
-        self.create_carts_and_items()
-        self.create_orders(15)
-        self.create_order_items()
-
-        self.stdout.write(self.style.SUCCESS("✅ Done seeding database!"))
-
-    def create_users(self, total):
-        for _ in range(total):
-            username = fake.unique.user_name()
-            email = fake.unique.email()
-            if not User.objects.filter(username=username).exists():
-                user = User.objects.create_user(
-                    username=username, email=email, password="password123"
-                )
-                user.first_name = fake.first_name()
-                user.last_name = fake.last_name()
-                user.save()
-                # create a cart for each user
-                Cart.objects.get_or_create(user=user)
+        password = make_password(None if options["no_password"] else options["password"])
+        user_ids = self.create_users(options["users"], password)
+        category_ids = self.create_categories(options["categories"])
+        supplier_ids = self.create_suppliers(options["suppliers"])
+        products = self.create_products(options["products"], category_ids)
+        self.create_product_suppliers(
+            products, supplier_ids, options["suppliers_per_product"]
+        )
+        self.create_inventories(products)
+        self.create_carts_and_items(products, options["cart_items"])
+        self.create_orders(
+            options["orders"], user_ids, products, options["items_per_order"], options["days"]
+        )
 
-    def create_categories(self, total):
-        for _ in range(total):
-            Category.objects.get_or_create(
-                name=fake.unique.word().title(),
-                defaults={"description": fake.text(max_nb_chars=100)},
-            )
+        # Raw inserts skip the signals behind the derived tables and caches
+        self.stdout.write("Rebuilding dashboard counters...")
+        stats.rebuild()
+        if not options["skip_rollups"]:
+            self.stdout.write("Rebuilding sales rollups...")
+            rollups.rebuild(progress=lambda done: self.progress("orders", done))
+            self.stdout.write("")
+        cache.bump_version()
 
-    def create_suppliers(self, total):
-        for _ in range(total):
-            Supplier.objects.get_or_create(
-                email=fake.unique.company_email(),
-                defaults={
-                    "name": fake.company(),
-                    "phone": fake.msisdn()[:15],
-                    "address": fake.address(),
-                },
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Done seeding database in {time.perf_counter() - started:.1f}s!"
             )
+        )
 
-    def create_products(self, total):
-        categories = list(Category.objects.all())
-        for _ in range(total):
-            Product.objects.get_or_create(
-                name=fake.unique.word().title(),
-                defaults={
-                    "category": random.choice(categories),
-                    "description": fake.text(max_nb_chars=200),
-                    "price": round(Decimal(random.uniform(5, 500)), 2),
-                    "sku": fake.unique.uuid4()[:12],
-                    "is_active": random.choice([True, True, True, False]),
-                },
-            )
+    def make_pools(self):
+        fake = self.fake
+        self.pools = {
+            "first_name": [fake.first_name() for _ in range(POOL_SIZE)],
+            "last_name": [fake.last_name() for _ in range(POOL_SIZE)],
+            "company": [fake.company() for _ in range(POOL_SIZE)],
+            "address": [fake.address() for _ in range(POOL_SIZE)],
+            "phone": [fake.msisdn()[:15] for _ in range(POOL_SIZE)],
+            "word": [fake.word() for _ in range(POOL_SIZE)],
+            "text": [fake.text(max_nb_chars=200) for _ in range(POOL_SIZE)],
+        }
+
+    def pick(self, pool):
+        return self.rng.choice(self.pools[pool])
+
+    def progress(self, label, done, total=None):
+        count = f"{done}/{total}" if total is not None else f"{done}"
+        self.stdout.write(f"  {label}: {count}", ending="\r")
+
+    def insert(self, model, fields, rows, total=None, report=True, keys=True):
+        """
+        Insert ``rows`` (tuples of ``fields`` values) with one executemany
+        per batch and return the new primary keys in order, or only how many
+        rows went in when ``keys`` is false.
+
+        Building model instances for bulk_create costs more than the INSERT
+        itself at this scale, so rows go to the database directly. Only
+        datetime and decimal values are adapted through their fields; the
+        remaining columns get their defaults, or the current time for
+        auto_now/auto_now_add fields. Primary keys are read back assuming
+        nothing else inserts into the table meanwhile.
+        """
+        # The real connection, not the thread-local proxy: values are
+        # adapted millions of times
+        db = connections[DEFAULT_DB_ALIAS]
+        opts = model._meta
+        given = [opts.get_field(name) for name in fields]
+        now = timezone.now()
+        defaults = []
+        for field in opts.concrete_fields:
+            if field.primary_key or field in given:
+                continue
+            auto = getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+            value = now if auto else field.get_default()
+            defaults.append((field, field.get_db_prep_save(value, db)))
+        adapted = [
+            (index, field)
+            for index, field in enumerate(given)
+            if isinstance(field, (models.DateTimeField, models.DecimalField))
+        ]
 
-    def create_product_suppliers(self):
-        products = list(Product.objects.all())
-        suppliers = list(Supplier.objects.all())
-        for product in products:
-            for supplier in random.sample(suppliers, random.randint(1, 3)):
-                ProductSupplier.objects.get_or_create(
-                    product=product,
-                    supplier=supplier,
-                    defaults={
-                        "supplier_price": round(Decimal(random.uniform(3, 400)), 2),
-                        "is_primary": random.choice([True, False]),
-                    },
+        quote = db.ops.quote_name
+        columns = [field.column for field in given] + [field.column for field, _ in defaults]
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            quote(opts.db_table),
+            ", ".join(quote(column) for column in columns),
+            ", ".join(["%s"] * len(columns)),
+        )
+        default_values = tuple(value for _, value in defaults)
+
+        label = opts.verbose_name_plural
+        last_id = model.objects.aggregate(last=Max("pk"))["last"] or 0
+        started = time.perf_counter()
+        done = 0
+        with transaction.atomic(), db.cursor() as cursor:
+            for batch in batched(rows, self.batch_size):
+                params = []
+                for row in batch:
+                    if adapted:
+                        row = list(row)
+                        for index, field in adapted:
+                            row[index] = field.get_db_prep_save(row[index], db)
+                    params.append((*row, *default_values))
+                cursor.executemany(sql, params)
+                done += len(batch)
+                if report:
+                    self.progress(label, done, total)
+        if report:
+            self.stdout.write(f"  {label}: {done} in {time.perf_counter() - started:.1f}s")
+        if not keys:
+            return done
+        return list(
+            model.objects.filter(pk__gt=last_id).order_by("pk").values_list("pk", flat=True)
+        )
+
+    def next_index(self, model):
+        """Offset keeping unique fields unique when seeding a non-empty database"""
+        return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+    def create_users(self, total, password):
+        offset = self.next_index(User)
+
+        def rows():
+            for index in range(offset, offset + total):
+                first_name = self.pick("first_name")
+                last_name = self.pick("last_name")
+                username = f"{first_name}.{last_name}{index}".lower()
+                yield username, f"{username}@example.com", password, first_name, last_name
+
+        user_ids = self.insert(
+            User, ["username", "email", "password", "first_name", "last_name"], rows(), total
+        )
+        # The profile and cart signals do not fire for raw inserts
+        self.insert(
+            UserProfile,
+            ["user", "phone", "address"],
+            ((user_id, self.pick("phone"), self.pick("address")) for user_id in user_ids),
+            total,
+        )
+        self.cart_ids = self.insert(Cart, ["user"], ((user_id,) for user_id in user_ids), total)
+        return user_ids
+
+    def create_categories(self, total):
+        offset = self.next_index(Category)
+        return self.insert(
+            Category,
+            ["name", "description"],
+            (
+                (f"{self.pick('word').title()} {index}", self.pick("text")[:100])
+                for index in range(offset, offset + total)
+            ),
+            total,
+        )
+
+    def create_suppliers(self, total):
+        offset = self.next_index(Supplier)
+        return self.insert(
+            Supplier,
+            ["name", "email", "phone", "address"],
+            (
+                (
+                    self.pick("company"),
+                    f"supplier{index}@example.com",
+                    self.pick("phone"),
+                    self.pick("address"),
                 )
+                for index in range(offset, offset + total)
+            ),
+            total,
+        )
 
-    def create_inventories(self):
-        for product in Product.objects.all():
-            Inventory.objects.get_or_create(
-                product=product,
-                defaults={
-                    "quantity": random.randint(0, 200),
-                    "reserved_quantity": random.randint(0, 20),
-                    "reorder_level": random.randint(5, 20),
-                },
-            )
+    def create_products(self, total, category_ids):
+        offset = self.next_index(Product)
+        prices = []
 
-    def create_carts_and_items(self):
-        users = User.objects.all()
-        products = list(Product.objects.all())
-        for user in users:
-            cart, _ = Cart.objects.get_or_create(user=user)
-            for _ in range(random.randint(1, 5)):
-                product = random.choice(products)
-                CartItem.objects.get_or_create(
-                    cart=cart,
-                    product=product,
-                    defaults={"quantity": random.randint(1, 5)},
+        def rows():
+            for index in range(offset, offset + total):
+                price = Decimal(self.rng.randint(500, 50000)) / 100
+                prices.append(price)
+                yield (
+                    " ".join(self.rng.sample(self.pools["word"], 2)).title(),
+                    self.rng.choice(category_ids),
+                    self.pick("text"),
+                    price,
+                    f"SKU-{index:09d}",
+                    self.rng.random() < 0.75,
                 )
 
-    def create_orders(self, total):
-        users = list(User.objects.all())
-        for _ in range(total):
-            user = random.choice(users)
-            Order.objects.create(
-                user=user,
-                status=random.choice([s[0] for s in Order.STATUS_CHOICES]),
-                shipping_address=fake.address(),
-                shipping_phone=fake.msisdn()[:15],
-                subtotal=0,
-                shipping_cost=round(Decimal(random.uniform(5, 20)), 2),
-                tax_amount=round(Decimal(random.uniform(2, 10)), 2),
-                total_amount=0,
-                notes=fake.text(max_nb_chars=50),
-            )
+        product_ids = self.insert(
+            Product,
+            ["name", "category", "description", "price", "sku", "is_active"],
+            rows(),
+            total,
+        )
+        return list(zip(product_ids, prices))
 
-    def create_order_items(self):
-        products = list(Product.objects.all())
-        for order in Order.objects.all():
-            subtotal = Decimal("0.00")
-            for _ in range(random.randint(1, 5)):
-                product = random.choice(products)
-                qty = random.randint(1, 5)
-                item = OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=qty,
-                    unit_price=product.price,
+    def create_product_suppliers(self, products, supplier_ids, per_product):
+        if not supplier_ids:
+            return
+
+        def rows():
+            for product_id, price in products:
+                count = self.rng.randint(1, min(per_product, len(supplier_ids)))
+                for supplier_id in self.rng.sample(supplier_ids, count):
+                    supplier_price = (price * self.rng.randint(50, 90) / 100).quantize(CENT)
+                    yield (
+                        product_id,
+                        supplier_id,
+                        max(supplier_price, CENT),
+                        self.rng.random() < 0.5,
+                    )
+
+        self.insert(
+            ProductSupplier, ["product", "supplier", "supplier_price", "is_primary"], rows()
+        )
+
+    def create_inventories(self, products):
+        rows = []
+        for product_id, price in products:
+            quantity = self.rng.randint(0, 200)
+            rows.append((
+                product_id,
+                quantity,
+                self.rng.randint(0, min(20, quantity)),
+                self.rng.randint(5, 20),
+            ))
+
+        self.insert(
+            Inventory,
+            ["product", "quantity", "reserved_quantity", "reorder_level"],
+            rows,
+            len(products),
+        )
+        # Opening balances, so the stock ledger adds up to the inventory
+        self.insert(
+            StockMovement,
+            ["product", "kind", "quantity_delta", "reserved_delta"],
+            (
+                (product_id, StockMovement.KIND_ADJUST, quantity, reserved)
+                for product_id, quantity, reserved, reorder_level in rows
+            ),
+            len(products),
+            keys=False,
+        )
+
+    def create_carts_and_items(self, products, per_cart):
+        if not products or per_cart < 1:
+            return
+
+        def rows():
+            for cart_id in self.cart_ids:
+                count = min(self.rng.randint(1, per_cart), len(products))
+                for product_id, price in self.rng.sample(products, count):
+                    yield cart_id, product_id, self.rng.randint(1, 5)
+
+        self.insert(CartItem, ["cart", "product", "quantity"], rows())
+
+    def create_orders(self, total, user_ids, products, per_order, days):
+        if not user_ids or not products:
+            return
+        offset = self.next_index(Order)
+        now = timezone.now()
+        started = time.perf_counter()
+        items_done = 0
+        order_fields = [
+            "user", "order_number", "status", "shipping_address", "shipping_phone",
+            "subtotal", "shipping_cost", "tax_amount", "total_amount",
+            "order_date", "updated_at", "shipped_date", "delivered_date",
+        ]
+
+        for start in range(0, total, self.batch_size):
+            orders = []
+            lines = []
+            for index in range(offset + start, offset + min(start + self.batch_size, total)):
+                order_lines = [
+                    (product_id, self.rng.randint(1, 5), price)
+                    for product_id, price in (
+                        self.rng.choice(products)
+                        for _ in range(self.rng.randint(1, max(per_order, 1)))
+                    )
+                ]
+                subtotal = sum(quantity * price for _, quantity, price in order_lines)
+                shipping_cost = Decimal(self.rng.randint(500, 2000)) / 100
+                tax_amount = Decimal(self.rng.randint(200, 1000)) / 100
+                status = self.rng.choice(STATUSES)
+                order_date = now - timedelta(seconds=self.rng.randint(0, days * 86400))
+                orders.append((
+                    self.rng.choice(user_ids),
+                    f"ORD-{index:09d}",
+                    status,
+                    self.pick("address"),
+                    self.pick("phone"),
+                    subtotal,
+                    shipping_cost,
+                    tax_amount,
+                    subtotal + shipping_cost + tax_amount,
+                    order_date,
+                    order_date,
+                    order_date + timedelta(days=1) if status in SHIPPED else None,
+                    order_date + timedelta(days=3) if status in DELIVERED else None,
+                ))
+                lines.append(order_lines)
+
+            with transaction.atomic():
+                order_ids = self.insert(Order, order_fields, orders, report=False)
+                items_done += self.insert(
+                    OrderItem,
+                    ["order", "product", "quantity", "unit_price"],
+                    (
+                        (order_id, product_id, quantity, price)
+                        for order_id, order_lines in zip(order_ids, lines)
+                        for product_id, quantity, price in order_lines
+                    ),
+                    report=False,
+                    keys=False,
                 )
-                subtotal += item.total_price
-            order.subtotal = subtotal
-            order.total_amount = subtotal + order.shipping_cost + order.tax_amount
-            order.save()
+            self.progress("orders", start + len(orders), f"{total} ({items_done} order items)")
+
+        self.stdout.write(
+            f"  orders: {total} with {items_done} order items "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import ledger
+
+# Drifted products listed in the report
+SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = "Snapshot the stock ledger, rebuild a product's stock from it or reconcile it with the inventory"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--snapshot",
+            action="store_true",
+            help="Snapshot the products that moved since their last snapshot",
+        )
+        parser.add_argument(
+            "--level",
+            type=int,
+            metavar="PRODUCT_ID",
+            help="Rebuild the stock of a product from its snapshot and movements",
+        )
+        parser.add_argument(
+            "--reconcile",
+            action="store_true",
+            help="Compare the ledger with the inventory and report the differences",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="With --reconcile, record the differences as adjustments",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=ledger.CHUNK_SIZE,
+            help="Products checked per query",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Chunks checked at the same time"
+        )
+
+    def handle(self, *args, **options):
+        if options["fix"] and not options["reconcile"]:
+            raise CommandError("--fix only applies to --reconcile.")
+        if not (options["snapshot"] or options["reconcile"] or options["level"] is not None):
+            self.stdout.write("Nothing to do; pass --snapshot, --level or --reconcile.")
+            return
+
+        if options["snapshot"]:
+            taken = ledger.take_snapshots(
+                chunk_size=options["chunk_size"],
+                progress=lambda done: self.stdout.write(f"  up to product {done}", ending="\r"),
+            )
+            self.stdout.write("")
+            self.stdout.write(self.style.SUCCESS(f"Took {taken} stock snapshots."))
+
+        if options["level"] is not None:
+            quantity, reserved = ledger.level(options["level"])
+            self.stdout.write(
+                f"Product {options['level']}: {quantity} on hand, {reserved} reserved"
+            )
+
+        if options["reconcile"]:
+            self.reconcile(options)
+
+    def reconcile(self, options):
+        drifted = ledger.reconcile(
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+            progress=lambda done, total: self.stdout.write(
+                f"  {done}/{total} chunks", ending="\r"
+            ),
+        )
+        self.stdout.write("")
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("The ledger matches the inventory."))
+            return
+
+        for product_id, quantity, reserved, ledger_quantity, ledger_reserved in drifted[:SHOWN]:
+            self.stdout.write(self.style.WARNING(
+                f"Product {product_id}: inventory {quantity} on hand, {reserved} reserved; "
+                f"ledger {ledger_quantity} on hand, {ledger_reserved} reserved"
+            ))
+        if len(drifted) > SHOWN:
+            self.stdout.write(f"... and {len(drifted) - SHOWN} more.")
+
+        if options["fix"]:
+            adjusted = ledger.adjust([row[0] for row in drifted])
+            self.stdout.write(self.style.SUCCESS(f"Recorded {len(adjusted)} adjustments."))
+        else:
+            self.stdout.write(f"{len(drifted)} products differ; pass --fix to adjust the ledger.")
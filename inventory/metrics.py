@@ -0,0 +1,329 @@
+# metrics.py
+"""
+In-process metrics registry with a Prometheus text exposition.
+
+Counters, gauges and histograms are declared at module level (see the end
+of this file) and updated in place by the views, e.g.
+``CHECKOUTS.inc(channel='api', outcome='placed')``. ``exposition()``
+renders every metric in the Prometheus text format for ``/metrics``.
+
+Under gunicorn each worker is its own process, so a worker only knows
+about the requests it served. When ``settings.METRICS_DIR`` is set every
+process writes its samples to a file of its own in that directory
+(``flush``): from a timer thread at most every ``METRICS_FLUSH_INTERVAL``
+seconds after they change, never on the request path, and once more at
+exit. A scrape flushes the scraping process and adds up the files of all
+workers, including workers that have since exited so counters never go
+backwards.
+Empty the directory when the application is deployed. Gauges computed by
+a function are evaluated by the scraping process only.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+CHECKOUT_PLACED = 'placed'
+CHECKOUT_EMPTY_CART = 'empty_cart'
+CHECKOUT_INSUFFICIENT_STOCK = 'insufficient_stock'
+CHECKOUT_CONFLICT = 'conflict'
+
+# Seconds, for request latencies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_metrics = []
+# ``timer_pid`` is the process whose flush timer is pending: threads do not
+# survive a fork, so a worker forked with a pending timer starts its own
+_state = {'dirty': False, 'pid': None, 'path': None, 'timer_pid': None}
+
+
+def get_directory():
+    directory = getattr(settings, 'METRICS_DIR', None)
+    return Path(directory) if directory else None
+
+
+def get_flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        with _lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes the labels {", ".join(self.labelnames)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _update(self, labels, change):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = change(self.values.get(key))
+            _state['dirty'] = True
+            _schedule_flush()
+
+    def merge(self, total, value):
+        return (total or 0) + value
+
+    def samples(self, values):
+        """(suffix, label pairs, value) tuples for the exposition"""
+        for key, value in sorted(values.items()):
+            yield '', list(zip(self.labelnames, key)), value
+
+    def render(self, values):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+        for suffix, pairs, value in self.samples(values):
+            lines.append(f'{self.name}{suffix}{_format_labels(pairs)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only go up')
+        self._update(labels, lambda value: (value or 0) + amount)
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. Set values are summed over the workers;
+    a gauge given a ``function`` (without labels) is computed at scrape time.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        self._update(labels, lambda current: value)
+
+    def inc(self, amount=1, **labels):
+        self._update(labels, lambda value: (value or 0) + amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        index = bisect_left(self.buckets, value)
+
+        def change(current):
+            # Per-bucket counts (the last one past every bound), then the sum
+            current = current or [0] * (len(self.buckets) + 1) + [0]
+            current[index] += 1
+            current[-1] += value
+            return current
+
+        self._update(labels, change)
+
+    def merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [left + right for left, right in zip(total, value)]
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), value[:-1]):
+                cumulative += count
+                yield '_bucket', pairs + [('le', _format_value(float(bound)))], cumulative
+            yield '_sum', pairs, value[-1]
+            yield '_count', pairs, cumulative
+
+
+def _snapshot():
+    with _lock:
+        _state['dirty'] = False
+        return {
+            metric.name: {
+                json.dumps(key): value.copy() if isinstance(value, list) else value
+                for key, value in metric.values.items()
+            }
+            for metric in _metrics
+            if metric.values
+        }
+
+
+def _schedule_flush():
+    """Start the timer flushing this process' samples, unless it is pending; call with _lock held"""
+    pid = os.getpid()
+    if _state['timer_pid'] == pid or get_directory() is None:
+        return
+    _state['timer_pid'] = pid
+    timer = threading.Timer(get_flush_interval(), _timed_flush)
+    timer.daemon = True
+    timer.start()
+
+
+def _timed_flush():
+    with _lock:
+        _state['timer_pid'] = None
+    flush()
+
+
+def flush(force=False):
+    """Write this process' samples to METRICS_DIR, if set and anything changed"""
+    directory = get_directory()
+    if directory is None or not (force or _state['dirty']):
+        return
+    pid = os.getpid()
+    if _state['pid'] != pid:
+        # Named once per process, so a recycled pid never takes over the
+        # file of an exited worker
+        _state['pid'] = pid
+        _state['path'] = directory / f'{pid}-{time.time_ns()}.json'
+    directory.mkdir(parents=True, exist_ok=True)
+    path = _state['path']
+    temporary = path.with_suffix(f'.{threading.get_ident()}.tmp')
+    temporary.write_text(json.dumps(_snapshot()))
+    os.replace(temporary, path)
+
+
+# Samples changed since the last timed flush are not lost with the process
+atexit.register(flush)
+
+
+def _collect():
+    """Samples per metric name, added up over every worker's file"""
+    directory = get_directory()
+    if directory is None:
+        with _lock:
+            return {
+                metric.name: {
+                    key: value.copy() if isinstance(value, list) else value
+                    for key, value in metric.values.items()
+                }
+                for metric in _metrics
+            }
+
+    flush(force=True)
+    by_name = {metric.name: metric for metric in _metrics}
+    totals = {}
+    for path in directory.glob('*.json'):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            # Being replaced or removed right now
+            continue
+        for name, samples in data.items():
+            metric = by_name.get(name)
+            if metric is None:
+                continue
+            merged = totals.setdefault(name, {})
+            for key, value in samples.items():
+                key = tuple(json.loads(key))
+                merged[key] = metric.merge(merged.get(key), value)
+    return totals
+
+
+def exposition():
+    """Every metric in the Prometheus text format"""
+    collected = _collect()
+    lines = []
+    for metric in list(_metrics):
+        values = collected.get(metric.name, {})
+        if getattr(metric, 'function', None) is not None:
+            values = {(): metric.function()}
+        lines.extend(metric.render(values))
+    return '\n'.join(lines) + '\n'
+
+
+def record_checkout(channel, outcome, lines=0):
+    """Count a checkout attempt; ``outcome`` is one of the CHECKOUT_* values"""
+    CHECKOUTS.inc(channel=channel, outcome=outcome)
+    if outcome in (CHECKOUT_INSUFFICIENT_STOCK, CHECKOUT_CONFLICT):
+        RESERVATION_FAILURES.inc(reason=outcome)
+    elif outcome == CHECKOUT_PLACED:
+        CHECKOUT_CART_LINES.observe(lines, channel=channel)
+
+
+def _low_stock_products():
+    from . import stats
+
+    return stats.dashboard()[stats.LOW_STOCK_PRODUCTS]
+
+
+REQUEST_DURATION = Histogram(
+    'inventory_http_request_duration_seconds',
+    'Time spent serving requests, by view',
+    ['view', 'method', 'status'],
+)
+CHECKOUTS = Counter(
+    'inventory_checkouts_total',
+    'Checkout attempts by channel (api, web) and outcome',
+    ['channel', 'outcome'],
+)
+CHECKOUT_CART_LINES = Histogram(
+    'inventory_checkout_cart_lines',
+    'Number of cart lines turned into an order',
+    ['channel'],
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100),
+)
+RESERVATION_FAILURES = Counter(
+    'inventory_stock_reservation_failures_total',
+    'Checkouts refused while reserving stock, by reason',
+    ['reason'],
+)
+ORDER_STATUS_CHANGES = Counter(
+    'inventory_order_status_changes_total',
+    'Orders moved from one status to another',
+    ['previous', 'status'],
+)
+CART_ITEMS_ADDED = Counter(
+    'inventory_cart_items_added_total',
+    'Products put in a cart by channel (api, web), as a new line or merged into an existing one',
+    ['channel', 'outcome'],
+)
+LOW_STOCK_PRODUCTS = Gauge(
+    'inventory_low_stock_products',
+    'Products whose stock is at or below their reorder level',
+    function=_low_stock_products,
+)
@@ -1,6 +1,9 @@
 from django.db import models
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
 
 
@@ -52,6 +55,22 @@ class Product(models.Model):
 
     class Meta:
         ordering = ["name"]
+        indexes = [
+            # Keyset pagination of the public catalog, all of it or by
+            # category; partial, so inactive products take no room in them.
+            # Every catalog list filters on is_active, so a full (name, id)
+            # index would only be written, never read.
+            models.Index(
+                fields=["name", "id"],
+                condition=Q(is_active=True),
+                name="product_active_name_idx",
+            ),
+            models.Index(
+                fields=["category", "name", "id"],
+                condition=Q(is_active=True),
+                name="product_active_category_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -82,6 +101,19 @@ class ProductSupplier(models.Model):
         return f"{self.product.name} - {self.supplier.name}"
 
 
+def _signed(field):
+    # MySQL computes with unsigned columns as unsigned and fails below zero
+    return Cast(field, models.BigIntegerField())
+
+
+# Available stock plus the stock on its way, less the reorder level; zero
+# or less means the product needs replenishing
+REORDER_HEADROOM = (
+    _signed("quantity") - _signed("reserved_quantity")
+    + _signed("incoming_quantity") - _signed("reorder_level")
+)
+
+
 class Inventory(models.Model):
     product = models.OneToOneField(
         Product, on_delete=models.CASCADE, related_name="inventory"
@@ -89,10 +121,30 @@ class Inventory(models.Model):
     quantity = models.PositiveIntegerField(default=0)
     reserved_quantity = models.PositiveIntegerField(default=0)
     reorder_level = models.PositiveIntegerField(default=10)
+    # Ordered from suppliers and not received yet, see replenishment.py
+    incoming_quantity = models.PositiveIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = "Inventories"
+        indexes = [
+            # Lets replenishment find the few products to reorder among
+            # millions with a range scan
+            models.Index(REORDER_HEADROOM, name="inventory_reorder_headroom_idx"),
+            # Only the low-stock rows, which the dashboard counts
+            models.Index(
+                fields=["product"],
+                condition=Q(quantity__lte=F("reorder_level")),
+                name="inventory_low_stock_idx",
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(reserved_quantity__lte=F("quantity")),
+                name="inventory_reserved_lte_quantity",
+                violation_error_message="Reserved quantity cannot exceed the quantity in stock.",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.available_quantity} available"
@@ -116,20 +168,40 @@ class UserProfile(models.Model):
         return f"{self.user.get_full_name() or self.user.username}'s Profile"
 
 
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Compute item count and price of each cart in the database"""
+        return self.annotate(
+            items_quantity=Coalesce(Sum("items__quantity"), 0),
+            items_price=Coalesce(
+                Sum(F("items__quantity") * F("items__product__price")),
+                Value(Decimal("0.00")),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="cart")
     created_at = models.DateTimeField(auto_now=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart for {self.user.username}"
 
     @property
     def total_items(self):
+        # Use the aggregate from CartQuerySet.with_totals() when available
+        if hasattr(self, "items_quantity"):
+            return self.items_quantity
         return sum(item.quantity for item in self.items.all())
 
     @property
     def total_price(self):
+        if hasattr(self, "items_price"):
+            return self.items_price
         return sum(item.total_price for item in self.items.all())
 
 
@@ -142,6 +214,11 @@ class CartItem(models.Model):
 
     class Meta:
         unique_together = ("cart", "product")
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(quantity__gte=1), name="cart_item_quantity_positive"
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -153,6 +230,23 @@ class CartItem(models.Model):
         return self.quantity * self.product.price
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_total_items(self):
+        """Count the units in each order in the database"""
+        # A correlated subquery rather than a JOIN and GROUP BY: only the
+        # orders of the page are summed, and they are still read in index
+        # order rather than all grouped and sorted first
+        units = (
+            OrderItem.objects.filter(order=OuterRef("pk"))
+            .values("order")
+            .annotate(units=Sum("quantity"))
+            .values("units")
+        )
+        return self.annotate(
+            items_quantity=Coalesce(Subquery(units), 0, output_field=models.IntegerField())
+        )
+
+
 class Order(models.Model):
     STATUS_PENDING = "P"
     STATUS_CONFIRMED = "C"
@@ -172,6 +266,22 @@ class Order(models.Model):
         (STATUS_RETURNED, "Returned"),
     ]
 
+    # Statuses each status may move to
+    STATUS_TRANSITIONS = {
+        STATUS_PENDING: {
+            STATUS_CONFIRMED, STATUS_PROCESSING, STATUS_SHIPPED,
+            STATUS_DELIVERED, STATUS_CANCELLED,
+        },
+        STATUS_CONFIRMED: {
+            STATUS_PROCESSING, STATUS_SHIPPED, STATUS_DELIVERED, STATUS_CANCELLED,
+        },
+        STATUS_PROCESSING: {STATUS_SHIPPED, STATUS_DELIVERED, STATUS_CANCELLED},
+        STATUS_SHIPPED: {STATUS_DELIVERED, STATUS_CANCELLED},
+        STATUS_DELIVERED: {STATUS_RETURNED},
+        STATUS_CANCELLED: set(),
+        STATUS_RETURNED: set(),
+    }
+
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, null=True, related_name="orders"
     )
@@ -193,7 +303,7 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
     # Timestamps
-    order_date = models.DateTimeField(auto_now=True)
+    order_date = models.DateTimeField(auto_now_add=True)
     shipped_date = models.DateTimeField(blank=True, null=True)
     delivered_date = models.DateTimeField(blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -201,8 +311,28 @@ class Order(models.Model):
     # Notes
     notes = models.TextField(blank=True, null=True)
 
+    # Whether the sales rollups include the order yet, see rollups.py
+    rolled_up = models.BooleanField(default=False, db_default=False, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ["-order_date"]
+        indexes = [
+            # Keyset pagination of the admin and per-user order lists
+            models.Index(fields=["-order_date", "-id"], name="order_date_id_idx"),
+            models.Index(
+                fields=["user", "-order_date", "-id"], name="order_user_date_id_idx"
+            ),
+            # The admin order list filtered by status
+            models.Index(
+                fields=["status", "-order_date", "-id"], name="order_status_date_id_idx"
+            ),
+            # The few orders still to be added to the sales rollups
+            models.Index(
+                fields=["id"], condition=Q(rolled_up=False), name="order_not_rolled_up_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"Order {self.order_number} by {self.user.username} - Status: {self.get_status_display()}"
@@ -216,6 +346,9 @@ class Order(models.Model):
 
     @property
     def total_items(self):
+        # Use the aggregate from OrderQuerySet.with_total_items() when available
+        if hasattr(self, "items_quantity"):
+            return self.items_quantity
         return sum(item.quantity for item in self.items.all())
 
 
@@ -228,6 +361,13 @@ class OrderItem(models.Model):
     )  # Price at time of order
     created_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(quantity__gte=1), name="order_item_quantity_positive"
+            ),
+        ]
+
     def __str__(self):
         return (
             f"{self.quantity} x {self.product.name} in Order {self.order.order_number}"
@@ -238,6 +378,231 @@ class OrderItem(models.Model):
         return self.quantity * self.unit_price
 
 
+class StatCounter(models.Model):
+    """A dashboard figure kept up to date incrementally, see stats.py"""
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class SalesRollup(models.Model):
+    """Sales figures of one reporting bucket, maintained by rollups.py"""
+
+    # Placed orders, less cancellations and returns
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Delivered orders, less returns
+    delivered_orders = models.PositiveIntegerField(default=0)
+    delivered_units = models.PositiveIntegerField(default=0)
+    delivered_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+    date = models.DateField(unique=True)
+
+    class Meta:
+        ordering = ["date"]
+        verbose_name_plural = "Daily sales"
+
+    def __str__(self):
+        return f"{self.date}: {self.orders} orders, {self.revenue}"
+
+
+class ProductDailySales(SalesRollup):
+    date = models.DateField()
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="daily_sales"
+    )
+
+    class Meta:
+        unique_together = ("date", "product")
+        verbose_name_plural = "Product daily sales"
+
+    def __str__(self):
+        return f"{self.date} {self.product_id}: {self.units} units"
+
+
+class CategoryDailySales(SalesRollup):
+    date = models.DateField()
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="daily_sales"
+    )
+
+    class Meta:
+        unique_together = ("date", "category")
+        verbose_name_plural = "Category daily sales"
+
+    def __str__(self):
+        return f"{self.date} {self.category_id}: {self.units} units"
+
+
+class PurchaseOrder(models.Model):
+    """Stock ordered from a supplier, created by replenishment.py"""
+
+    STATUS_OPEN = "O"
+    STATUS_RECEIVED = "R"
+    STATUS_CANCELLED = "CA"
+
+    STATUS_CHOICES = [
+        (STATUS_OPEN, "Open"),
+        (STATUS_RECEIVED, "Received"),
+        (STATUS_CANCELLED, "Cancelled"),
+    ]
+
+    supplier = models.ForeignKey(
+        Supplier, on_delete=models.PROTECT, related_name="purchase_orders"
+    )
+    status = models.CharField(max_length=2, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    total_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    received_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="purchase_order_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"PO-{self.pk} to {self.supplier.name} - Status: {self.get_status_display()}"
+
+
+class PurchaseOrderItem(models.Model):
+    purchase_order = models.ForeignKey(
+        PurchaseOrder, on_delete=models.CASCADE, related_name="items"
+    )
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="purchase_order_items"
+    )
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        unique_together = ("purchase_order", "product")
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(quantity__gte=1), name="purchase_order_item_quantity_positive"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} in PO-{self.purchase_order_id}"
+
+    @property
+    def total_cost(self):
+        return self.quantity * self.unit_cost
+
+
+class StockMovement(models.Model):
+    """One change to the stock of a product, appended by ledger.py"""
+
+    KIND_RESERVE = "reserve"
+    KIND_RELEASE = "release"
+    KIND_SELL = "sell"
+    KIND_RECEIVE = "receive"
+    KIND_ADJUST = "adjust"
+
+    KIND_CHOICES = [
+        (KIND_RESERVE, "Reserve"),
+        (KIND_RELEASE, "Release"),
+        (KIND_SELL, "Sell"),
+        (KIND_RECEIVE, "Receive"),
+        (KIND_ADJUST, "Adjust"),
+    ]
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="stock_movements"
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Changes to Inventory.quantity and Inventory.reserved_quantity
+    quantity_delta = models.IntegerField(default=0)
+    reserved_delta = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Movements of a product after its latest snapshot
+            models.Index(fields=["product", "id"], name="stock_movement_product_idx"),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.get_kind_display()} {self.product_id}: "
+            f"{self.quantity_delta:+} on hand, {self.reserved_delta:+} reserved"
+        )
+
+
+class StockSnapshot(models.Model):
+    """Stock of a product as of a ledger movement, taken by ledger.py"""
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="stock_snapshots"
+    )
+    # The last StockMovement id included
+    movement_id = models.BigIntegerField()
+    quantity = models.IntegerField()
+    reserved_quantity = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("product", "movement_id")
+
+    def __str__(self):
+        return (
+            f"{self.product_id} at movement {self.movement_id}: "
+            f"{self.quantity} on hand, {self.reserved_quantity} reserved"
+        )
+
+
+class Job(models.Model):
+    """A unit of background work, run by "manage.py run_jobs", see jobs.py"""
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    # Enqueueing a job whose key exists already does nothing
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_at"])]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
 # Signal to create user profile and cart automatically
 from django.db.models.signals import post_save
 from django.dispatch import receiver
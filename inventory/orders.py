@@ -0,0 +1,98 @@
+# orders.py
+"""
+Order status transitions applied to many orders at once.
+
+Inventory settlement is aggregated across all orders in the batch, so
+delivering or cancelling thousands of orders costs one UPDATE per batch of
+affected products rather than one save per line item.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics, rollups, stats, stock
+from .models import Order
+
+# Number of orders read or written per statement
+BATCH_SIZE = 500
+
+OUTCOME_UPDATED = 'updated'
+OUTCOME_UNCHANGED = 'unchanged'
+OUTCOME_NOT_FOUND = 'not_found'
+OUTCOME_INVALID = 'invalid_transition'
+
+
+def settle_inventory(order_ids, new_status):
+    """Apply the inventory side effects of moving ``order_ids`` to ``new_status``"""
+    if new_status == Order.STATUS_DELIVERED:
+        # Move reserved inventory to sold (reduce actual quantity)
+        stock.fulfil(stock.order_lines(order_ids))
+    elif new_status == Order.STATUS_CANCELLED:
+        # Release reserved inventory
+        stock.release(stock.order_lines(order_ids))
+
+
+@transaction.atomic
+def bulk_transition(order_ids, new_status):
+    """
+    Move ``order_ids`` to ``new_status`` in one transaction.
+
+    Returns one outcome per requested order: ``updated``, ``unchanged``
+    (already in that status), ``not_found`` or ``invalid_transition``.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    current = {}
+    for start in range(0, len(order_ids), BATCH_SIZE):
+        current.update(
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids[start:start + BATCH_SIZE])
+            .values_list('pk', 'status')
+        )
+
+    results = []
+    moving = []
+    for order_id in order_ids:
+        old_status = current.get(order_id)
+        if old_status is None:
+            outcome = OUTCOME_NOT_FOUND
+        elif old_status == new_status:
+            outcome = OUTCOME_UNCHANGED
+        elif new_status not in Order.STATUS_TRANSITIONS[old_status]:
+            outcome = OUTCOME_INVALID
+        else:
+            outcome = OUTCOME_UPDATED
+            moving.append(order_id)
+        results.append({'id': order_id, 'previous_status': old_status, 'outcome': outcome})
+
+    if moving:
+        settle_inventory(moving, new_status)
+
+        now = timezone.now()
+        changes = {'status': new_status, 'updated_at': now}
+        if new_status == Order.STATUS_SHIPPED:
+            changes['shipped_date'] = now
+        elif new_status == Order.STATUS_DELIVERED:
+            changes['delivered_date'] = now
+        for start in range(0, len(moving), BATCH_SIZE):
+            Order.objects.filter(pk__in=moving[start:start + BATCH_SIZE]).update(**changes)
+
+        # The bulk update skips the model signals behind the dashboard counters
+        was_pending = sum(current[order_id] == Order.STATUS_PENDING for order_id in moving)
+        is_pending = len(moving) if new_status == Order.STATUS_PENDING else 0
+        stats.adjust(**{stats.PENDING_ORDERS: is_pending - was_pending})
+
+        by_status = {}
+        for order_id in moving:
+            by_status.setdefault(current[order_id], []).append(order_id)
+        for old_status, order_ids in by_status.items():
+            rollups.record_transition(order_ids, old_status, new_status)
+
+        def count_changes():
+            for old_status, order_ids in by_status.items():
+                metrics.ORDER_STATUS_CHANGES.inc(
+                    len(order_ids), previous=old_status, status=new_status
+                )
+
+        # Counted once the orders are committed, not when they may still roll back
+        transaction.on_commit(count_changes)
+
+    return results
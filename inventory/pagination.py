@@ -0,0 +1,153 @@
+# pagination.py
+"""
+Keyset (seek) pagination for the list APIs.
+
+Instead of OFFSET, each page continues from the ordering values of the last
+row it returned, so the database seeks straight into an index and page
+10,000 costs the same as page 1. The ordering must end with a unique
+column (``id``) so rows sharing the same leading values keep a stable order.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_rows(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views, fetching the page with the async ORM"""
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.paginate_rows([row async for row in queryset])
+
+    def get_page_queryset(self, queryset, request, view):
+        """The rows of the requested page, plus one telling whether more follow"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+        self.cursor = self.decode_cursor(request)
+
+        self.reverse = False
+        if self.cursor is not None:
+            values, self.reverse = self.cursor
+            try:
+                queryset = queryset.filter(self.seek_condition(values, self.reverse))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self.flip(field) for field in ordering]
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def paginate_rows(self, rows):
+        reverse = self.reverse
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Going forwards there is a previous page whenever we came from a
+        # cursor; going backwards there is always a next page
+        has_next = True if reverse else has_more
+        has_previous = has_more if reverse else self.cursor is not None
+        self.next_values = self.previous_values = None
+        if rows and has_next:
+            self.next_values = self.row_values(rows[-1])
+        if rows and has_previous:
+            self.previous_values = self.row_values(rows[0])
+        return rows
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_link(self.next_values, reverse=False),
+            'previous': self.get_link(self.previous_values, reverse=True),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return tuple(view.get_keyset_ordering())
+        return tuple(view.keyset_ordering)
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    def seek_condition(self, values, reverse):
+        """
+        Rows strictly after ``values`` in the current ordering, written as
+        ``a >= x AND (a > x OR (a = x AND b > y) ...)`` so the leading
+        column can still be used as an index range.
+        """
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        def lookup(field, strict):
+            descending = field.startswith('-') != reverse
+            name = field.lstrip('-')
+            return name + ('__lt' if descending else '__gt') + ('' if strict else 'e')
+
+        first = self.ordering[0]
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            step = Q(**{lookup(field, strict=True): values[index]})
+            for previous, value in zip(self.ordering[:index], values):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return Q(**{lookup(first, strict=False): values[0]}) & condition
+
+    def row_values(self, row):
+        return [self.encode_value(getattr(row, field.lstrip('-'))) for field in self.ordering]
+
+    @staticmethod
+    def encode_value(value):
+        if isinstance(value, (datetime, date)):
+            # Keep full microsecond precision so no row is skipped
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def get_link(self, values, reverse):
+        if values is None:
+            return None
+        payload = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        token = urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            return list(payload['v']), bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
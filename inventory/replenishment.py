@@ -0,0 +1,196 @@
+# replenishment.py
+"""
+Automatic replenishment of low stock from suppliers.
+
+``replenish`` finds the active products whose available stock, plus the
+stock already on its way, is at or below their reorder level: a range scan
+of the ``REORDER_HEADROOM`` expression index on Inventory. Each product is
+ordered from its primary supplier, or else its cheapest one, and gets
+enough to reach ``target_factor`` times its reorder level. The lines are
+grouped into one open PurchaseOrder per supplier.
+
+The products are read and ordered ``batch_size`` at a time, in product id
+order with each page starting after the last product seen, and each batch
+is written in a transaction of its own, so memory and the time the write lock is held
+stay bounded whatever the number of SKUs, and an interrupted run keeps the
+batches it committed. Ordered units go to ``Inventory.incoming_quantity``,
+so neither a later batch nor the next run orders them again. ``receive`` moves them to the stock on
+hand when the delivery arrives, and ``cancel`` drops them.
+
+Run it with ``manage.py replenish``.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from . import stock
+from .models import (
+    REORDER_HEADROOM, Inventory, ProductSupplier, PurchaseOrder, PurchaseOrderItem
+)
+from .signals import stock_changed
+
+# Products read per page, and purchase order lines per INSERT
+BATCH_SIZE = 2000
+
+# Stock is ordered up to this multiple of the reorder level
+TARGET_FACTOR = 2
+
+
+class PurchaseOrderClosed(Exception):
+    """Raised when receiving or cancelling a purchase order that is not open"""
+
+
+def _best_supplier():
+    return ProductSupplier.objects.filter(product_id=OuterRef('product_id')).order_by(
+        '-is_primary', 'supplier_price', 'supplier_id'
+    )
+
+
+def candidates():
+    """Inventories of active products to replenish, with the supplier to order from"""
+    best = _best_supplier()
+    return (
+        Inventory.objects
+        .alias(headroom=REORDER_HEADROOM)
+        .filter(headroom__lte=0, product__is_active=True)
+        .annotate(
+            best_supplier_id=Subquery(best.values('supplier_id')[:1]),
+            unit_cost=Subquery(best.values('supplier_price')[:1]),
+        )
+    )
+
+
+def order_quantity(quantity, reserved, incoming, reorder_level, target_factor=TARGET_FACTOR):
+    """Units to order to bring a product up to ``target_factor`` reorder levels"""
+    return max(reorder_level * target_factor - (quantity - reserved + incoming), 1)
+
+
+def _add_incoming(line_ids):
+    """Count the purchase order lines ``line_ids`` as incoming stock"""
+    lines = PurchaseOrderItem.objects.filter(pk__in=line_ids)
+    ordered = (
+        lines.filter(product_id=OuterRef('product_id'))
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    # Filtered on the ordered product ids rather than through a join,
+    # which would scan every inventory row
+    Inventory.objects.filter(product_id__in=lines.values('product_id')).update(
+        incoming_quantity=F('incoming_quantity') + Subquery(ordered), updated_at=timezone.now()
+    )
+
+
+def _pages(rows, size):
+    """
+    ``rows`` ``size`` at a time, keyed on the product id they start with;
+    every page is a fresh query that picks up after the last product seen
+    """
+    rows = rows.order_by('product_id')
+    page = list(rows[:size])
+    while page:
+        yield page
+        page = list(rows.filter(product_id__gt=page[-1][0])[:size])
+
+
+@transaction.atomic
+def _write(lines, costs):
+    """
+    Save one batch of lines with the incoming stock, and add ``costs``, pairs
+    of purchase order and the cost of its lines, to the orders' totals
+    """
+    for purchase_order, cost in costs:
+        if purchase_order.pk is None:
+            purchase_order.total_cost = cost
+            purchase_order.save()
+        else:
+            PurchaseOrder.objects.filter(pk=purchase_order.pk).update(
+                total_cost=F('total_cost') + cost
+            )
+    PurchaseOrderItem.objects.bulk_create(lines)
+    _add_incoming([line.pk for line in lines])
+
+
+def replenish(target_factor=TARGET_FACTOR, dry_run=False, batch_size=BATCH_SIZE, progress=None):
+    """
+    Order every product that needs it and return a summary of the purchase
+    orders. ``dry_run`` only works out what would be ordered.
+    """
+    rows = (
+        candidates()
+        .filter(best_supplier_id__isnull=False)
+        .values_list(
+            'product_id', 'quantity', 'reserved_quantity', 'incoming_quantity',
+            'reorder_level', 'best_supplier_id', 'unit_cost',
+        )
+    )
+    summary = {
+        'purchase_orders': 0,
+        'lines': 0,
+        'units': 0,
+        'total_cost': Decimal('0.00'),
+        'without_supplier': candidates().filter(best_supplier_id__isnull=True).count(),
+    }
+    # The purchase order of this run per supplier
+    purchase_orders = {}
+
+    # Each batch is committed before the next page is read, so the write
+    # lock is never held for the whole scan, and since the pages only move
+    # forward a product still low after its order is not ordered twice
+    for batch in _pages(rows, batch_size):
+        lines = []
+        costs = {}
+        for product_id, quantity, reserved, incoming, reorder_level, supplier_id, unit_cost in batch:
+            if supplier_id not in purchase_orders:
+                purchase_orders[supplier_id] = PurchaseOrder(supplier_id=supplier_id)
+            purchase_order = purchase_orders[supplier_id]
+            units = order_quantity(quantity, reserved, incoming, reorder_level, target_factor)
+            # Backends may return the subquery's price with more decimal places
+            unit_cost = Decimal(unit_cost).quantize(Decimal('0.01'))
+            lines.append(PurchaseOrderItem(
+                purchase_order=purchase_order,
+                product_id=product_id,
+                quantity=units,
+                unit_cost=unit_cost,
+            ))
+            costs[supplier_id] = costs.get(supplier_id, Decimal('0.00')) + units * unit_cost
+            summary['units'] += units
+        summary['lines'] += len(lines)
+        summary['total_cost'] += sum(costs.values())
+        if not dry_run:
+            _write(lines, [(purchase_orders[supplier_id], cost) for supplier_id, cost in costs.items()])
+        if progress:
+            progress(summary['lines'])
+
+    summary['purchase_orders'] = len(purchase_orders)
+    if purchase_orders and not dry_run:
+        # Too many products may have changed to list them
+        stock_changed.send(sender=Inventory, product_ids=None)
+    return summary
+
+
+def _close(purchase_order_id, new_status, apply):
+    with transaction.atomic():
+        purchase_order = PurchaseOrder.objects.select_for_update().get(pk=purchase_order_id)
+        if purchase_order.status != PurchaseOrder.STATUS_OPEN:
+            raise PurchaseOrderClosed(
+                f'Purchase order {purchase_order.pk} is '
+                f'{purchase_order.get_status_display().lower()} already.'
+            )
+        apply(dict(purchase_order.items.values_list('product_id', 'quantity')))
+        purchase_order.status = new_status
+        if new_status == PurchaseOrder.STATUS_RECEIVED:
+            purchase_order.received_at = timezone.now()
+        purchase_order.save()
+    return purchase_order
+
+
+def receive(purchase_order_id):
+    """Put the stock of an open purchase order on hand"""
+    return _close(purchase_order_id, PurchaseOrder.STATUS_RECEIVED, stock.receive)
+
+
+def cancel(purchase_order_id):
+    """Cancel an open purchase order and stop expecting its stock"""
+    return _close(purchase_order_id, PurchaseOrder.STATUS_CANCELLED, stock.cancel_incoming)
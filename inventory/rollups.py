@@ -0,0 +1,334 @@
+# rollups.py
+"""
+Daily sales rollups for reporting.
+
+DailySales, ProductDailySales and CategoryDailySales hold, per day of
+order placement, the orders, units and line revenue of
+
+* every placed order that has not been cancelled or returned, and
+* every delivered order that has not been returned (``delivered_*``).
+
+Every change is one grouped read of the order lines per table, then a
+bulk INSERT of the missing buckets and one relative UPDATE per bucket,
+keyed on its date (and product or category), run with executemany. Reports
+only ever read these small tables.
+
+New orders are added by a background job queued at checkout
+(``record_placed``, keyed ``PLACED_JOB_KEY``), in their status at the time
+it runs; it sets ``Order.rolled_up`` in the same transaction, so running it
+twice adds an order once. Status changes go through ``record_transition``,
+which only moves orders already rolled up; the others are added in their
+new status when they are. Orders whose job failed for good are picked up
+by ``record_pending`` (``manage.py sales_rollups --pending``).
+
+``rebuild`` recomputes everything from the order history in windows of
+days, each committed on its own with its orders marked rolled up, so
+checkouts only wait for one window at a time; run ``manage.py
+sales_rollups --rebuild`` after writes that bypass the order views, such
+as bulk imports or deleting orders.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import CategoryDailySales, DailySales, Order, OrderItem, ProductDailySales
+
+# Number of orders read, or rollup rows written, per statement
+BATCH_SIZE = 500
+
+FIGURES = ('orders', 'units', 'revenue')
+FIELDS = FIGURES + tuple(f'delivered_{figure}' for figure in FIGURES)
+
+# Job key of the placement of an order, formatted with its id
+PLACED_JOB_KEY = 'rollups-placed:{}'
+
+# Rollup tables and the order line values they are keyed on
+ROLLUPS = (
+    (DailySales, ('date',)),
+    (ProductDailySales, ('date', 'product_id')),
+    (CategoryDailySales, ('date', 'category_id')),
+)
+
+NOT_SOLD = {Order.STATUS_CANCELLED, Order.STATUS_RETURNED}
+
+
+def _counts(status):
+    """Whether an order in ``status`` counts as ordered and as delivered"""
+    if status is None:
+        return 0, 0
+    return int(status not in NOT_SOLD), int(status == Order.STATUS_DELIVERED)
+
+
+def _lines(queryset, keys):
+    """Order lines grouped by ``keys``, joining products only when needed"""
+    queryset = queryset.annotate(date=TruncDate('order__order_date'))
+    if 'category_id' in keys:
+        queryset = queryset.annotate(category_id=F('product__category_id'))
+    return queryset.values(*keys)
+
+
+def _line_totals(order_ids, keys):
+    return (
+        _lines(OrderItem.objects.filter(order_id__in=order_ids), keys)
+        .annotate(
+            orders=Count('order_id', distinct=True),
+            units=Sum('quantity'),
+            revenue=Sum(F('quantity') * F('unit_price')),
+        )
+        .order_by()
+    )
+
+
+def _apply(model, keys, rows, ordered, delivered):
+    """Add ``rows`` of figures, times the given signs, to ``model``"""
+    changes = []
+    for figure in FIGURES:
+        if ordered:
+            changes.append((figure, figure, ordered))
+        if delivered:
+            changes.append((f'delivered_{figure}', figure, delivered))
+
+    opts = model._meta
+    key_fields = [opts.get_field(key) for key in keys]
+    quote = connection.ops.quote_name
+    # One keyed UPDATE executed per bucket: compiling a CASE branch per
+    # bucket through the ORM costs far more than running the statements
+    sql = 'UPDATE {} SET {}, {} = %s WHERE {}'.format(
+        quote(opts.db_table),
+        ', '.join(f'{quote(field)} = {quote(field)} + %s' for field, _, _ in changes),
+        quote(opts.get_field('updated_at').column),
+        ' AND '.join(f'{quote(field.column)} = %s' for field in key_fields),
+    )
+    now = opts.get_field('updated_at').get_db_prep_save(timezone.now(), connection)
+    revenue = opts.get_field('revenue')
+
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        # Make sure every bucket exists before moving it
+        model.objects.bulk_create(
+            [model(**{key: row[key] for key in keys}) for row in batch],
+            ignore_conflicts=True,
+        )
+        params = [
+            (
+                *(
+                    revenue.get_db_prep_save(sign * row[figure], connection)
+                    if figure == 'revenue' else sign * row[figure]
+                    for _, figure, sign in changes
+                ),
+                now,
+                *(field.get_db_prep_save(row[key], connection) for field, key in zip(key_fields, keys)),
+            )
+            for row in batch
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+def _record(order_ids, ordered, delivered):
+    if not (ordered or delivered):
+        return
+    for start in range(0, len(order_ids), BATCH_SIZE):
+        batch = order_ids[start:start + BATCH_SIZE]
+        for model, keys in ROLLUPS:
+            _apply(model, keys, list(_line_totals(batch, keys)), ordered, delivered)
+
+
+def _placed(order_ids):
+    """The orders among ``order_ids`` whose placement the rollups include"""
+    placed = set()
+    for start in range(0, len(order_ids), BATCH_SIZE):
+        placed.update(
+            Order.objects.filter(pk__in=order_ids[start:start + BATCH_SIZE], rolled_up=True)
+            .values_list('pk', flat=True)
+        )
+    return [order_id for order_id in order_ids if order_id in placed]
+
+
+def record_transition(order_ids, old_status, new_status):
+    """
+    Update the rollups for ``order_ids`` moving from ``old_status`` to
+    ``new_status``, after the orders have been saved. Orders not rolled up
+    yet are skipped: ``record_placed`` will add them in their new status.
+    """
+    old_ordered, old_delivered = _counts(old_status)
+    new_ordered, new_delivered = _counts(new_status)
+    _record(_placed(list(order_ids)), new_ordered - old_ordered, new_delivered - old_delivered)
+
+
+def record_placed(order_ids):
+    """
+    Add the orders among ``order_ids`` not rolled up yet, in their current
+    status, and mark them rolled up; returns how many were added. Runs as
+    the job ``PLACED_JOB_KEY`` and must be called inside
+    ``transaction.atomic``.
+    """
+    # Lock the orders so a concurrent status change either commits first
+    # and is read here, or waits and then sees them rolled up
+    current = dict(
+        Order.objects.select_for_update()
+        .filter(pk__in=order_ids, rolled_up=False)
+        .values_list('pk', 'status')
+    )
+    by_status = {}
+    for order_id, status in current.items():
+        by_status.setdefault(status, []).append(order_id)
+    for status, placed in by_status.items():
+        ordered, delivered = _counts(status)
+        _record(placed, ordered, delivered)
+    Order.objects.filter(pk__in=list(current)).update(rolled_up=True)
+    return len(current)
+
+
+def record_pending(progress=None):
+    """
+    Add every order not rolled up yet, such as those whose job failed for
+    good, one transaction per batch; returns how many were added.
+    """
+    total = 0
+    last = 0
+    while True:
+        batch = list(
+            Order.objects.filter(rolled_up=False, pk__gt=last)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:BATCH_SIZE]
+        )
+        if not batch:
+            return total
+        with transaction.atomic():
+            total += record_placed(batch)
+        last = batch[-1]
+        if progress:
+            progress(total)
+
+
+def _history(keys, start, end, upto):
+    """Figures of the orders up to id ``upto`` placed in [start, end), grouped by ``keys``"""
+    ordered = ~Q(order__status__in=NOT_SOLD)
+    delivered = Q(order__status=Order.STATUS_DELIVERED)
+    revenue = F('quantity') * F('unit_price')
+    zero = Value(Decimal('0.00'))
+    return (
+        _lines(
+            OrderItem.objects.filter(
+                order__order_date__gte=start, order__order_date__lt=end, order_id__lte=upto
+            ),
+            keys,
+        )
+        .annotate(
+            orders=Count('order_id', distinct=True, filter=ordered),
+            units=Coalesce(Sum('quantity', filter=ordered), 0),
+            revenue=Coalesce(Sum(revenue, filter=ordered), zero),
+            delivered_orders=Count('order_id', distinct=True, filter=delivered),
+            delivered_units=Coalesce(Sum('quantity', filter=delivered), 0),
+            delivered_revenue=Coalesce(Sum(revenue, filter=delivered), zero),
+        )
+        .order_by()
+    )
+
+
+def _insert_history(model, keys, start, end, upto):
+    """Write the figures of orders placed in [start, end) with INSERT ... SELECT"""
+    opts = model._meta
+    quote = connection.ops.quote_name
+    names = list(keys) + list(FIELDS)
+    sql, params = _history(keys, start, end, upto).query.sql_with_params()
+    now = opts.get_field('updated_at').get_db_prep_save(timezone.now(), connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {} ({}, {}) SELECT {}, %s FROM ({}) history '
+            'WHERE history.orders > 0 OR history.delivered_orders > 0'.format(
+                quote(opts.db_table),
+                ', '.join(quote(opts.get_field(name).column) for name in names),
+                quote(opts.get_field('updated_at').column),
+                ', '.join(f'history.{quote(name)}' for name in names),
+                sql,
+            ),
+            (now, *params),
+        )
+
+
+def _rebuild_window(start, end, upto):
+    """Recompute the buckets of the days in [start, end) in one transaction; returns the orders"""
+    with transaction.atomic():
+        # Lock the window's orders so a concurrent status change either
+        # commits first and is read here, or waits and then sees them
+        # rolled up and moves the rebuilt buckets
+        orders = Order.objects.filter(order_date__gte=start, order_date__lt=end, pk__lte=upto)
+        count = len(orders.select_for_update().values_list('pk', flat=True))
+        for model, keys in ROLLUPS:
+            model.objects.filter(
+                date__gte=timezone.localdate(start), date__lt=timezone.localdate(end)
+            ).delete()
+            _insert_history(model, keys, start, end, upto)
+        orders.filter(rolled_up=False).update(rolled_up=True)
+    return count
+
+
+def rebuild(chunk_days=7, progress=None):
+    """
+    Recompute every rollup from the order history, ``chunk_days`` days of
+    orders at a time. Windows never share a day, so each one is aggregated
+    and inserted as finished rows by the database itself, and committed
+    with its orders marked rolled up before the next one starts.
+    """
+    bounds = Order.objects.aggregate(
+        first=Min('order_date'), last=Max('order_date'), upto=Max('pk')
+    )
+    if bounds['first'] is None:
+        with transaction.atomic():
+            for model, keys in ROLLUPS:
+                model.objects.all().delete()
+        return 0
+    # Orders placed while rebuilding are left to their own jobs
+    upto = bounds['upto']
+    day = timezone.localdate(bounds['first'])
+    last_day = timezone.localdate(bounds['last'])
+    with transaction.atomic():
+        # Days without orders any more, such as after deleting some
+        for model, keys in ROLLUPS:
+            model.objects.exclude(date__gte=day, date__lte=last_day).delete()
+    total = 0
+    while day <= last_day:
+        next_day = day + timedelta(days=chunk_days)
+        start, end = (
+            timezone.make_aware(datetime.combine(value, time.min)) for value in (day, next_day)
+        )
+        total += _rebuild_window(start, end, upto)
+        if progress:
+            progress(total)
+        day = next_day
+    return total
+
+
+def report(model, *fields, start=None, end=None, order_by=None, limit=None, **expressions):
+    """
+    Sum the figures of ``model`` between ``start`` and ``end``, grouped by
+    ``fields`` and ``expressions`` as in ``QuerySet.values()``. Totals are
+    ordered by ``order_by``, e.g. ``'-revenue'``.
+    """
+    queryset = model.objects.all()
+    if start:
+        queryset = queryset.filter(date__gte=start)
+    if end:
+        queryset = queryset.filter(date__lte=end)
+    ordering = []
+    for field in order_by or fields:
+        name = field.lstrip('-')
+        ordering.append(field.replace(name, f'total_{name}') if name in FIELDS else field)
+    rows = queryset.values(*fields, **expressions).annotate(
+        **{f'total_{field}': Sum(field) for field in FIELDS}
+    ).order_by(*ordering)
+    if limit:
+        rows = rows[:limit]
+    return [
+        {
+            **{key: value for key, value in row.items() if not key.startswith('total_')},
+            **{field: row[f'total_{field}'] for field in FIELDS},
+        }
+        for row in rows
+    ]
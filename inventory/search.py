@@ -0,0 +1,238 @@
+# search.py
+"""
+Full-text product search.
+
+Every backend indexes Product.name, Product.sku and Product.description and
+annotates matches with ``search_rank`` (higher is better):
+
+* SQLite uses an external-content FTS5 table kept in sync by triggers, so
+  the index follows every insert, update and delete, bulk writes included.
+* PostgreSQL uses a GIN index over a weighted ``tsvector`` expression.
+* MySQL uses a FULLTEXT index queried in boolean mode.
+* Any other database falls back to ``icontains`` lookups.
+
+The backend is chosen from the database vendor, or from the dotted path in
+``settings.INVENTORY_SEARCH_BACKEND``. Indexes are created after ``migrate``
+and can be rebuilt with ``manage.py search_index --rebuild``.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def parse_terms(query):
+    """Split a user query into lower-cased search terms"""
+    return [term.lower() for term in TERM_RE.findall(query or '')]
+
+
+class BaseSearchBackend:
+    """Case-insensitive substring matching, used when nothing better exists"""
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def is_supported(self):
+        """Whether the database can host this backend's index"""
+        return True
+
+    def install(self):
+        """Create the index structures if they do not exist yet"""
+
+    def rebuild(self):
+        """Re-index every product from scratch"""
+
+    def search(self, queryset, terms):
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(name__icontains=term) |
+                Q(description__icontains=term) |
+                Q(sku__icontains=term)
+            )
+        return queryset.filter(condition).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    table = 'inventory_product_fts'
+    # bm25 weights for name, description and sku
+    weights = (10.0, 1.0, 5.0)
+
+    def __init__(self, using='default'):
+        super().__init__(using)
+        self._installed = False
+
+    def is_supported(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+
+    def install(self):
+        product_table = Product._meta.db_table
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.table]
+            )
+            exists = cursor.fetchone() is not None
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"name, description, sku, content='{product_table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_ai AFTER INSERT ON {product_table} BEGIN "
+                f"INSERT INTO {self.table}(rowid, name, description, sku) "
+                f"VALUES (new.id, new.name, new.description, new.sku); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_ad AFTER DELETE ON {product_table} BEGIN "
+                f"INSERT INTO {self.table}({self.table}, rowid, name, description, sku) "
+                f"VALUES ('delete', old.id, old.name, old.description, old.sku); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_au "
+                f"AFTER UPDATE OF name, description, sku ON {product_table} BEGIN "
+                f"INSERT INTO {self.table}({self.table}, rowid, name, description, sku) "
+                f"VALUES ('delete', old.id, old.name, old.description, old.sku); "
+                f"INSERT INTO {self.table}(rowid, name, description, sku) "
+                f"VALUES (new.id, new.name, new.description, new.sku); END"
+            )
+        if not exists:
+            self.rebuild()
+        self._installed = True
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def search(self, queryset, terms):
+        if not self._installed:
+            self.install()
+        # Quote every term and make it a prefix match: "wid"* "blu"*
+        match = ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+        product_table = Product._meta.db_table
+        weights = ', '.join(str(weight) for weight in self.weights)
+        # Join the FTS table rather than using a correlated subquery, so
+        # bm25() collects its corpus statistics once per statement
+        return queryset.extra(
+            tables=[self.table],
+            where=[f"{self.table}.rowid = {product_table}.id", f"{self.table} MATCH %s"],
+            params=[match],
+        ).annotate(
+            search_rank=RawSQL(f"-bm25({self.table}, {weights})", (), output_field=FloatField())
+        )
+
+
+class PostgreSQLBackend(BaseSearchBackend):
+    index = 'inventory_product_search'
+    # Columns are qualified so the expression stays unambiguous in joins;
+    # PostgreSQL still matches it against the index expression
+    vector = (
+        "setweight(to_tsvector('simple', coalesce({table}.name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce({table}.sku, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce({table}.description, '')), 'C')"
+    ).format(table=Product._meta.db_table)
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.index} ON {Product._meta.db_table} "
+                f"USING GIN (({self.vector}))"
+            )
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"REINDEX INDEX {self.index}")
+
+    def search(self, queryset, terms):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.filter(
+            RawSQL(f"({self.vector}) @@ to_tsquery('simple', %s)", (tsquery,), output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(
+                f"ts_rank(({self.vector}), to_tsquery('simple', %s))",
+                (tsquery,),
+                output_field=FloatField(),
+            )
+        )
+
+
+class MySQLBackend(BaseSearchBackend):
+    index = 'inventory_product_search'
+    match = (
+        'MATCH ({table}.name, {table}.description, {table}.sku) AGAINST (%s IN BOOLEAN MODE)'
+    ).format(table=Product._meta.db_table)
+
+    def install(self):
+        table = Product._meta.db_table
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+                [table, self.index],
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(f"CREATE FULLTEXT INDEX {self.index} ON {table} (name, description, sku)")
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"OPTIMIZE TABLE {Product._meta.db_table}")
+
+    def search(self, queryset, terms):
+        boolean_query = ' '.join(f'+{term}*' for term in terms)
+        return queryset.filter(
+            RawSQL(self.match, (boolean_query,), output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(self.match, (boolean_query,), output_field=FloatField())
+        )
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'postgresql': PostgreSQLBackend,
+    'mysql': MySQLBackend,
+}
+
+_backends = {}
+
+
+def get_backend(using='default'):
+    """Return the search backend for a database alias"""
+    if using not in _backends:
+        path = getattr(settings, 'INVENTORY_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connections[using].vendor, BaseSearchBackend)
+        backend = backend_class(using)
+        if not backend.is_supported():
+            backend = BaseSearchBackend(using)
+        _backends[using] = backend
+    return _backends[using]
+
+
+def search_products(queryset, query):
+    """Restrict a Product queryset to matches for ``query``, best matches first"""
+    terms = parse_terms(query)
+    if not terms:
+        return queryset.none()
+    backend = get_backend(queryset.db)
+    return backend.search(queryset, terms).order_by('-search_rank', 'name', 'id')
+
+
+def install_search_index(sender, using='default', **kwargs):
+    """post_migrate receiver creating the search index for ``using``"""
+    get_backend(using).install()
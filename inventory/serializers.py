@@ -1,10 +1,65 @@
 # serializers.py
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
 from .models import (
     Category, Supplier, Product, ProductSupplier, Inventory, 
-    UserProfile, Cart, CartItem, Order, OrderItem
+    UserProfile, Cart, CartItem, Order, OrderItem, PurchaseOrder, PurchaseOrderItem
 )
+from . import carts, exports, importer, instrumentation
+
+class EagerLoadingMixin:
+    """
+    Let a serializer declare the relations it reads so views can load them
+    up front. Nested serializers are followed automatically: single objects
+    become select_related lookups and many=True fields become Prefetch
+    objects optimized by their own child serializer. Relations reached
+    through plain fields (StringRelatedField, properties) are declared in
+    select_related_fields / prefetch_related_fields.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select_related, prefetch_related = cls.get_eager_relations()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    @classmethod
+    def get_eager_relations(cls):
+        select_related = list(cls.select_related_fields)
+        prefetch_related = list(cls.prefetch_related_fields)
+
+        for field in cls().fields.values():
+            if field.write_only or field.source == '*':
+                continue
+            source = field.source.replace('.', '__')
+
+            if isinstance(field, serializers.ListSerializer):
+                model = getattr(getattr(field.child, 'Meta', None), 'model', None)
+                if model is None:
+                    continue
+                queryset = model._default_manager.all()
+                if isinstance(field.child, EagerLoadingMixin):
+                    queryset = field.child.setup_eager_loading(queryset)
+                prefetch_related.append(Prefetch(source, queryset=queryset))
+
+            elif isinstance(field, serializers.BaseSerializer):
+                select_related.append(source)
+                if isinstance(field, EagerLoadingMixin):
+                    child_select, child_prefetch = field.get_eager_relations()
+                    select_related += [f'{source}__{lookup}' for lookup in child_select]
+                    prefetch_related += [
+                        Prefetch(f'{source}__{lookup.prefetch_through}', queryset=lookup.queryset)
+                        if isinstance(lookup, Prefetch) else f'{source}__{lookup}'
+                        for lookup in child_prefetch
+                    ]
+
+        return select_related, prefetch_related
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -21,10 +76,13 @@ class SupplierSerializer(serializers.ModelSerializer):
 class InventorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Inventory
-        fields = ['quantity', 'reserved_quantity', 'available_quantity', 'reorder_level', 'updated_at']
-        read_only_fields = ['available_quantity', 'updated_at']
+        fields = [
+            'quantity', 'reserved_quantity', 'available_quantity', 'reorder_level',
+            'incoming_quantity', 'updated_at'
+        ]
+        read_only_fields = ['available_quantity', 'incoming_quantity', 'updated_at']
 
-class ProductSupplierSerializer(serializers.ModelSerializer):
+class ProductSupplierSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     supplier = SupplierSerializer(read_only=True)
     
     class Meta:
@@ -32,7 +90,7 @@ class ProductSupplierSerializer(serializers.ModelSerializer):
         fields = ['supplier', 'supplier_price', 'is_primary', 'created_at']
         read_only_fields = ['created_at']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True)
     inventory = InventorySerializer(read_only=True)
@@ -47,10 +105,11 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     """Lightweight serializer for product listings"""
     category = serializers.StringRelatedField()
     in_stock = serializers.ReadOnlyField()
+    select_related_fields = ('category', 'inventory')
 
     class Meta:
         model = Product
@@ -61,7 +120,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         model = UserProfile
         fields = ['phone', 'address', 'date_of_birth']
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     profile = UserProfileSerializer()
 
     class Meta:
@@ -86,7 +145,7 @@ class UserSerializer(serializers.ModelSerializer):
         
         return instance
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     product = ProductListSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
     total_price = serializers.ReadOnlyField()
@@ -96,33 +155,54 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'product_id', 'quantity', 'total_price', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
-    def validate_product_id(self, value):
-        try:
-            product = Product.objects.get(id=value, is_active=True)
-            if not product.in_stock:
-                raise serializers.ValidationError("Product is out of stock.")
-            return value
-        except Product.DoesNotExist:
-            raise serializers.ValidationError("Product does not exist or is inactive.")
-
     def validate_quantity(self, value):
         if value < 1:
             raise serializers.ValidationError("Quantity must be at least 1.")
-        
-        # Check if we have enough inventory
-        if hasattr(self, 'initial_data') and 'product_id' in self.initial_data:
-            try:
-                product = Product.objects.get(id=self.initial_data['product_id'])
-                if product.inventory.available_quantity < value:
-                    raise serializers.ValidationError(
-                        f"Only {product.inventory.available_quantity} items available in stock."
-                    )
-            except (Product.DoesNotExist, Inventory.DoesNotExist):
-                pass
-        
         return value
 
-class CartSerializer(serializers.ModelSerializer):
+    def validate(self, data):
+        # The product and its stock are fetched once, and handed on to the
+        # view and to save() as validated_data['product']
+        if 'product_id' in data:
+            product_id = data.pop('product_id')
+            try:
+                product = ProductListSerializer.setup_eager_loading(
+                    Product.objects.filter(is_active=True)
+                ).get(id=product_id)
+            except Product.DoesNotExist:
+                raise serializers.ValidationError(
+                    {'product_id': "Product does not exist or is inactive."}
+                )
+            if not product.in_stock:
+                raise serializers.ValidationError({'product_id': "Product is out of stock."})
+            quantity = data.get('quantity')
+            if quantity is not None and product.inventory.available_quantity < quantity:
+                raise serializers.ValidationError({
+                    'quantity': f"Only {product.inventory.available_quantity} items available in stock."
+                })
+            data['product'] = product
+        return data
+
+class CartOperationSerializer(serializers.Serializer):
+    """One change of a cart batch"""
+    op = serializers.ChoiceField(choices=carts.OPERATIONS)
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, data):
+        if data['op'] == carts.OP_ADD and not data.get('quantity'):
+            raise serializers.ValidationError({'quantity': 'Quantity must be at least 1.'})
+        if data['op'] == carts.OP_SET and 'quantity' not in data:
+            raise serializers.ValidationError({'quantity': 'This field is required.'})
+        return data
+
+class CartBatchSerializer(serializers.Serializer):
+    """Serializer for applying many cart changes at once"""
+    operations = serializers.ListField(
+        child=CartOperationSerializer(), allow_empty=False, max_length=carts.MAX_OPERATIONS
+    )
+
+class CartSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_items = serializers.ReadOnlyField()
     total_price = serializers.ReadOnlyField()
@@ -132,7 +212,7 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'items', 'total_items', 'total_price', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     product = ProductListSerializer(read_only=True)
     total_price = serializers.ReadOnlyField()
 
@@ -141,7 +221,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'quantity', 'unit_price', 'total_price', 'created_at']
         read_only_fields = ['id', 'created_at']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user = UserSerializer(read_only=True)
     total_items = serializers.ReadOnlyField()
@@ -160,7 +240,7 @@ class OrderSerializer(serializers.ModelSerializer):
             'shipped_date', 'delivered_date'
         ]
 
-class OrderListSerializer(serializers.ModelSerializer):
+class OrderListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     """Lightweight serializer for order listings"""
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     total_items = serializers.ReadOnlyField()
@@ -172,10 +252,101 @@ class OrderListSerializer(serializers.ModelSerializer):
             'total_amount', 'total_items', 'order_date'
         ]
 
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        # total_items is summed in SQL; the items themselves are never rendered
+        return super().setup_eager_loading(queryset).with_total_items()
+
+class PurchaseOrderItemSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    product = ProductListSerializer(read_only=True)
+    total_cost = serializers.ReadOnlyField()
+
+    class Meta:
+        model = PurchaseOrderItem
+        fields = ['id', 'product', 'quantity', 'unit_cost', 'total_cost']
+
+class PurchaseOrderSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    supplier = SupplierSerializer(read_only=True)
+    items = PurchaseOrderItemSerializer(many=True, read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = PurchaseOrder
+        fields = [
+            'id', 'supplier', 'status', 'status_display', 'total_cost', 'items',
+            'created_at', 'received_at'
+        ]
+
+class PurchaseOrderListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    """Lightweight serializer for purchase order listings"""
+    supplier = serializers.StringRelatedField()
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    select_related_fields = ('supplier',)
+
+    class Meta:
+        model = PurchaseOrder
+        fields = ['id', 'supplier', 'status', 'status_display', 'total_cost', 'created_at', 'received_at']
+
 class CreateOrderSerializer(serializers.Serializer):
     """Serializer for creating orders from cart"""
     shipping_address = serializers.CharField(max_length=500)
     shipping_phone = serializers.CharField(max_length=15)
     shipping_cost = serializers.DecimalField(max_digits=10, decimal_places=2, default=0)
     tax_amount = serializers.DecimalField(max_digits=10, decimal_places=2, default=0)
-    notes = serializers.CharField(required=False, allow_blank=True)
\ No newline at end of file
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+class BulkOrderStatusSerializer(serializers.Serializer):
+    """Serializer for moving many orders to one status"""
+    order_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000
+    )
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+class SalesReportSerializer(serializers.Serializer):
+    """Query parameters of the sales report endpoints"""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=50)
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError("'start' must not be after 'end'")
+        return data
+
+class SlowViewsSerializer(serializers.Serializer):
+    """Query parameters of the request profile endpoint"""
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    sort = serializers.ChoiceField(choices=instrumentation.SORT_KEYS, default='total_ms')
+
+class CatalogImportSerializer(serializers.Serializer):
+    """Form fields of the catalog import endpoint"""
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=importer.FORMATS, required=False)
+    supplier = serializers.EmailField(required=False)
+
+    def validate(self, data):
+        data.setdefault('format', importer.detect_format(data['file'].name))
+        if data['format'] is None:
+            raise serializers.ValidationError(
+                {'format': 'Cannot tell the format from the file name.'}
+            )
+        return data
+
+class ExportSerializer(serializers.Serializer):
+    """Query parameters of the export endpoints"""
+    # Not 'format', which DRF takes to pick a renderer
+    output = serializers.ChoiceField(choices=exports.FORMATS, default='csv')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError("'start' must not be after 'end'")
+        return data
+
+class OrderExportSerializer(ExportSerializer):
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+
+class ProductExportSerializer(ExportSerializer):
+    # Missing means both, rather than the False of an unchecked box
+    is_active = serializers.BooleanField(required=False, allow_null=True, default=None)
@@ -0,0 +1,7 @@
+# signals.py
+"""Custom signals sent by the inventory app"""
+from django.dispatch import Signal
+
+# Sent with ``product_ids`` (None when too many to list) after stock levels
+# change through bulk UPDATEs, which bypass the model save/delete signals
+stock_changed = Signal()
@@ -0,0 +1,207 @@
+# stats.py
+"""
+Incrementally maintained counters behind the admin dashboard.
+
+Rather than counting orders, revenue, users, active products and low-stock
+products over whole tables on every dashboard hit, each figure is stored as
+a StatCounter row and adjusted with a relative UPDATE in the same
+transaction as the write that changes it:
+
+* model signals cover saves and deletes of orders, users, products and
+  inventories; before an existing row is saved, the tracked fields being
+  written are read back from it (one small query, and only on that write
+  path) and the save is diffed against them;
+* bulk paths that bypass those signals (``orders.bulk_transition``, the
+  stock deltas in ``stock`` and the catalog ``importer``) call ``adjust()``
+  themselves.
+
+Other ``bulk_create``/``update`` writes are not tracked; run
+``manage.py dashboard_stats --rebuild`` after them. Missing counters are
+rebuilt from the source tables on first read.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from . import upserts
+from .models import Inventory, Order, Product, StatCounter
+
+TOTAL_ORDERS = 'total_orders'
+PENDING_ORDERS = 'pending_orders'
+TOTAL_REVENUE = 'total_revenue'
+TOTAL_USERS = 'total_users'
+TOTAL_PRODUCTS = 'total_products'
+LOW_STOCK_PRODUCTS = 'low_stock_products'
+
+COUNTERS = (
+    TOTAL_ORDERS, PENDING_ORDERS, TOTAL_REVENUE,
+    TOTAL_USERS, TOTAL_PRODUCTS, LOW_STOCK_PRODUCTS,
+)
+# Counters reported as money rather than whole numbers
+DECIMAL_COUNTERS = {TOTAL_REVENUE}
+
+
+def compute():
+    """Count every dashboard figure from the source tables, one query per table"""
+    values = Order.objects.aggregate(**{
+        TOTAL_ORDERS: Count('id'),
+        PENDING_ORDERS: Count('id', filter=Q(status=Order.STATUS_PENDING)),
+        TOTAL_REVENUE: Coalesce(Sum('total_amount'), Value(Decimal('0.00'))),
+    })
+    # SQLite sums decimals as floats; keep the figure in cents
+    values[TOTAL_REVENUE] = Decimal(values[TOTAL_REVENUE]).quantize(Decimal('0.01'))
+    values[TOTAL_USERS] = User.objects.count()
+    values[TOTAL_PRODUCTS] = Product.objects.filter(is_active=True).count()
+    # Counted from the partial index of low-stock inventories alone
+    values[LOW_STOCK_PRODUCTS] = Inventory.objects.filter(
+        quantity__lte=F('reorder_level')
+    ).count()
+    return values
+
+
+@transaction.atomic
+def rebuild():
+    """Recount every counter from the source tables and store the result"""
+    values = compute()
+    StatCounter.objects.bulk_create(
+        [StatCounter(name=name, value=value) for name, value in values.items()],
+        **upserts.options(['name'], ['value', 'updated_at']),
+    )
+    return values
+
+
+def adjust(**deltas):
+    """Add ``{counter: delta}`` to the stored counters with a single UPDATE"""
+    deltas = {name: Decimal(delta) for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    StatCounter.objects.filter(name__in=deltas).update(
+        value=F('value') + Case(
+            *[When(name=name, then=Value(delta)) for name, delta in deltas.items()],
+            default=Value(Decimal(0)),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def dashboard():
+    """Return the dashboard figures, rebuilding the counters if any is missing"""
+    values = dict(StatCounter.objects.filter(name__in=COUNTERS).values_list('name', 'value'))
+    if len(values) < len(COUNTERS):
+        values = rebuild()
+    return {
+        name: values[name] if name in DECIMAL_COUNTERS else int(values[name])
+        for name in COUNTERS
+    }
+
+
+# Fields whose stored values are read before a save so it can be diffed
+TRACKED_FIELDS = {
+    Order: ('status', 'total_amount'),
+    Product: ('is_active',),
+    Inventory: ('quantity', 'reorder_level'),
+}
+
+
+def read_stored_values(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Read the tracked fields an existing row is about to have overwritten"""
+    if raw or instance.pk is None:
+        return
+    fields = [
+        field for field in TRACKED_FIELDS[sender]
+        if update_fields is None or field in update_fields
+    ]
+    if fields:
+        stored = sender._base_manager.filter(pk=instance.pk).values(*fields).first()
+        instance._stats_stored = stored or {}
+
+
+def _changes(instance, update_fields):
+    """Return ``(old, new)`` values of the tracked fields written by a save"""
+    stored = instance.__dict__.pop('_stats_stored', {})
+    old, new = {}, {}
+    for field in TRACKED_FIELDS[type(instance)]:
+        # Read __dict__ directly so deferred fields are not fetched
+        current = instance.__dict__.get(field)
+        # Fields left out of the save, or not stored yet, count as unchanged
+        written = update_fields is None or field in update_fields
+        new[field] = current if written else stored.get(field, current)
+        old[field] = stored.get(field, new[field])
+    return old, new
+
+
+def _order_figures(values):
+    return {
+        PENDING_ORDERS: int(values['status'] == Order.STATUS_PENDING),
+        TOTAL_REVENUE: Decimal(str(values['total_amount'] or 0)),
+    }
+
+
+def _is_low_stock(values):
+    quantity, reorder_level = values['quantity'], values['reorder_level']
+    return int(None not in (quantity, reorder_level) and quantity <= reorder_level)
+
+
+def order_saved(sender, instance, created, update_fields=None, **kwargs):
+    old, new = _changes(instance, update_fields)
+    after = _order_figures(new)
+    if created:
+        adjust(**{TOTAL_ORDERS: 1}, **after)
+    else:
+        before = _order_figures(old)
+        adjust(**{name: after[name] - before[name] for name in after})
+
+
+def order_deleted(sender, instance, **kwargs):
+    old, _ = _changes(instance, None)
+    before = _order_figures(old)
+    adjust(**{TOTAL_ORDERS: -1}, **{name: -value for name, value in before.items()})
+
+
+def product_saved(sender, instance, created, update_fields=None, **kwargs):
+    old, new = _changes(instance, update_fields)
+    before = 0 if created else int(bool(old['is_active']))
+    adjust(**{TOTAL_PRODUCTS: int(bool(new['is_active'])) - before})
+
+
+def product_deleted(sender, instance, **kwargs):
+    old, _ = _changes(instance, None)
+    adjust(**{TOTAL_PRODUCTS: -int(bool(old['is_active']))})
+
+
+def inventory_saved(sender, instance, created, update_fields=None, **kwargs):
+    old, new = _changes(instance, update_fields)
+    before = 0 if created else _is_low_stock(old)
+    adjust(**{LOW_STOCK_PRODUCTS: _is_low_stock(new) - before})
+
+
+def inventory_deleted(sender, instance, **kwargs):
+    old, _ = _changes(instance, None)
+    adjust(**{LOW_STOCK_PRODUCTS: -_is_low_stock(old)})
+
+
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        adjust(**{TOTAL_USERS: 1})
+
+
+def user_deleted(sender, instance, **kwargs):
+    adjust(**{TOTAL_USERS: -1})
+
+
+for model, saved, deleted in (
+    (Order, order_saved, order_deleted),
+    (Product, product_saved, product_deleted),
+    (Inventory, inventory_saved, inventory_deleted),
+):
+    pre_save.connect(read_stored_values, sender=model, dispatch_uid=f'stats-pre-save-{model.__name__}')
+    post_save.connect(saved, sender=model, dispatch_uid=f'stats-save-{model.__name__}')
+    post_delete.connect(deleted, sender=model, dispatch_uid=f'stats-delete-{model.__name__}')
+post_save.connect(user_saved, sender=User, dispatch_uid='stats-save-User')
+post_delete.connect(user_deleted, sender=User, dispatch_uid='stats-delete-User')
@@ -0,0 +1,212 @@
+# stock.py
+"""
+Stock reservation engine built on top of the Inventory model.
+
+Reservations are applied with conditional, relative UPDATE statements
+(``reserved_quantity = reserved_quantity + n`` guarded by
+``quantity >= reserved_quantity + n``), so concurrent checkouts can never
+oversell or lose each other's updates. On backends that support it the
+inventory rows are also locked in product order first, which keeps
+concurrent checkouts from deadlocking against each other. Every change is
+also appended to the stock movement ledger (see ledger.py).
+
+All functions must be called inside ``transaction.atomic``.
+"""
+from collections import Counter
+from dataclasses import dataclass
+
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from . import ledger, stats
+from .models import Inventory, OrderItem, StockMovement
+from .signals import stock_changed
+
+# Number of products touched by a single UPDATE statement
+BATCH_SIZE = 200
+
+
+class InsufficientStock(Exception):
+    """Raised when a reservation cannot be satisfied in full"""
+
+    def __init__(self, results):
+        self.results = results
+        super().__init__('Insufficient stock for: ' + ', '.join(
+            str(result.sku or result.product_id) for result in results if not result.ok
+        ))
+
+
+class StockConflict(Exception):
+    """Raised when inventory rows changed between locking and updating"""
+
+
+@dataclass
+class ReservationResult:
+    product_id: int
+    sku: str
+    requested: int
+    reserved: int
+    available: int
+
+    @property
+    def ok(self):
+        return self.reserved == self.requested
+
+    def as_dict(self):
+        return {
+            'product_id': self.product_id,
+            'sku': self.sku,
+            'requested': self.requested,
+            'reserved': self.reserved,
+            'available': self.available,
+            'ok': self.ok,
+        }
+
+
+def aggregate_lines(lines):
+    """Collapse ``(product_id, quantity)`` pairs into ``{product_id: quantity}``"""
+    totals = Counter()
+    for product_id, quantity in lines:
+        totals[product_id] += quantity
+    return dict(totals)
+
+
+def lock_inventories(product_ids):
+    """Lock the inventory rows for ``product_ids`` in a deterministic order"""
+    queryset = Inventory.objects.filter(product_id__in=product_ids).order_by('product_id')
+    if connection.features.has_select_for_update_of:
+        queryset = queryset.select_for_update(of=('self',))
+    else:
+        queryset = queryset.select_for_update()
+    return queryset.values_list('product_id', 'quantity', 'reserved_quantity', 'product__sku')
+
+
+def reserve(lines, allow_partial=False):
+    """
+    Reserve stock for ``lines``, an iterable of ``(product_id, quantity)``.
+
+    Returns one ReservationResult per product. Without ``allow_partial`` the
+    reservation is all-or-nothing and InsufficientStock is raised before any
+    row is written; with it, every product gets as much as is available.
+    """
+    requested = aggregate_lines(lines)
+    if not requested:
+        return []
+
+    stock = {
+        product_id: (quantity - reserved, sku)
+        for product_id, quantity, reserved, sku in lock_inventories(list(requested))
+    }
+
+    results = []
+    for product_id in sorted(requested):
+        available, sku = stock.get(product_id, (0, None))
+        wanted = requested[product_id]
+        if allow_partial:
+            reserved = max(min(wanted, available), 0)
+        else:
+            reserved = wanted if available >= wanted else 0
+        results.append(ReservationResult(product_id, sku, wanted, reserved, available))
+
+    if not allow_partial and not all(result.ok for result in results):
+        raise InsufficientStock(results)
+
+    _apply_reservations({
+        result.product_id: result.reserved for result in results if result.reserved
+    })
+    return results
+
+
+def _apply_reservations(deltas):
+    """Increment reserved_quantity, refusing to go past the on-hand quantity"""
+    product_ids = sorted(deltas)
+    now = timezone.now()
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        guard = Q()
+        for product_id in batch:
+            guard |= Q(product_id=product_id, quantity__gte=F('reserved_quantity') + deltas[product_id])
+        updated = Inventory.objects.filter(guard).update(
+            reserved_quantity=F('reserved_quantity') + Case(
+                *[When(product_id=product_id, then=Value(deltas[product_id])) for product_id in batch],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            updated_at=now,
+        )
+        if updated != len(batch):
+            raise StockConflict('Inventory changed while reserving stock, please retry.')
+    ledger.record(StockMovement.KIND_RESERVE, deltas, reserved_sign=1)
+    if product_ids:
+        stock_changed.send(sender=Inventory, product_ids=product_ids)
+
+
+def order_lines(order_ids):
+    """Aggregate the line items of ``order_ids`` into ``{product_id: quantity}``"""
+    totals = Counter()
+    order_ids = list(order_ids)
+    for start in range(0, len(order_ids), BATCH_SIZE):
+        rows = OrderItem.objects.filter(
+            order_id__in=order_ids[start:start + BATCH_SIZE]
+        ).values('product_id').annotate(total=Sum('quantity')).order_by()
+        for row in rows:
+            totals[row['product_id']] += row['total']
+    return dict(totals)
+
+
+def release(quantities):
+    """Give reserved stock back, e.g. when an order is cancelled"""
+    _apply_deltas(quantities, StockMovement.KIND_RELEASE, reserved_sign=-1)
+
+
+def fulfil(quantities):
+    """Turn reserved stock into sold stock, e.g. when an order is delivered"""
+    _apply_deltas(quantities, StockMovement.KIND_SELL, reserved_sign=-1, quantity_sign=-1)
+
+
+def receive(quantities):
+    """Put stock delivered by a supplier on hand, e.g. from a purchase order"""
+    _apply_deltas(quantities, StockMovement.KIND_RECEIVE, quantity_sign=1, incoming_sign=-1)
+
+
+def cancel_incoming(quantities):
+    """Stop expecting stock that was ordered from a supplier"""
+    # Stock on order is not part of the ledger
+    _apply_deltas(quantities, None, incoming_sign=-1)
+
+
+def _apply_deltas(quantities, kind, reserved_sign=0, quantity_sign=0, incoming_sign=0):
+    """
+    Apply ``{product_id: n}`` to the inventory with one UPDATE per batch,
+    recorded as ``kind`` movements in the ledger
+    """
+    product_ids = sorted(product_id for product_id, n in quantities.items() if n)
+    now = timezone.now()
+    low_stock_delta = 0
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        delta = Case(
+            *[When(product_id=product_id, then=Value(quantities[product_id])) for product_id in batch],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        changes = {'updated_at': now}
+        if reserved_sign:
+            changes['reserved_quantity'] = F('reserved_quantity') + reserved_sign * delta
+        if incoming_sign:
+            changes['incoming_quantity'] = F('incoming_quantity') + incoming_sign * delta
+        if quantity_sign:
+            changes['quantity'] = F('quantity') + quantity_sign * delta
+            # The update bypasses the model signals that keep the
+            # low-stock counter current, so count around it instead
+            low_stock = Inventory.objects.filter(product_id__in=batch, quantity__lte=F('reorder_level'))
+            low_stock_delta -= low_stock.count()
+        Inventory.objects.filter(product_id__in=batch).update(**changes)
+        if quantity_sign:
+            low_stock_delta += low_stock.count()
+    stats.adjust(**{stats.LOW_STOCK_PRODUCTS: low_stock_delta})
+    if kind is not None:
+        ledger.record(kind, quantities, quantity_sign=quantity_sign, reserved_sign=reserved_sign)
+    if product_ids:
+        stock_changed.send(sender=Inventory, product_ids=product_ids)
@@ -0,0 +1,104 @@
+# tasks.py
+"""
+Background tasks run by ``manage.py run_jobs`` (see jobs.py).
+
+Checkout only calls ``after_checkout``, which queues the follow-up work of
+a new order in the checkout transaction: its sales rollups, the order
+confirmation email and a low-stock check of the products it reserved.
+Stock ledger snapshots are taken by a job that queues its next run.
+"""
+import time
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db.models import F
+from django.utils import timezone
+
+from . import jobs, ledger, rollups
+from .models import Inventory, Order, ProductSupplier
+
+
+def after_checkout(order, product_ids):
+    """Queue the follow-up work of ``order``, placed with ``product_ids``"""
+    jobs.enqueue(
+        'rollups.record_placed',
+        key=rollups.PLACED_JOB_KEY.format(order.pk),
+        order_ids=[order.pk],
+    )
+    jobs.enqueue(
+        'orders.send_confirmation', key=f'order-confirmation:{order.pk}', order_id=order.pk
+    )
+    jobs.enqueue('stock.check_low_stock', product_ids=sorted(set(product_ids)))
+
+
+@jobs.task('rollups.record_placed')
+def record_placed(order_ids):
+    rollups.record_placed(order_ids)
+
+
+@jobs.task('orders.send_confirmation', atomic=False)
+def send_confirmation(order_id):
+    order = Order.objects.select_related('user').get(pk=order_id)
+    if order.user is None or not order.user.email:
+        return
+    send_mail(
+        f'Order {order.order_number} received',
+        f'Thank you for your order {order.order_number} of {order.total_amount}. '
+        'We will let you know when it ships.',
+        settings.DEFAULT_FROM_EMAIL,
+        [order.user.email],
+    )
+
+
+@jobs.task('stock.check_low_stock')
+def check_low_stock(product_ids):
+    """Queue one supplier notification per product at or below its reorder level"""
+    low = Inventory.objects.filter(
+        product_id__in=product_ids,
+        quantity__lte=F('reserved_quantity') + F('reorder_level'),
+    ).values_list('product_id', flat=True)
+    today = timezone.localdate().isoformat()
+    for product_id in low:
+        # At most one notification per product and day
+        jobs.enqueue(
+            'stock.notify_supplier',
+            key=f'low-stock:{product_id}:{today}',
+            product_id=product_id,
+        )
+
+
+@jobs.task('stock.notify_supplier', atomic=False)
+def notify_supplier(product_id):
+    link = (
+        ProductSupplier.objects
+        .select_related('supplier', 'product__inventory')
+        .filter(product_id=product_id)
+        .order_by('-is_primary', 'supplier_price')
+        .first()
+    )
+    if link is None:
+        return
+    product, inventory = link.product, link.product.inventory
+    send_mail(
+        f'Reorder request: {product.name}',
+        f'{product.name} ({product.sku or product.pk}) is down to '
+        f'{inventory.available_quantity} available, at a reorder level of '
+        f'{inventory.reorder_level}. Please get in touch about a new delivery.',
+        settings.DEFAULT_FROM_EMAIL,
+        [link.supplier.email],
+    )
+
+
+def schedule_snapshots(interval=ledger.SNAPSHOT_INTERVAL):
+    """Queue the stock ledger snapshot pass of the next ``interval``, once"""
+    now = time.time()
+    slot = int(now // interval) + 1
+    jobs.enqueue(
+        'stock.take_snapshots', key=f'stock-snapshots:{slot}', delay=slot * interval - now
+    )
+
+
+@jobs.task('stock.take_snapshots', atomic=False)
+def take_snapshots():
+    ledger.take_snapshots()
+    schedule_snapshots()
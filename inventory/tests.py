@@ -1,3 +1,972 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import tempfile
+import threading
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+from pathlib import Path
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_init
+from django.test import (
+    AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from inventory import (
+    async_views, cache, exports, importer, jobs, ledger, metrics, replenishment, rollups,
+    stats, upserts,
+)
+from inventory.models import (
+    Cart, CartItem, Category, CategoryDailySales, DailySales, Inventory, Job, Order,
+    OrderItem, Product, ProductDailySales, ProductSupplier, PurchaseOrder,
+    PurchaseOrderItem, StatCounter, StockMovement, StockSnapshot, Supplier,
+)
+from inventory.serializers import (
+    CartItemSerializer, CartSerializer, OrderListSerializer, OrderSerializer,
+    ProductListSerializer, ProductSerializer, PurchaseOrderListSerializer,
+    PurchaseOrderSerializer, UserSerializer,
+)
+
+CHECKOUT = {"shipping_address": "1 Test Road", "shipping_phone": "0123456789"}
+
+
+def make_products(count, quantity=100, category=None):
+    """``count`` active products, each with ``quantity`` in stock"""
+    if category is None:
+        category = Category.objects.get_or_create(name="Test category")[0]
+    products = Product.objects.bulk_create(
+        [
+            Product(name=f"Product {n}", category=category, price=Decimal("9.99"))
+            for n in range(count)
+        ]
+    )
+    Inventory.objects.bulk_create(
+        [Inventory(product=product, quantity=quantity) for product in products]
+    )
+    return products
+
+
+def make_user(username, products=(), quantity=1):
+    """A user whose cart holds ``quantity`` of each of ``products``"""
+    user = User.objects.create_user(username, f"{username}@example.com")
+    CartItem.objects.bulk_create(
+        [CartItem(cart=user.cart, product=product, quantity=quantity) for product in products]
+    )
+    return user
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+class CheckoutQueryTests(TestCase):
+    # Cart, lines, stock lock, reservation, ledger, order, counters, items,
+    # three jobs, cart clear, response order and items, savepoint and release
+    QUERIES = 16
+
+    def checkout(self, lines):
+        user = make_user(f"buyer{lines}", make_products(lines))
+        with self.assertNumQueries(self.QUERIES):
+            response = client_for(user).post(reverse("api-order-list"), CHECKOUT, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["items"]), lines)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.checkout(2)
+        self.checkout(40)
+
+    def test_order_matches_cart(self):
+        products = make_products(3, quantity=5)
+        user = make_user("buyer", products, quantity=2)
+        client_for(user).post(reverse("api-order-list"), CHECKOUT, format="json")
+
+        order = Order.objects.get(user=user)
+        self.assertEqual(order.subtotal, Decimal("59.94"))
+        self.assertFalse(CartItem.objects.filter(cart__user=user).exists())
+        self.assertEqual(
+            list(Inventory.objects.values_list("reserved_quantity", flat=True)), [2, 2, 2]
+        )
+
+
+
+class CartAddQueryTests(TestCase):
+    # Product with its stock and category, cart, existing line, then the
+    # INSERT or UPDATE; the response is rendered from what was loaded
+    QUERIES = 4
+
+    def setUp(self):
+        [self.product] = make_products(1, quantity=5)
+        self.client = client_for(make_user("buyer"))
+
+    def add(self, quantity):
+        with self.assertNumQueries(self.QUERIES):
+            response = self.client.post(
+                reverse("api-cart-items"),
+                {"product_id": self.product.pk, "quantity": quantity},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response
+
+    def test_new_and_merged_lines(self):
+        self.assertEqual(self.add(2).data["quantity"], 2)
+        response = self.add(3)
+        self.assertEqual(response.data["quantity"], 5)
+        self.assertEqual(response.data["product"]["id"], self.product.pk)
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+
+
+class CartBatchTests(TestCase):
+    # Cart lock, products with stock and lines, upsert, response cart and
+    # items, savepoint and release
+    QUERIES = 7
+
+    def setUp(self):
+        self.products = make_products(3, quantity=5)
+        self.user = make_user("buyer", self.products[:2], quantity=2)
+        self.client = client_for(self.user)
+
+    def batch(self, *operations):
+        return self.client.post(
+            reverse("api-cart-items-batch"), {"operations": list(operations)}, format="json"
+        )
+
+    def cart(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list("product_id", "quantity"))
+
+    def test_quantities_merge_into_existing_lines(self):
+        first, second, third = self.products
+        response = self.batch(
+            {"op": "add", "product_id": first.pk, "quantity": 1},
+            {"op": "add", "product_id": third.pk, "quantity": 2},
+            {"op": "add", "product_id": first.pk, "quantity": 1},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.cart(), {first.pk: 4, second.pk: 2, third.pk: 2})
+        self.assertEqual(response.data["total_items"], 8)
+
+    def test_set_and_remove(self):
+        first, second, third = self.products
+        response = self.batch(
+            {"op": "set", "product_id": first.pk, "quantity": 5},
+            {"op": "remove", "product_id": second.pk},
+            {"op": "set", "product_id": third.pk, "quantity": 1},
+            {"op": "set", "product_id": third.pk, "quantity": 0},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.cart(), {first.pk: 5})
+
+    def test_batch_is_rejected_as_a_whole(self):
+        first, second, third = self.products
+        Product.objects.filter(pk=third.pk).update(is_active=False)
+        for invalid in (
+            {"op": "add", "product_id": second.pk, "quantity": 4},  # 6 of 5 in stock
+            {"op": "add", "product_id": third.pk, "quantity": 1},  # inactive
+        ):
+            with self.subTest(invalid=invalid):
+                response = self.batch({"op": "remove", "product_id": first.pk}, invalid)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(response.data["errors"][0]["index"], 1)
+                self.assertEqual(self.cart(), {first.pk: 2, second.pk: 2})
+
+    def test_added_lines_are_counted_on_commit(self):
+        def added():
+            return metrics.CART_ITEMS_ADDED.values.get(("api", "created"), 0)
+
+        before = added()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch({"op": "add", "product_id": self.products[2].pk, "quantity": 1})
+            self.assertEqual(added(), before)
+        self.assertEqual(added(), before + 1)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        for size in (2, 40):
+            operations = [
+                {"op": "add", "product_id": product.pk, "quantity": 1}
+                for product in make_products(size)
+            ]
+            with self.assertNumQueries(self.QUERIES):
+                response = self.batch(*operations)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class MetricsTests(TestCase):
+    def placed(self):
+        return metrics.CHECKOUTS.values.get(("api", metrics.CHECKOUT_PLACED), 0)
+
+    def test_placed_checkout_is_counted_on_commit(self):
+        user = make_user("buyer", make_products(2))
+        before = self.placed()
+        with self.captureOnCommitCallbacks(execute=True):
+            client_for(user).post(reverse("api-order-list"), CHECKOUT, format="json")
+            self.assertEqual(self.placed(), before)
+        self.assertEqual(self.placed(), before + 1)
+
+    def test_status_change_is_counted_on_commit(self):
+        user = make_user("buyer", make_products(1))
+        order_id = client_for(user).post(reverse("api-order-list"), CHECKOUT, format="json").data["id"]
+        admin = client_for(User.objects.create_superuser("admin", "admin@example.com"))
+        key = (Order.STATUS_PENDING, Order.STATUS_CONFIRMED)
+        before = metrics.ORDER_STATUS_CHANGES.values.get(key, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.patch(
+                reverse("api-update-order-status", args=[order_id]),
+                {"status": Order.STATUS_CONFIRMED},
+                format="json",
+            )
+            self.assertEqual(metrics.ORDER_STATUS_CHANGES.values.get(key, 0), before)
+        self.assertEqual(metrics.ORDER_STATUS_CHANGES.values[key], before + 1)
+
+    def test_requests_do_not_write_the_metrics_file(self):
+        user = make_user("buyer")
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            client_for(user).get(reverse("api-cart"))
+            self.assertEqual(list(Path(directory).iterdir()), [])
+
+            metrics.flush()
+            self.assertEqual(len(list(Path(directory).glob("*.json"))), 1)
+
+
+class OrderStatusTests(TestCase):
+    def setUp(self):
+        [self.product] = make_products(1, quantity=10)
+        user = make_user("buyer", [self.product], quantity=3)
+        client_for(user).post(reverse("api-order-list"), CHECKOUT, format="json")
+        self.order = Order.objects.get()
+        admin = User.objects.create_superuser("admin", "admin@example.com")
+        self.admin = client_for(admin)
+
+    def patch_status(self, new_status):
+        return self.admin.patch(
+            reverse("api-update-order-status", args=[self.order.pk]),
+            {"status": new_status},
+            format="json",
+        )
+
+    def stock(self):
+        inventory = Inventory.objects.get()
+        return inventory.quantity, inventory.reserved_quantity
+
+    def test_delivery_settles_stock(self):
+        response = self.patch_status(Order.STATUS_DELIVERED)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], Order.STATUS_DELIVERED)
+        self.assertIsNotNone(response.data["delivered_date"])
+        self.assertEqual(self.stock(), (7, 0))
+
+    def test_invalid_transition_is_rejected(self):
+        self.patch_status(Order.STATUS_DELIVERED)
+        response = self.patch_status(Order.STATUS_CANCELLED)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.STATUS_DELIVERED)
+        self.assertEqual(self.stock(), (7, 0))
+
+    def test_unknown_order(self):
+        response = self.admin.patch(
+            reverse("api-update-order-status", args=[self.order.pk + 1]),
+            {"status": Order.STATUS_SHIPPED},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_order_detail_update_uses_the_same_checks(self):
+        url = reverse("api-admin-order-detail", args=[self.order.pk])
+        response = self.admin.patch(url, {"status": Order.STATUS_CANCELLED}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], Order.STATUS_CANCELLED)
+        self.assertEqual(self.stock(), (10, 0))
+
+        response = self.admin.patch(url, {"status": Order.STATUS_DELIVERED}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.stock(), (10, 0))
+
+    def test_bulk_endpoint_reports_invalid_transitions(self):
+        self.patch_status(Order.STATUS_DELIVERED)
+        response = self.admin.post(
+            reverse("api-bulk-update-order-status"),
+            {"order_ids": [self.order.pk], "status": Order.STATUS_CANCELLED},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["outcome"], "invalid_transition")
+        self.assertEqual(self.stock(), (7, 0))
+
+
+class EagerLoadingTests(TestCase):
+    """Every serializer renders 1 or N rows, whatever their relations, in the same queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        suppliers = Supplier.objects.bulk_create(
+            [Supplier(name=f"Supplier {n}", email=f"s{n}@example.com", phone="1") for n in range(3)]
+        )
+        products = make_products(6)
+        ProductSupplier.objects.bulk_create(
+            [
+                ProductSupplier(product=product, supplier=supplier, supplier_price=Decimal("5"))
+                for n, product in enumerate(products)
+                for supplier in suppliers[:n % 3 + 1]
+            ]
+        )
+        for n in range(4):
+            user = make_user(f"customer{n}", products[:n + 1])
+            order = Order.objects.create(user=user)
+            OrderItem.objects.bulk_create(
+                [
+                    OrderItem(order=order, product=product, quantity=1, unit_price=product.price)
+                    for product in products[:n + 1]
+                ]
+            )
+        for n, supplier in enumerate(suppliers):
+            purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+            PurchaseOrderItem.objects.bulk_create(
+                [
+                    PurchaseOrderItem(
+                        purchase_order=purchase_order, product=product, quantity=5, unit_cost=Decimal("5")
+                    )
+                    for product in products[:n + 2]
+                ]
+            )
+
+    def render(self, serializer_class, queryset):
+        with CaptureQueriesContext(connection) as context:
+            rows = serializer_class(serializer_class.setup_eager_loading(queryset), many=True).data
+        return len(rows), len(context)
+
+    def assertConstantQueries(self, serializer_class, queryset):
+        queryset = queryset.order_by("pk")
+        one, one_queries = self.render(serializer_class, queryset[:1])
+        many, many_queries = self.render(serializer_class, queryset)
+        self.assertEqual(one, 1)
+        self.assertGreater(many, 1)
+        self.assertEqual(many_queries, one_queries, serializer_class.__name__)
+
+    def test_products(self):
+        self.assertConstantQueries(ProductSerializer, Product.objects.all())
+        self.assertConstantQueries(ProductListSerializer, Product.objects.all())
+
+    def test_users(self):
+        self.assertConstantQueries(UserSerializer, User.objects.all())
+
+    def test_carts(self):
+        self.assertConstantQueries(CartSerializer, Cart.objects.with_totals())
+        self.assertConstantQueries(CartItemSerializer, CartItem.objects.all())
+
+    def test_orders(self):
+        self.assertConstantQueries(OrderSerializer, Order.objects.all())
+        self.assertConstantQueries(OrderListSerializer, Order.objects.all())
+
+    def test_purchase_orders(self):
+        self.assertConstantQueries(PurchaseOrderSerializer, PurchaseOrder.objects.all())
+        self.assertConstantQueries(PurchaseOrderListSerializer, PurchaseOrder.objects.all())
+
+
+class DashboardCounterTests(TestCase):
+    def assertCountersMatch(self):
+        self.assertEqual(stats.dashboard(), stats.compute())
+
+    def test_saves_and_deletes_keep_counters_current(self):
+        products = make_products(3, quantity=50)
+        user = make_user("customer")
+        # The fixtures are bulk-created, bypassing the signals
+        stats.rebuild()
+        order = Order.objects.create(user=user, total_amount=Decimal("10.00"))
+        self.assertCountersMatch()
+
+        order.status = Order.STATUS_CONFIRMED
+        order.total_amount = Decimal("12.50")
+        order.save()
+        products[0].is_active = False
+        products[0].save(update_fields=["is_active"])
+        inventory = Inventory.objects.get(product=products[1])
+        inventory.quantity = 5
+        inventory.save()
+        self.assertCountersMatch()
+
+        # Saving only other fields leaves the counters alone
+        inventory.quantity = 500
+        inventory.save(update_fields=["updated_at"])
+        self.assertEqual(stats.dashboard()[stats.LOW_STOCK_PRODUCTS], 1)
+
+        order.delete()
+        products[1].delete()
+        self.assertCountersMatch()
+
+    def test_stale_instances_are_diffed_against_the_stored_row(self):
+        order = Order.objects.create(user=make_user("customer"))
+        stats.rebuild()
+        first, second = Order.objects.get(), Order.objects.get()
+        first.status = Order.STATUS_CONFIRMED
+        first.save()
+        second.status = Order.STATUS_CANCELLED
+        second.save()
+        self.assertEqual(stats.dashboard()[stats.PENDING_ORDERS], 0)
+        self.assertCountersMatch()
+
+    def test_catalog_import_adjusts_counters(self):
+        stats.rebuild()
+        summary = importer.import_catalog(io.StringIO(
+            "sku,name,category,price,quantity,reorder_level\n"
+            "A,Apples,Fruit,1.00,5,10\n"
+            "B,Bananas,Fruit,2.00,50,10\n"
+            "C,Cherries,Fruit,3.00,0,0\n"
+        ), "csv")
+        self.assertEqual((summary["created"], summary["errors"]), (3, 0))
+        self.assertCountersMatch()
+
+        summary = importer.import_catalog(io.StringIO(
+            "sku,is_active,quantity,reorder_level\n"
+            "A,true,20,\n"
+            "B,false,5,\n"
+            "C,,,5\n"
+            "A,,,30\n"
+        ), "csv", batch_size=2)
+        self.assertEqual((summary["updated"], summary["errors"]), (4, 0))
+        self.assertCountersMatch()
+        self.assertEqual(stats.dashboard()[stats.TOTAL_PRODUCTS], 2)
+
+    def test_loading_rows_does_no_bookkeeping(self):
+        make_products(3)
+        self.assertFalse(post_init.has_listeners(Product))
+        with self.assertNumQueries(1):
+            list(Product.objects.all())
+
+
+class UpsertTests(TestCase):
+    def test_conflict_target_only_where_supported(self):
+        self.assertEqual(
+            upserts.options(["name"], ["value"]),
+            {"update_conflicts": True, "update_fields": ["value"], "unique_fields": ["name"]},
+        )
+        # MySQL rejects a conflict target
+        with mock.patch.object(connection.features, "supports_update_conflicts_with_target", False):
+            self.assertEqual(
+                upserts.options(["name"], ["value"]),
+                {"update_conflicts": True, "update_fields": ["value"]},
+            )
+
+    def test_rebuild_overwrites_stored_counters(self):
+        stats.rebuild()
+        make_products(2)
+        self.assertEqual(stats.rebuild()[stats.TOTAL_PRODUCTS], 2)
+        self.assertEqual(StatCounter.objects.get(name=stats.TOTAL_PRODUCTS).value, 2)
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.products = make_products(2, quantity=10)
+        # The fixtures are bulk-created, so their opening stock is recorded here
+        ledger.adjust([product.pk for product in self.products])
+        self.admin = client_for(User.objects.create_superuser("admin", "admin@example.com"))
+
+    def place_order(self, username, quantity):
+        user = make_user(username, self.products, quantity=quantity)
+        response = client_for(user).post(reverse("api-order-list"), CHECKOUT, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def move(self, order_id, new_status):
+        self.admin.patch(
+            reverse("api-update-order-status", args=[order_id]), {"status": new_status}, format="json"
+        )
+
+    def assertLedgerMatches(self):
+        self.assertEqual(ledger.reconcile(workers=1), [])
+        for inventory in Inventory.objects.all():
+            self.assertEqual(
+                ledger.level(inventory.product_id),
+                (inventory.quantity, inventory.reserved_quantity),
+            )
+
+    def test_movements_add_up_to_the_stock(self):
+        delivered = self.place_order("first", 3)
+        cancelled = self.place_order("second", 2)
+        self.place_order("third", 1)
+        self.move(delivered, Order.STATUS_DELIVERED)
+        self.move(cancelled, Order.STATUS_CANCELLED)
+
+        inventory = Inventory.objects.get(product=self.products[0])
+        self.assertEqual((inventory.quantity, inventory.reserved_quantity), (7, 1))
+        kinds = set(StockMovement.objects.values_list("kind", flat=True))
+        self.assertEqual(kinds, {
+            StockMovement.KIND_ADJUST, StockMovement.KIND_RESERVE,
+            StockMovement.KIND_SELL, StockMovement.KIND_RELEASE,
+        })
+        self.assertLedgerMatches()
+
+    def test_reconcile_reports_and_adjust_fixes_drift(self):
+        product = self.products[1]
+        # A write that bypasses stock, such as a manual edit
+        Inventory.objects.filter(product=product).update(quantity=F("quantity") + 3)
+        self.assertEqual(ledger.reconcile(workers=1), [(product.pk, 13, 0, 10, 0)])
+
+        self.assertEqual(len(ledger.adjust([product.pk])), 1)
+        self.assertLedgerMatches()
+
+    def test_snapshot_plus_later_movements_give_the_level(self):
+        self.place_order("first", 2)
+        with mock.patch.object(ledger, "SETTLE_TIME", timedelta(0)):
+            self.assertEqual(ledger.take_snapshots(), 2)
+        upto = StockSnapshot.objects.values_list("movement_id", flat=True).first()
+        self.place_order("second", 3)
+
+        # The movements a snapshot covers are no longer read
+        StockMovement.objects.filter(id__lte=upto).delete()
+        self.assertLedgerMatches()
+        self.assertEqual(ledger.level(self.products[0].pk), (10, 5))
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.products = make_products(2)
+        self.admin = client_for(User.objects.create_superuser("admin", "admin@example.com"))
+
+    def place_order(self, username):
+        user = make_user(username, self.products, quantity=2)
+        client_for(user).post(reverse("api-order-list"), CHECKOUT, format="json")
+        return Order.objects.get(user=user)
+
+    def rollups(self):
+        return [
+            sorted(model.objects.values_list(*keys, *rollups.FIELDS))
+            for model, keys in (
+                (DailySales, ("date",)),
+                (ProductDailySales, ("date", "product_id")),
+                (CategoryDailySales, ("date", "category_id")),
+            )
+        ]
+
+    def assertMatchesRebuild(self):
+        current = self.rollups()
+        rollups.rebuild()
+        self.assertEqual(current, self.rollups())
+
+    def test_placement_job_adds_the_order_once(self):
+        order = self.place_order("buyer")
+        self.assertEqual(DailySales.objects.count(), 0)
+        jobs.run_pending()
+        order.refresh_from_db()
+        self.assertTrue(order.rolled_up)
+        self.assertEqual(DailySales.objects.get().units, 4)
+
+        # A second run of the same job, say after its lock timed out
+        with transaction.atomic():
+            self.assertEqual(rollups.record_placed([order.pk]), 0)
+        self.assertEqual(DailySales.objects.get().units, 4)
+        self.assertMatchesRebuild()
+
+    def test_orders_of_failed_jobs_are_caught_up(self):
+        order = self.place_order("buyer")
+        Job.objects.filter(name="rollups.record_placed").update(status=Job.STATUS_FAILED)
+        self.admin.patch(
+            reverse("api-update-order-status", args=[order.pk]),
+            {"status": Order.STATUS_DELIVERED},
+            format="json",
+        )
+        self.assertEqual(DailySales.objects.count(), 0)
+
+        self.assertEqual(rollups.record_pending(), 1)
+        row = DailySales.objects.get()
+        self.assertEqual((row.orders, row.delivered_orders), (1, 1))
+        self.assertMatchesRebuild()
+
+    def test_status_changes_after_placement(self):
+        delivered = self.place_order("first")
+        cancelled = self.place_order("second")
+        jobs.run_pending()
+        for order, new_status in ((delivered, Order.STATUS_DELIVERED), (cancelled, Order.STATUS_CANCELLED)):
+            self.admin.patch(
+                reverse("api-update-order-status", args=[order.pk]),
+                {"status": new_status},
+                format="json",
+            )
+        row = DailySales.objects.get()
+        self.assertEqual((row.orders, row.delivered_orders), (1, 1))
+        self.assertMatchesRebuild()
+
+    def test_rebuild_marks_orders_rolled_up(self):
+        order = self.place_order("buyer")
+        rollups.rebuild()
+        order.refresh_from_db()
+        self.assertTrue(order.rolled_up)
+        jobs.run_pending()
+        self.assertEqual(DailySales.objects.get().orders, 1)
+
+    def test_rebuild_drops_days_without_orders(self):
+        DailySales.objects.create(date=timezone.localdate() - timedelta(days=30), orders=1)
+        self.place_order("buyer")
+        rollups.rebuild()
+        self.assertEqual(DailySales.objects.get().date, timezone.localdate())
+
+
+class SalesRollupRebuildTests(TransactionTestCase):
+    def test_each_window_is_committed_before_the_next(self):
+        user = make_user("buyer")
+        orders = Order.objects.bulk_create(
+            [Order(user=user, order_number=f"ORD-{n}") for n in range(3)]
+        )
+        for days_ago, order in enumerate(orders):
+            Order.objects.filter(pk=order.pk).update(
+                order_date=timezone.now() - timedelta(days=days_ago)
+            )
+        done = []
+
+        def progress(total):
+            self.assertFalse(connection.in_atomic_block)
+            self.assertEqual(Order.objects.filter(rolled_up=True).count(), total)
+            done.append(total)
+
+        self.assertEqual(rollups.rebuild(chunk_days=1, progress=progress), 3)
+        self.assertEqual(done, [1, 2, 3])
+
+
+class ReplenishmentTests(TestCase):
+    def setUp(self):
+        # Five products at their reorder level of 10, split over two suppliers
+        self.products = make_products(5, quantity=10)
+        suppliers = Supplier.objects.bulk_create(
+            [Supplier(name=f"Supplier {n}", email=f"s{n}@example.com", phone="1") for n in range(2)]
+        )
+        ProductSupplier.objects.bulk_create(
+            ProductSupplier(
+                product=product, supplier=suppliers[n % 2], supplier_price=Decimal("2.50")
+            )
+            for n, product in enumerate(self.products)
+        )
+
+    def test_orders_every_product_once_across_batches(self):
+        summary = replenishment.replenish(batch_size=2)
+        self.assertEqual((summary["purchase_orders"], summary["lines"]), (2, 5))
+        self.assertEqual(summary["total_cost"], Decimal("125.00"))
+        for purchase_order in PurchaseOrder.objects.all():
+            self.assertEqual(
+                purchase_order.total_cost,
+                sum(line.quantity * line.unit_cost for line in purchase_order.items.all()),
+            )
+        self.assertEqual(
+            list(Inventory.objects.values_list("incoming_quantity", flat=True)), [10] * 5
+        )
+        self.assertEqual(replenishment.replenish(batch_size=2)["lines"], 0)
+
+    def test_products_left_at_the_reorder_level_are_not_ordered_again(self):
+        # Ordering up to the reorder level itself leaves them candidates
+        Inventory.objects.update(quantity=5)
+        summary = replenishment.replenish(target_factor=1, batch_size=2)
+        self.assertEqual(summary["lines"], 5)
+        self.assertEqual(PurchaseOrderItem.objects.count(), 5)
+
+    def test_pages_start_after_the_last_product_seen(self):
+        with CaptureQueriesContext(connection) as queries:
+            replenishment.replenish(batch_size=2)
+        pages = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith("SELECT") and "best_supplier_id" in query["sql"]
+            and "ORDER BY" in query["sql"]
+        ]
+        # Three pages of at most two products and the empty one that ends the scan
+        self.assertEqual(len(pages), 4)
+        self.assertNotIn("NOT (", pages[1])
+        self.assertIn('"inventory_inventory"."product_id" >', pages[1])
+
+    def test_dry_run_writes_nothing(self):
+        summary = replenishment.replenish(dry_run=True, batch_size=2)
+        self.assertEqual((summary["purchase_orders"], summary["lines"]), (2, 5))
+        self.assertFalse(PurchaseOrder.objects.exists())
+        self.assertEqual(
+            list(Inventory.objects.values_list("incoming_quantity", flat=True)), [0] * 5
+        )
+
+
+def take_over(name):
+    """Claim job ``name`` for another worker, as one does after the lock times out"""
+    Job.objects.filter(name=name).update(locked_by="other", locked_at=timezone.now())
+
+
+@jobs.task("tests.taken_over", atomic=False)
+def taken_over(fail=False):
+    take_over("tests.taken_over")
+    if fail:
+        raise RuntimeError("Failed after losing the lock")
+
+
+@jobs.task("tests.taken_over_atomic")
+def taken_over_atomic():
+    Category.objects.create(name="Written by the slow worker")
+    take_over("tests.taken_over_atomic")
+
+
+class JobTests(TestCase):
+    def run_job(self, name, **payload):
+        job = jobs.enqueue(name, **payload)
+        self.assertEqual(jobs.claim("slow", 1), [job.pk])
+        with self.assertLogs("inventory.jobs", "WARNING"):
+            outcome = jobs.execute(job.pk, "slow")
+        job.refresh_from_db()
+        return job, outcome
+
+    def test_outcome_is_not_recorded_over_a_new_claim(self):
+        for fail in (False, True):
+            job, outcome = self.run_job("tests.taken_over", fail=fail)
+            self.assertEqual(outcome, jobs.LOST)
+            self.assertEqual(
+                (job.status, job.locked_by, job.attempts, job.last_error),
+                (Job.STATUS_RUNNING, "other", 0, ""),
+            )
+            job.delete()
+
+    def test_atomic_task_writes_are_rolled_back_with_a_lost_claim(self):
+        job, outcome = self.run_job("tests.taken_over_atomic")
+        self.assertEqual(outcome, jobs.LOST)
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_RUNNING, 0))
+        self.assertFalse(Category.objects.exists())
+
+    def test_job_claimed_by_another_worker_is_skipped(self):
+        job = jobs.enqueue("tests.taken_over_atomic")
+        jobs.claim("other", 1)
+        with self.assertLogs("inventory.jobs", "WARNING"):
+            self.assertEqual(jobs.execute(job.pk, "slow"), jobs.LOST)
+        self.assertFalse(Category.objects.exists())
+
+
+class ExportMemoryTests(TestCase):
+    CHUNK_SIZE = 100
+
+    def peak(self, name, fmt):
+        """Peak bytes allocated while streaming an export to nowhere"""
+        tracemalloc.start()
+        try:
+            for chunk in exports.stream(name, fmt, chunk_size=self.CHUNK_SIZE):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_peak_memory_does_not_grow_with_rows(self):
+        make_products(300)
+        small = {
+            (name, fmt): self.peak(name, fmt)
+            for name in ("products", "stock") for fmt in exports.FORMATS
+        }
+        make_products(2700)
+        for (name, fmt), peak in small.items():
+            with self.subTest(export=name, format=fmt):
+                # Ten times the rows, within a quarter of the memory
+                self.assertLess(self.peak(name, fmt), peak * 1.25)
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are read from SQLite")
+class QueryPlanTests(TestCase):
+    """The hot list queries, as the views run them, walk an index in order"""
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.category = Category.objects.create(name="Planned")
+        make_products(25, category=self.category)
+        self.user = make_user("buyer")
+        Order.objects.bulk_create(
+            [Order(user=self.user, order_number=f"ORD-{n}") for n in range(25)]
+        )
+        self.admin = client_for(User.objects.create_superuser("admin", "admin@example.com"))
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return " | ".join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, client, url, table, index, **params):
+        """Check the first and the next page of a list read from ``table``"""
+        for page in ("first", "next"):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            [sql] = [
+                query["sql"] for query in queries.captured_queries
+                if query["sql"].startswith("SELECT") and f'FROM "{table}"' in query["sql"]
+                and "LIMIT" in query["sql"]
+            ]
+            plan = self.plan(sql)
+            with self.subTest(url=url, page=page, **params):
+                self.assertIn(f"INDEX {index}", plan)
+                # Sorting the rows would mean reading all of them first
+                self.assertNotIn("TEMP B-TREE", plan)
+            url = response.data["next"]
+            params = {}
+
+    def test_catalog(self):
+        client = APIClient()
+        url = reverse("api-product-list")
+        self.assertUsesIndex(client, url, "inventory_product", "product_active_name_idx")
+        self.assertUsesIndex(
+            client, url, "inventory_product", "product_active_category_idx",
+            category=self.category.pk,
+        )
+
+    def test_order_lists(self):
+        self.assertUsesIndex(
+            client_for(self.user), reverse("api-order-list"),
+            "inventory_order", "order_user_date_id_idx",
+        )
+        url = reverse("api-admin-order-list")
+        self.assertUsesIndex(self.admin, url, "inventory_order", "order_date_id_idx")
+        self.assertUsesIndex(
+            self.admin, url, "inventory_order", "order_status_date_id_idx",
+            status=Order.STATUS_PENDING,
+        )
+
+    def test_low_stock_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            stats.compute()
+        [sql] = [
+            query["sql"] for query in queries.captured_queries
+            if 'FROM "inventory_inventory"' in query["sql"]
+        ]
+        self.assertIn("INDEX inventory_low_stock_idx", self.plan(sql))
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.products = make_products(3)
+        self.client = APIClient()
+        self.url = reverse("api-product-list")
+
+    def test_warm_read_runs_no_sql(self):
+        cold = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            warm = self.client.get(self.url)
+        self.assertEqual(warm.status_code, status.HTTP_200_OK)
+        self.assertEqual(warm.data, cold.data)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url, {"search": "nothing matches this"})
+        self.assertEqual(response.data["results"], [])
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_unchanged_catalog_answers_304(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_stock_change_bumps_the_version_on_commit(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertTrue(all(product["in_stock"] for product in response.data["results"]))
+        version = cache.current_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory = Inventory.objects.get(product=self.products[0])
+            inventory.quantity = 0
+            inventory.save()
+            # Nothing is invalidated before the transaction commits
+            self.assertEqual(cache.current_version(), version)
+        self.assertGreater(cache.current_version(), version)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        in_stock = {product["id"]: product["in_stock"] for product in response.data["results"]}
+        self.assertFalse(in_stock[self.products[0].pk])
+
+
+class AsyncCartTests(TestCase):
+    async def get_cart(self, user):
+        request = AsyncRequestFactory().get(reverse("api-cart"))
+        request.user = user
+        return await async_views.cart_detail(request)
+
+    async def get_cart_with_basic_auth(self, username, password):
+        credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        request = AsyncRequestFactory().get(
+            reverse("api-cart"), headers={"Authorization": f"Basic {credentials}"}
+        )
+        request.user = AnonymousUser()
+        return await async_views.cart_detail(request)
+
+    async def test_cart_is_created_on_first_read(self):
+        user = await User.objects.acreate(username="buyer")
+        await Cart.objects.filter(user=user).adelete()
+
+        response = await self.get_cart(user)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(await Cart.objects.filter(user=user).aexists())
+
+    async def test_accepts_basic_authentication(self):
+        await sync_to_async(User.objects.create_user)("buyer", password="secret")
+
+        response = await self.get_cart_with_basic_auth("buyer", "secret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    async def test_rejects_what_the_sync_view_rejects(self):
+        await sync_to_async(User.objects.create_user)("buyer", password="secret")
+
+        response = await self.get_cart_with_basic_auth("buyer", "wrong")
+        expected = await sync_to_async(APIClient().get)(
+            reverse("api-cart"),
+            HTTP_AUTHORIZATION="Basic " + base64.b64encode(b"buyer:wrong").decode(),
+        )
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content), expected.json())
+
+        response = await self.get_cart(AnonymousUser())
+        expected = await sync_to_async(APIClient().get)(reverse("api-cart"))
+        self.assertEqual(response.status_code, expected.status_code)
+
+    async def test_matches_the_sync_view(self):
+        user = await sync_to_async(make_user)("buyer", await sync_to_async(make_products)(3), 2)
+
+        response = await self.get_cart(user)
+        expected = await sync_to_async(client_for(user).get)(reverse("api-cart"))
+        self.assertEqual(json.loads(response.content), expected.json())
+
+
+# Checkouts queued behind the write lock are slow by design, not worth logging
+@override_settings(INSTRUMENTATION_SLOW_QUERY_MS=60_000)
+class ConcurrentCheckoutTests(TransactionTestCase):
+    BUYERS = 300
+    STOCK = 10
+
+    def test_last_units_are_sold_exactly_once(self):
+        [product] = make_products(1, quantity=self.STOCK)
+        buyers = [make_user(f"buyer{n}", [product]) for n in range(self.BUYERS)]
+        start = threading.Barrier(len(buyers))
+        responses = []
+
+        def checkout(user):
+            try:
+                start.wait()
+                responses.append(
+                    client_for(user).post(reverse("api-order-list"), CHECKOUT, format="json")
+                )
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=[user]) for user in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        codes = [response.status_code for response in responses]
+        self.assertEqual(len(codes), self.BUYERS)
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), self.STOCK)
+        self.assertEqual(codes.count(status.HTTP_409_CONFLICT), self.BUYERS - self.STOCK)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+        inventory = Inventory.objects.get()
+        self.assertEqual(inventory.reserved_quantity, self.STOCK)
+        self.assertEqual(inventory.available_quantity, 0)
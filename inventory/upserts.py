@@ -0,0 +1,21 @@
+# upserts.py
+"""
+Portable ``bulk_create`` upserts.
+
+PostgreSQL and SQLite need the unique fields a conflict is detected on,
+while MySQL updates on a conflict with any unique key and rejects a target.
+``options`` returns the ``bulk_create`` arguments that suit the backend::
+
+    CartItem.objects.bulk_create(
+        items, **upserts.options(['cart', 'product'], ['quantity', 'updated_at'])
+    )
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def options(unique_fields, update_fields, using=DEFAULT_DB_ALIAS):
+    """bulk_create arguments updating rows that conflict on ``unique_fields``"""
+    arguments = {'update_conflicts': True, 'update_fields': update_fields}
+    if connections[using].features.supports_update_conflicts_with_target:
+        arguments['unique_fields'] = unique_fields
+    return arguments
@@ -1,25 +1,41 @@
 # urls.py
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
 
+# Under ASGI the catalog and cart reads are served by native async views
+if settings.ASYNC_READ_VIEWS:
+    from . import async_views
+
+    product_list = async_views.product_list
+    product_detail = async_views.product_detail
+    category_list = async_views.category_list
+    cart_detail = async_views.cart_detail
+else:
+    product_list = views.ProductListAPIView.as_view()
+    product_detail = views.ProductDetailAPIView.as_view()
+    category_list = views.CategoryListAPIView.as_view()
+    cart_detail = views.CartAPIView.as_view()
+
 # API URLs
 urlpatterns = [
     # Authentication will be handled by Django REST framework's built-in views
     # Products (Public access)
-    path('products/', views.ProductListAPIView.as_view(), name='api-product-list'),
-    path('products/<int:pk>/', views.ProductDetailAPIView.as_view(), name='api-product-detail'),
+    path('products/', product_list, name='api-product-list'),
+    path('products/<int:pk>/', product_detail, name='api-product-detail'),
     
     # Categories (Public access)
-    path('categories/', views.CategoryListAPIView.as_view(), name='api-category-list'),
+    path('categories/', category_list, name='api-category-list'),
     
     # User Profile (Authenticated users only)
     path('profile/', views.UserProfileAPIView.as_view(), name='api-user-profile'),
     
     # Cart (Authenticated users only)
-    path('cart/', views.CartAPIView.as_view(), name='api-cart'),
+    path('cart/', cart_detail, name='api-cart'),
     path('cart/items/', views.CartItemListCreateAPIView.as_view(), name='api-cart-items'),
     path('cart/items/<int:pk>/', views.CartItemUpdateDestroyAPIView.as_view(), name='api-cart-item-detail'),
+    path('cart/items/batch/', views.batch_update_cart, name='api-cart-items-batch'),
     path('cart/clear/', views.clear_cart, name='api-clear-cart'),
     
     # Orders (Authenticated users only)
@@ -29,7 +45,20 @@ urlpatterns = [
     
     # Admin-only endpoints
     path('admin/orders/', views.AdminOrderListAPIView.as_view(), name='api-admin-order-list'),
+    path('admin/orders/status/', views.bulk_update_order_status, name='api-bulk-update-order-status'),
     path('admin/orders/<int:pk>/', views.AdminOrderDetailAPIView.as_view(), name='api-admin-order-detail'),
     path('admin/orders/<int:pk>/status/', views.update_order_status, name='api-update-order-status'),
+    path('admin/purchase-orders/', views.AdminPurchaseOrderListAPIView.as_view(), name='api-admin-purchase-order-list'),
+    path('admin/purchase-orders/<int:pk>/', views.AdminPurchaseOrderDetailAPIView.as_view(), name='api-admin-purchase-order-detail'),
+    path('admin/purchase-orders/<int:pk>/status/', views.update_purchase_order_status, name='api-update-purchase-order-status'),
+    path('admin/catalog/import/', views.import_catalog, name='api-admin-catalog-import'),
+    path('admin/export/orders/', views.export_orders, name='api-admin-export-orders'),
+    path('admin/export/products/', views.export_products, name='api-admin-export-products'),
+    path('admin/export/stock/', views.export_stock, name='api-admin-export-stock'),
     path('admin/dashboard/', views.admin_dashboard_stats, name='api-admin-dashboard'),
+    path('admin/cache/', views.catalog_cache_stats, name='api-admin-catalog-cache'),
+    path('admin/reports/daily/', views.daily_sales_report, name='api-admin-daily-sales'),
+    path('admin/reports/products/', views.product_sales_report, name='api-admin-product-sales'),
+    path('admin/reports/categories/', views.category_sales_report, name='api-admin-category-sales'),
+    path('admin/profile/views/', views.slow_views, name='api-admin-slow-views'),
 ]
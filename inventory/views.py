@@ -1,20 +1,46 @@
 # views.py
+import io
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from rest_framework import generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth.models import User
 from .models import (
-    Category, Supplier, Product, UserProfile, Cart, CartItem, Order, OrderItem
+    Category, Supplier, Product, UserProfile, Cart, CartItem, Order, OrderItem,
+    DailySales, ProductDailySales, CategoryDailySales, PurchaseOrder
 )
 from .serializers import (
     CategorySerializer, SupplierSerializer, ProductSerializer, ProductListSerializer,
     UserSerializer, CartSerializer, CartItemSerializer, OrderSerializer,
-    OrderListSerializer, CreateOrderSerializer
+    OrderListSerializer, CreateOrderSerializer, BulkOrderStatusSerializer,
+    SalesReportSerializer, SlowViewsSerializer, PurchaseOrderSerializer,
+    PurchaseOrderListSerializer, CatalogImportSerializer, ExportSerializer,
+    OrderExportSerializer, ProductExportSerializer, CartBatchSerializer
+)
+from .cache import CatalogCacheMixin
+from .conditional import ConditionalGetMixin
+from .pagination import KeysetPagination
+from .orders import (
+    OUTCOME_INVALID, OUTCOME_NOT_FOUND, OUTCOME_UPDATED, bulk_transition
+)
+from .search import search_products
+from inventory import (
+    cache, carts, exports, importer, instrumentation, metrics, replenishment, rollups, stats,
+    stock, tasks
 )
-from inventory import models
 
 # Authentication required for all views
 class IsAuthenticated(permissions.BasePermission):
@@ -30,10 +56,32 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         # Write permissions only to the owner
         return obj.user == request.user
 
+class OptimizedQuerysetMixin:
+    """Load the relations declared by the serializer class up front"""
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+class CatalogConditionalMixin(ConditionalGetMixin):
+    """Validate catalog responses against the catalog cache version (no SQL)"""
+    def get_conditional_state(self):
+        return {'catalog': cache.current_version()}
+
 # Product Views (Public - no auth required for reading)
-class ProductListAPIView(generics.ListAPIView):
-    queryset = Product.objects.filter(is_active=True).select_related('category', 'inventory')
+class ProductListAPIView(CatalogConditionalMixin, CatalogCacheMixin, OptimizedQuerysetMixin, generics.ListAPIView):
+    queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductListSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('name', 'id')
+
+    def get_keyset_ordering(self):
+        # Search results are paginated in relevance order
+        if self.request.query_params.get('search'):
+            return ('-search_rank', 'name', 'id')
+        return self.keyset_ordering
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -41,18 +89,18 @@ class ProductListAPIView(generics.ListAPIView):
         category = self.request.query_params.get('category', None)
         
         if search:
-            queryset = queryset.filter(name__icontains=search)
+            queryset = search_products(queryset, search)
         if category:
             queryset = queryset.filter(category_id=category)
             
         return queryset
 
-class ProductDetailAPIView(generics.RetrieveAPIView):
-    queryset = Product.objects.filter(is_active=True).select_related('category', 'inventory')
+class ProductDetailAPIView(CatalogConditionalMixin, CatalogCacheMixin, OptimizedQuerysetMixin, generics.RetrieveAPIView):
+    queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
 
 # Category Views (Public)
-class CategoryListAPIView(generics.ListAPIView):
+class CategoryListAPIView(CatalogConditionalMixin, CatalogCacheMixin, generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
@@ -65,43 +113,84 @@ class UserProfileAPIView(generics.RetrieveUpdateAPIView):
         return self.request.user
 
 # Cart Views
-class CartAPIView(generics.RetrieveAPIView):
+class CartAPIView(ConditionalGetMixin, generics.RetrieveAPIView):
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
+    conditional_aggregates = {
+        'cart': Max('updated_at'),
+        'item_count': Count('items'),
+        'item_updated': Max('items__updated_at'),
+        'products_updated': Max('items__product__updated_at'),
+        'stock_updated': Max('items__product__inventory__updated_at'),
+    }
+
+    def get_conditional_queryset(self):
+        return Cart.objects.filter(user=self.request.user)
 
     def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
+        # Totals are aggregated in SQL and the items arrive with their
+        # products, categories and inventories in a single prefetch
+        queryset = CartSerializer.setup_eager_loading(Cart.objects.with_totals())
+        cart, created = queryset.get_or_create(user=self.request.user)
+        if created:
+            # A cart just created carries neither the totals nor the prefetched items
+            cart = queryset.get(pk=cart.pk)
         return cart
 
-class CartItemListCreateAPIView(generics.ListCreateAPIView):
+class CartItemListCreateAPIView(OptimizedQuerysetMixin, generics.ListCreateAPIView):
+    queryset = CartItem.objects.all()
     serializer_class = CartItemSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
-        return CartItem.objects.filter(cart=cart).select_related('product')
+        return super().get_queryset().filter(cart__user=self.request.user)
 
     def perform_create(self, serializer):
         cart, created = Cart.objects.get_or_create(user=self.request.user)
-        product = get_object_or_404(Product, id=serializer.validated_data['product_id'])
+        # Validated, with its inventory, by the serializer
+        product = serializer.validated_data['product']
         
         # Check if item already exists in cart
-        existing_item = CartItem.objects.filter(cart=cart, product=product).first()
+        existing_item = None if created else CartItem.objects.filter(cart=cart, product=product).first()
         if existing_item:
             # Update quantity instead of creating new item
             existing_item.quantity += serializer.validated_data['quantity']
-            existing_item.save()
+            existing_item.product = product
+            existing_item.save(update_fields=['quantity', 'updated_at'])
+            # Respond with the merged line
+            serializer.instance = existing_item
+            metrics.CART_ITEMS_ADDED.inc(channel='api', outcome='merged')
             return existing_item
         else:
-            serializer.save(cart=cart, product=product)
+            serializer.save(cart=cart)
+            metrics.CART_ITEMS_ADDED.inc(channel='api', outcome='created')
 
-class CartItemUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class CartItemUpdateDestroyAPIView(OptimizedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = CartItem.objects.all()
     serializer_class = CartItemSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         cart = get_object_or_404(Cart, user=self.request.user)
-        return CartItem.objects.filter(cart=cart)
+        return super().get_queryset().filter(cart=cart)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_update_cart(request):
+    """Apply many add/set/remove operations to the cart, all or nothing"""
+    serializer = CartBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    with transaction.atomic():
+        # Locked, so concurrent batches build on each other's result
+        cart, created = Cart.objects.select_for_update().get_or_create(user=request.user)
+        try:
+            carts.apply_batch(cart, serializer.validated_data['operations'])
+        except carts.CartBatchError as exc:
+            return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    cart = CartSerializer.setup_eager_loading(Cart.objects.with_totals()).get(pk=cart.pk)
+    return Response(CartSerializer(cart).data)
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
@@ -112,11 +201,19 @@ def clear_cart(request):
     return Response({'message': 'Cart cleared successfully'}, status=status.HTTP_200_OK)
 
 # Order Views
-class OrderListCreateAPIView(generics.ListCreateAPIView):
+class OrderListCreateAPIView(ConditionalGetMixin, OptimizedQuerysetMixin, generics.ListCreateAPIView):
+    queryset = Order.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-order_date', '-id')
+    conditional_aggregates = {'orders': Count('id'), 'updated': Max('updated_at')}
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related('items__product')
+        return super().get_queryset().filter(user=self.request.user)
+
+    def get_conditional_queryset(self):
+        # Validators only need the user's orders, not the per-order totals
+        return Order.objects.filter(user=self.request.user)
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -129,21 +226,42 @@ class OrderListCreateAPIView(generics.ListCreateAPIView):
         serializer.is_valid(raise_exception=True)
         
         # Get user's cart
-        try:
-            cart = Cart.objects.get(user=request.user)
-            if not cart.items.exists():
-                return Response(
-                    {'error': 'Cart is empty'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except Cart.DoesNotExist:
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart is None:
+            metrics.record_checkout('api', metrics.CHECKOUT_EMPTY_CART)
             return Response(
                 {'error': 'Cart not found'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Load every cart line together with its product in a single query
+        cart_items = list(cart.items.select_related('product'))
+        if not cart_items:
+            metrics.record_checkout('api', metrics.CHECKOUT_EMPTY_CART)
+            return Response(
+                {'error': 'Cart is empty'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Reserve stock up front so nothing is written when an item is short
+        try:
+            stock.reserve((item.product_id, item.quantity) for item in cart_items)
+        except stock.InsufficientStock as exc:
+            metrics.record_checkout('api', metrics.CHECKOUT_INSUFFICIENT_STOCK)
+            return Response(
+                {
+                    'error': 'Insufficient stock',
+                    'items': [result.as_dict() for result in exc.results if not result.ok],
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+        except stock.StockConflict as exc:
+            transaction.set_rollback(True)
+            metrics.record_checkout('api', metrics.CHECKOUT_CONFLICT)
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+
         # Calculate totals
-        subtotal = cart.total_price
+        subtotal = sum(item.quantity * item.product.price for item in cart_items)
         shipping_cost = serializer.validated_data.get('shipping_cost', 0)
         tax_amount = serializer.validated_data.get('tax_amount', 0)
         total_amount = subtotal + shipping_cost + tax_amount
@@ -161,38 +279,55 @@ class OrderListCreateAPIView(generics.ListCreateAPIView):
         )
 
         # Create order items from cart items
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
                 product=cart_item.product,
                 quantity=cart_item.quantity,
                 unit_price=cart_item.product.price
             )
-            
-            # Update inventory (reserve items)
-            inventory = cart_item.product.inventory
-            inventory.reserved_quantity += cart_item.quantity
-            inventory.save()
+            for cart_item in cart_items
+        ])
+
+        # Rollups, confirmation email and stock alerts run after the response
+        tasks.after_checkout(order, [item.product_id for item in cart_items])
+        # Counted once the order is committed, not when the commit may still fail
+        placed = len(cart_items)
+        transaction.on_commit(
+            lambda: metrics.record_checkout('api', metrics.CHECKOUT_PLACED, placed)
+        )
 
         # Clear cart after successful order creation
         cart.items.all().delete()
 
-        # Return created order
+        # Return created order, loading its relations in a fixed number of queries
+        order = OrderSerializer.setup_eager_loading(Order.objects.all()).get(pk=order.pk)
         order_serializer = OrderSerializer(order)
         return Response(order_serializer.data, status=status.HTTP_201_CREATED)
 
-class OrderDetailAPIView(generics.RetrieveAPIView):
+class OrderDetailAPIView(ConditionalGetMixin, OptimizedQuerysetMixin, generics.RetrieveAPIView):
+    queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    conditional_aggregates = {
+        'updated': Max('updated_at'),
+        'products_updated': Max('items__product__updated_at'),
+        'stock_updated': Max('items__product__inventory__updated_at'),
+    }
+
+    def get_conditional_queryset(self):
+        return Order.objects.filter(user=self.request.user, pk=self.kwargs['pk'])
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related('items__product')
+        return super().get_queryset().filter(user=self.request.user)
 
 # Admin-only views for order management
-class AdminOrderListAPIView(generics.ListAPIView):
-    queryset = Order.objects.all().select_related('user').prefetch_related('items__product')
+class AdminOrderListAPIView(OptimizedQuerysetMixin, generics.ListAPIView):
+    queryset = Order.objects.all()
     serializer_class = OrderListSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-order_date', '-id')
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -206,16 +341,38 @@ class AdminOrderListAPIView(generics.ListAPIView):
             
         return queryset
 
-class AdminOrderDetailAPIView(generics.RetrieveUpdateAPIView):
-    queryset = Order.objects.all().prefetch_related('items__product')
+class AdminOrderDetailAPIView(OptimizedQuerysetMixin, generics.RetrieveUpdateAPIView):
+    queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        # Status changes settle stock, so they take the same path as the
+        # status endpoints
+        new_status = serializer.validated_data.pop('status', None)
+        order = serializer.save()
+        if new_status is not None:
+            error = transition_order(order.pk, new_status)
+            if error:
+                raise ValidationError({'status': error})
+            serializer.instance = OrderSerializer.setup_eager_loading(Order.objects.all()).get(pk=order.pk)
+
+def transition_order(order_id, new_status):
+    """Move one order with ``bulk_transition``; returns an error message if the move is not allowed"""
+    [result] = bulk_transition([order_id], new_status)
+    if result['outcome'] == OUTCOME_NOT_FOUND:
+        raise Http404('No Order matches the given query.')
+    if result['outcome'] == OUTCOME_INVALID:
+        statuses = dict(Order.STATUS_CHOICES)
+        return f"Cannot move an order from {statuses[result['previous_status']]} to {statuses[new_status]}."
+    return None
+
 @api_view(['PATCH'])
 @permission_classes([permissions.IsAdminUser])
+@transaction.atomic
 def update_order_status(request, pk):
     """Update order status - Admin only"""
-    order = get_object_or_404(Order, pk=pk)
     new_status = request.data.get('status')
     
     if new_status not in dict(Order.STATUS_CHOICES):
@@ -224,69 +381,217 @@ def update_order_status(request, pk):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    old_status = order.status
-    order.status = new_status
-    
-    # Handle status-specific logic
-    if new_status == Order.STATUS_SHIPPED and old_status != Order.STATUS_SHIPPED:
-        from django.utils import timezone
-        order.shipped_date = timezone.now()
-        
-    elif new_status == Order.STATUS_DELIVERED and old_status != Order.STATUS_DELIVERED:
-        from django.utils import timezone
-        order.delivered_date = timezone.now()
-        
-        # Move reserved inventory to sold (reduce actual quantity)
-        for item in order.items.all():
-            inventory = item.product.inventory
-            inventory.quantity -= item.quantity
-            inventory.reserved_quantity -= item.quantity
-            inventory.save()
-            
-    elif new_status == Order.STATUS_CANCELLED and old_status != Order.STATUS_CANCELLED:
-        # Release reserved inventory
-        for item in order.items.all():
-            inventory = item.product.inventory
-            inventory.reserved_quantity -= item.quantity
-            inventory.save()
-    
-    order.save()
+    # Checks the move and settles the inventory as the bulk endpoint does
+    error = transition_order(pk, new_status)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
     
+    order = OrderSerializer.setup_eager_loading(Order.objects.all()).get(pk=pk)
     serializer = OrderSerializer(order)
     return Response(serializer.data)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def bulk_update_order_status(request):
+    """Move many orders to one status in a single transaction - Admin only"""
+    serializer = BulkOrderStatusSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    new_status = serializer.validated_data['status']
+
+    results = bulk_transition(serializer.validated_data['order_ids'], new_status)
+
+    return Response({
+        'status': new_status,
+        'updated': sum(1 for result in results if result['outcome'] == OUTCOME_UPDATED),
+        'results': results,
+    })
+
+class AdminPurchaseOrderListAPIView(OptimizedQuerysetMixin, generics.ListAPIView):
+    queryset = PurchaseOrder.objects.all()
+    serializer_class = PurchaseOrderListSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        status_filter = self.request.query_params.get('status', None)
+        supplier_id = self.request.query_params.get('supplier', None)
+
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        if supplier_id:
+            queryset = queryset.filter(supplier_id=supplier_id)
+
+        return queryset
+
+class AdminPurchaseOrderDetailAPIView(OptimizedQuerysetMixin, generics.RetrieveAPIView):
+    queryset = PurchaseOrder.objects.all()
+    serializer_class = PurchaseOrderSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+@api_view(['PATCH'])
+@permission_classes([permissions.IsAdminUser])
+def update_purchase_order_status(request, pk):
+    """Receive or cancel an open purchase order - Admin only"""
+    actions = {
+        PurchaseOrder.STATUS_RECEIVED: replenishment.receive,
+        PurchaseOrder.STATUS_CANCELLED: replenishment.cancel,
+    }
+    action = actions.get(request.data.get('status'))
+    if action is None:
+        return Response(
+            {'error': 'Invalid status'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        purchase_order = action(pk)
+    except PurchaseOrder.DoesNotExist:
+        return Response({'error': 'Purchase order not found'}, status=status.HTTP_404_NOT_FOUND)
+    except replenishment.PurchaseOrderClosed as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+
+    purchase_order = PurchaseOrderSerializer.setup_eager_loading(
+        PurchaseOrder.objects.all()
+    ).get(pk=purchase_order.pk)
+    return Response(PurchaseOrderSerializer(purchase_order).data)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+@parser_classes([MultiPartParser])
+def import_catalog(request):
+    """Upsert products, supplier prices and stock from a CSV or JSONL upload - Admin only"""
+    params = CatalogImportSerializer(data=request.data)
+    params.is_valid(raise_exception=True)
+    upload = params.validated_data['file']
+    try:
+        # Large uploads are spooled to disk, so rows are read from there
+        summary = importer.import_catalog(
+            io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''),
+            params.validated_data['format'],
+            default_supplier=params.validated_data.get('supplier'),
+        )
+    except importer.CatalogImportError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except UnicodeDecodeError:
+        return Response({'error': 'The file is not UTF-8 text.'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(summary)
+
+def export_response(request, name, params_class):
+    """Validate the export query parameters and stream export ``name``"""
+    params = params_class(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    filters = dict(params.validated_data)
+    fmt = filters.pop('output')
+    # A synchronous iterator would be read into memory whole under ASGI
+    stream = exports.astream if isinstance(request._request, ASGIRequest) else exports.stream
+    response = StreamingHttpResponse(
+        stream(name, fmt, **filters), content_type=exports.CONTENT_TYPES[fmt]
+    )
+    filename = f'{name}-{timezone.localdate():%Y%m%d}.{fmt}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def export_orders(request):
+    """Stream orders and their line items as CSV or JSONL - Admin only"""
+    return export_response(request, 'orders', OrderExportSerializer)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def export_products(request):
+    """Stream products with their stock and supplier prices as CSV or JSONL - Admin only"""
+    return export_response(request, 'products', ProductExportSerializer)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def export_stock(request):
+    """Stream stock levels as CSV or JSONL - Admin only"""
+    return export_response(request, 'stock', ExportSerializer)
+
 # Statistics and Dashboard Views
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_order_stats(request):
     """Get user's order statistics"""
-    user = request.user
-    orders = Order.objects.filter(user=user)
-    
-    stats = {
-        'total_orders': orders.count(),
-        'pending_orders': orders.filter(status=Order.STATUS_PENDING).count(),
-        'completed_orders': orders.filter(status=Order.STATUS_DELIVERED).count(),
-        'total_spent': sum(order.total_amount for order in orders),
-    }
-    
-    return Response(stats)
+    totals = Order.objects.filter(user=request.user).aggregate(
+        total_orders=Count('id'),
+        pending_orders=Count('id', filter=Q(status=Order.STATUS_PENDING)),
+        completed_orders=Count('id', filter=Q(status=Order.STATUS_DELIVERED)),
+        total_spent=Coalesce(Sum('total_amount'), Value(Decimal('0.00'))),
+    )
+    return Response(totals)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAdminUser])
 def admin_dashboard_stats(request):
-    """Get admin dashboard statistics"""
-    from django.db.models import Sum, Count
-    
-    stats = {
-        'total_orders': Order.objects.count(),
-        'pending_orders': Order.objects.filter(status=Order.STATUS_PENDING).count(),
-        'total_revenue': Order.objects.aggregate(Sum('total_amount'))['total_amount__sum'] or 0,
-        'total_users': User.objects.count(),
-        'total_products': Product.objects.filter(is_active=True).count(),
-        'low_stock_products': Product.objects.filter(
-            inventory__quantity__lte=models.F('inventory__reorder_level')
-        ).count(),
-    }
-    
-    return Response(stats)
\ No newline at end of file
+    """Get admin dashboard statistics from the maintained counters"""
+    return Response(stats.dashboard())
+
+def sales_report(request, model, *fields, order_by=None, **expressions):
+    """Validate the report query parameters and sum a rollup table"""
+    params = SalesReportSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    rows = rollups.report(
+        model, *fields,
+        start=params.validated_data.get('start'),
+        end=params.validated_data.get('end'),
+        order_by=order_by,
+        limit=params.validated_data['limit'] if order_by else None,
+        **expressions
+    )
+    return Response({'results': rows})
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def daily_sales_report(request):
+    """Get sales per day from the rollup tables - Admin only"""
+    return sales_report(request, DailySales, 'date')
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def product_sales_report(request):
+    """Get best selling products from the rollup tables - Admin only"""
+    return sales_report(
+        request, ProductDailySales, 'product_id',
+        order_by=['-revenue', 'product_id'],
+        name=F('product__name'), sku=F('product__sku'),
+    )
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def category_sales_report(request):
+    """Get sales per category from the rollup tables - Admin only"""
+    return sales_report(
+        request, CategoryDailySales, 'category_id',
+        order_by=['-revenue', 'category_id'],
+        name=F('category__name'),
+    )
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def catalog_cache_stats(request):
+    """Get catalog cache hit/miss counters - Admin only"""
+    return Response(cache.stats())
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([permissions.IsAdminUser])
+def slow_views(request):
+    """Get the views costing the most in this process, or reset the figures - Admin only"""
+    if request.method == 'DELETE':
+        instrumentation.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    params = SlowViewsSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    return Response({'results': instrumentation.top_views(**params.validated_data)})
+
+def prometheus_metrics(request):
+    """Expose the metrics registry to Prometheus, behind METRICS_TOKEN when set"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(metrics.exposition(), content_type=metrics.CONTENT_TYPE)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_system.settings')
+# Serve the catalog and cart reads with the native async views
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
 
 application = get_asgi_application()
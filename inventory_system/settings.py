@@ -60,6 +60,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "inventory.instrumentation.InstrumentationMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -128,7 +129,98 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Take the write lock when a transaction starts so concurrent
+        # checkouts queue up instead of failing with "database is locked"
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        # On disk rather than in shared memory, so concurrent test threads
+        # wait for the write lock like the server's workers do
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+    }
+}
+
+
+# Caching
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Set REDIS_URL to share cached catalog responses between all workers.
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
+
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TIMEOUT = 300
+
+
+# Route the catalog and cart reads to the async views (inventory/async_views.py);
+# the ASGI entry point turns this on.
+
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS") == "1"
+
+
+# Request instrumentation
+# Queries slower than this are logged on "inventory.slow_queries"; a query
+# shape repeated this many times in one request is reported as an N+1.
+
+INSTRUMENTATION_SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", 100))
+INSTRUMENTATION_DUPLICATE_QUERIES = 3
+
+# Metrics exposed on /metrics. Under gunicorn, point METRICS_DIR at a
+# directory shared by the workers (emptied on deploy) so a scrape sees
+# all of them; each worker writes its file at most every
+# METRICS_FLUSH_INTERVAL seconds. Set METRICS_TOKEN to require
+# "Authorization: Bearer <token>".
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Background jobs (inventory/jobs.py), run by "manage.py run_jobs". Emails
+# go to the console unless EMAIL_BACKEND names a real backend.
+
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", 4))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", 1))
+
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "orders@localhost")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "inventory.requests": {
+            "handlers": ["console"],
+            "level": os.getenv("REQUEST_LOG_LEVEL", "WARNING"),
+            "propagate": False,
+        },
+        "inventory.slow_queries": {
+            "handlers": ["console"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+        "inventory.jobs": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
 }
 
 
@@ -30,5 +30,6 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("api-auth/", include("rest_framework.urls")),
     path("api/v1.1.1/", include("inventory.urls")),
+    path("metrics", views.prometheus_metrics, name="metrics"),
     # path('', views.homepage, name='homepage'),
 ]